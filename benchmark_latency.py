@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de latencia por requisicao dos caminhos de previsao
+
+Mede a latencia (p50, p95, p99 e p99.9) de previsoes de uma amostra e de
+lotes pequenos em cada caminho de previsao disponivel:
+
+    classify_flower   funcao da interface interativa (saida descartada)
+    with_confidence   predict_with_confidence (classe, top-k e abstencao)
+    sklearn_predict   modelo.predict
+    sklearn_proba     modelo.predict_proba
+    tree_engine       arvore compilada (tree_engine.predict_proba_batch)
+    grid              tabela de consulta em grade (grid_lookup.predict_proba_grid)
+    exported          modulo sem dependencias gerado por export_predictor
+
+Cada chamada e cronometrada individualmente, depois de um aquecimento e com
+o coletor de lixo desligado. Opcionalmente o processo e fixado em um nucleo.
+Os resultados podem ser gravados como linha de base e as execucoes seguintes
+terminam com codigo 1 se algum percentil piorar alem do limite, para servir
+de porta de entrada em deploys.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+from benchmark_scale import environment_info
+
+DEFAULT_BASELINE_FILE = 'latency_baseline.json'
+DEFAULT_RESULTS_FILE = 'latency_results.json'
+DEFAULT_BATCH_SIZES = [1, 8, 64]
+DEFAULT_ITERATIONS = 2000
+DEFAULT_WARMUP = 200
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_GATED = ['p50', 'p95', 'p99']
+# Diferencas absolutas menores que isso nunca contam como regressao (ruido do relogio)
+DEFAULT_MIN_DELTA_US = 5.0
+RESULTS_FORMAT_VERSION = 1
+
+PERCENTILES = {'p50': 50, 'p95': 95, 'p99': 99, 'p99.9': 99.9}
+PREDICTION_PATHS = ('classify_flower', 'with_confidence', 'cached', 'sklearn_predict', 'sklearn_proba',
+                    'tree_engine', 'grid', 'exported')
+# Caminhos que so aceitam uma amostra por chamada
+_SINGLE_SAMPLE_PATHS = ('classify_flower',)
+
+
+def pin_to_cpu(cpu):
+    """
+    Fixa o processo em um nucleo (Linux); retorna False se nao for possivel
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(0, {cpu})
+        return True
+    except OSError:
+        return False
+
+
+def build_prediction_paths(modelo, species_map, feature_names, workdir):
+    """
+    Monta uma funcao de previsao por caminho, todas recebendo um lote (array 2D)
+
+    Returns:
+        Dicionario {nome_do_caminho: funcao(lote)}
+    """
+    import export_predictor
+    import grid_lookup
+    import tree_engine
+    from classifier_interface import class_display_names, classify_flower, predict_with_confidence
+    from prediction_cache import PredictionCache
+
+    class_names = class_display_names(modelo, species_map)
+    compiled = tree_engine.compile_model(modelo)
+    grid = grid_lookup.compile_grid(modelo)
+    predictor_file = os.path.join(workdir, 'latency_predictor.py')
+    export_predictor.export_predictor(modelo, species_map, feature_names, predictor_file)
+    predictor = export_predictor.load_predictor(predictor_file)
+    # As amostras saem do conjunto de teste, entao depois do aquecimento todas estao no cache
+    cache = PredictionCache()
+
+    def run_classify_flower(batch):
+        with contextlib.redirect_stdout(None):
+            classify_flower(modelo, batch, species_map, class_names)
+
+    return {
+        'classify_flower': run_classify_flower,
+        'with_confidence': lambda batch: predict_with_confidence(modelo, batch, class_names),
+        'cached': lambda batch: predict_with_confidence(modelo, batch, class_names, cache=cache),
+        'sklearn_predict': modelo.predict,
+        'sklearn_proba': modelo.predict_proba,
+        'tree_engine': lambda batch: tree_engine.predict_proba_batch(compiled, batch),
+        'grid': lambda batch: grid_lookup.predict_proba_grid(grid, batch),
+        'exported': lambda batch: [predictor.predict_proba(row) for row in batch.tolist()],
+    }
+
+
+def measure_latency(func, batches, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP):
+    """
+    Cronometra cada chamada de `func`, percorrendo os lotes em ciclo
+
+    Args:
+        func: Funcao de previsao (recebe um lote)
+        batches: Lista de lotes de entrada
+        iterations: Chamadas cronometradas
+        warmup: Chamadas descartadas antes da medida
+
+    Returns:
+        Dicionario com percentis, media e maximo em microssegundos
+    """
+    n_batches = len(batches)
+    for i in range(warmup):
+        func(batches[i % n_batches])
+
+    timings = np.empty(iterations, dtype=np.int64)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(iterations):
+            batch = batches[i % n_batches]
+            start = time.perf_counter_ns()
+            func(batch)
+            timings[i] = time.perf_counter_ns() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    timings_us = timings / 1000
+    summary = {name: float(np.percentile(timings_us, q)) for name, q in PERCENTILES.items()}
+    summary.update(mean=float(timings_us.mean()), max=float(timings_us.max()), iterations=iterations)
+    return summary
+
+
+def run_latency_benchmark(paths=PREDICTION_PATHS, batch_sizes=DEFAULT_BATCH_SIZES,
+                          iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, cpu=None, seed=42):
+    """
+    Mede a latencia de cada caminho de previsao para cada tamanho de lote
+
+    Args:
+        paths: Caminhos de previsao a medir
+        batch_sizes: Tamanhos de lote (1 = uma amostra por chamada)
+        iterations: Chamadas cronometradas por caminho e tamanho
+        warmup: Chamadas de aquecimento por caminho e tamanho
+        cpu: Nucleo em que o processo e fixado (None nao fixa)
+        seed: Semente da escolha das amostras
+
+    Returns:
+        Dicionario de resultados (serializavel em JSON)
+    """
+    from classifier_interface import load_classifier
+    from columnar_store import load_prepared
+
+    pinned = pin_to_cpu(cpu) if cpu is not None else False
+    if cpu is not None and not pinned:
+        print(f"AVISO: nao foi possivel fixar o processo no nucleo {cpu}.")
+
+    modelo, species_map = load_classifier()
+    if modelo is None:
+        raise FileNotFoundError("Modelo treinado nao encontrado. Execute model_trainer.py primeiro.")
+    data, _ = load_prepared()
+    X_test = data['X_test']
+    samples = X_test.to_numpy(dtype=np.float64)
+
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'config': {'model': type(modelo).__name__, 'iterations': iterations, 'warmup': warmup,
+                   'cpu': cpu if pinned else None},
+        'latency_us': {},
+    }
+
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        functions = build_prediction_paths(modelo, species_map, list(X_test.columns), workdir)
+        for path in paths:
+            results['latency_us'][path] = {}
+            for batch_size in batch_sizes:
+                if batch_size > 1 and path in _SINGLE_SAMPLE_PATHS:
+                    continue
+                # Lotes fixos e contiguos, sorteados do teste, reaproveitados em ciclo
+                batches = [np.ascontiguousarray(samples[rng.integers(0, len(samples), batch_size)])
+                           for _ in range(64)]
+                with warnings.catch_warnings():
+                    # Lotes como arrays, como na interface: o modelo treinado com nomes de
+                    # features avisa a cada chamada, e escrever o aviso entraria na medida
+                    warnings.simplefilter('ignore', UserWarning)
+                    summary = measure_latency(functions[path], batches, iterations, warmup)
+                results['latency_us'][path][str(batch_size)] = summary
+                print_summary(path, batch_size, summary)
+
+    return results
+
+
+def print_summary(path, batch_size, summary):
+    print(f"  {path:<16} lote {batch_size:>4}: " +
+          '  '.join(f"{name} {summary[name]:>9.1f}us" for name in PERCENTILES))
+
+
+def save_results(results, filename):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_filename, filename)
+
+
+def load_results(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    if results.get('format_version') != RESULTS_FORMAT_VERSION:
+        raise ValueError(f"Formato de resultados nao suportado em '{filename}'.")
+    return results
+
+
+def compare_latency(baseline, current, threshold=DEFAULT_THRESHOLD, gated=DEFAULT_GATED,
+                    min_delta_us=DEFAULT_MIN_DELTA_US):
+    """
+    Compara os percentis de latencia de duas execucoes
+
+    Args:
+        baseline: Resultados de referencia
+        current: Resultados novos
+        threshold: Aumento relativo tolerado (0.25 = 25%)
+        gated: Percentis que contam como regressao (os demais sao so exibidos)
+        min_delta_us: Aumento absoluto minimo para contar como regressao
+
+    Returns:
+        Lista de comparacoes (uma por caminho, lote e percentil)
+    """
+    comparisons = []
+    for path, by_batch in current['latency_us'].items():
+        for batch_size, summary in by_batch.items():
+            base = baseline['latency_us'].get(path, {}).get(batch_size)
+            if base is None:
+                continue
+            for name in PERCENTILES:
+                old, new = base[name], summary[name]
+                change = (new - old) / old if old > 0 else 0.0
+                comparisons.append({
+                    'path': path,
+                    'batch_size': int(batch_size),
+                    'percentile': name,
+                    'baseline_us': old,
+                    'current_us': new,
+                    'change': change,
+                    'regression': name in gated and change > threshold and new - old > min_delta_us,
+                })
+    return comparisons
+
+
+def print_comparison(comparisons, baseline, current, threshold):
+    """
+    Exibe a comparacao e retorna o numero de regressoes
+    """
+    if baseline['environment'] != current['environment'] or baseline['config'] != current['config']:
+        print("AVISO: ambiente ou configuracao diferentes da linha de base.")
+
+    print(f"\n{'Caminho':<16} {'Lote':>5} {'Perc.':<6} {'Base (us)':>10} {'Atual (us)':>11} {'Variacao':>9}")
+    for c in comparisons:
+        flag = '  REGRESSAO' if c['regression'] else ''
+        print(f"{c['path']:<16} {c['batch_size']:>5} {c['percentile']:<6} {c['baseline_us']:>10.1f} "
+              f"{c['current_us']:>11.1f} {c['change']:>+8.1%}{flag}")
+
+    n_regressions = sum(c['regression'] for c in comparisons)
+    if n_regressions:
+        print(f"\n{n_regressions} regressao(oes) de latencia acima de {threshold:.0%}.")
+    else:
+        print(f"\nNenhuma regressao de latencia acima de {threshold:.0%}.")
+    return n_regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark de latencia por requisicao dos caminhos de previsao.')
+    parser.add_argument('--paths', nargs='+', choices=PREDICTION_PATHS, default=list(PREDICTION_PATHS),
+                        help='Caminhos de previsao a medir')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES,
+                        help='Tamanhos de lote (1 = uma amostra por chamada)')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS,
+                        help='Chamadas cronometradas por caminho e tamanho de lote')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP,
+                        help='Chamadas de aquecimento (descartadas)')
+    parser.add_argument('--cpu', type=int, default=None,
+                        help='Fixa o processo neste nucleo durante a medida')
+    parser.add_argument('--output', default=DEFAULT_RESULTS_FILE,
+                        help=f'Arquivo JSON de resultados (padrao: {DEFAULT_RESULTS_FILE})')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_FILE,
+                        help=f'Linha de base para comparar (padrao: {DEFAULT_BASELINE_FILE})')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Grava esta execucao como nova linha de base, sem comparar')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Aumento relativo tolerado antes de apontar regressao (0.25 = 25%%)')
+    parser.add_argument('--gate', nargs='+', choices=list(PERCENTILES), default=DEFAULT_GATED,
+                        help='Percentis que reprovam a execucao quando pioram')
+    parser.add_argument('--min-delta-us', type=float, default=DEFAULT_MIN_DELTA_US,
+                        help='Aumento absoluto minimo (us) para contar como regressao')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Returns:
+        Codigo de saida (1 se houver regressao de latencia)
+    """
+    args = parse_args(argv)
+
+    print("=" * 70)
+    print("BENCHMARK DE LATENCIA DA PREVISAO")
+    print("=" * 70 + "\n")
+
+    current = run_latency_benchmark(args.paths, args.batch_sizes, args.iterations, args.warmup, args.cpu)
+    save_results(current, args.output)
+    print(f"\nResultados salvos em '{args.output}'.")
+
+    if args.save_baseline:
+        save_results(current, args.baseline)
+        print(f"Linha de base gravada em '{args.baseline}'.")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Linha de base '{args.baseline}' nao encontrada; use --save-baseline para cria-la.")
+        return 0
+
+    baseline = load_results(args.baseline)
+    comparisons = compare_latency(baseline, current, args.threshold, args.gate, args.min_delta_us)
+    return 1 if print_comparison(comparisons, baseline, current, args.threshold) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de escala do pipeline com dados sinteticos parecidos com o Iris
+
+Gera CSVs com o mesmo formato do iris.csv (de 1e3 a 1e8 linhas, com mais
+features e mais classes se pedido) e mede cada fase do pipeline com as
+funcoes reais dos modulos: load_iris_from_csv, encode_species, split_data,
+save_data (fonte + indices), open_split, train_decision_tree, evaluate_model e
+classify_flower. Para cada fase sao registrados tempo, vazao (linhas/s) e pico
+de memoria residente (RSS).
+
+Cada tamanho roda em um processo novo, para que a memoria de um tamanho nao
+contamine as medidas do seguinte. Os resultados sao gravados em JSON e podem
+ser comparados com uma execucao anterior, apontando regressoes acima de um
+limite percentual.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import peak_rss_mb, reset_peak_rss
+
+DEFAULT_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_RESULTS_FILE = 'benchmark_results.json'
+DEFAULT_THRESHOLD = 0.20
+# Diferencas absolutas menores que isso nunca contam como regressao (ruido de medida)
+DEFAULT_MIN_SECONDS = 0.01
+DEFAULT_MIN_RSS_MB = 5.0
+DEFAULT_PREDICT_CALLS = 200
+RESULTS_FORMAT_VERSION = 1
+
+COMPARED_METRICS = (('seconds', DEFAULT_MIN_SECONDS), ('peak_rss_mb', DEFAULT_MIN_RSS_MB))
+
+# Media e desvio padrao das 4 medidas de cada especie no iris.csv
+IRIS_FEATURES = ['sepal_length_cm', 'sepal_width_cm', 'petal_length_cm', 'petal_width_cm']
+IRIS_CLASSES = {
+    'Iris-setosa': ([5.006, 3.428, 1.462, 0.246], [0.352, 0.379, 0.174, 0.105]),
+    'Iris-versicolor': ([5.936, 2.770, 4.260, 1.326], [0.516, 0.314, 0.470, 0.198]),
+    'Iris-virginica': ([6.588, 2.974, 5.552, 2.026], [0.636, 0.322, 0.552, 0.275]),
+}
+_GENERATE_CHUNK_ROWS = 1_000_000
+
+
+def synthetic_schema(n_features=4, n_classes=3, seed=42):
+    """
+    Define as colunas e a distribuicao de cada classe dos dados sinteticos
+
+    As 3 primeiras classes e as 4 primeiras features usam as estatisticas do
+    Iris; classes extras sao misturas aleatorias das especies reais e features
+    extras sao combinacoes das medidas reais com ruido.
+
+    Returns:
+        (nomes das features, nomes das classes, medias (classes x features),
+         desvios (classes x features))
+    """
+    if n_features < 1 or n_classes < 2:
+        raise ValueError("Sao necessarias pelo menos 1 feature e 2 classes.")
+
+    rng = np.random.default_rng(seed)
+    base_names = list(IRIS_CLASSES)
+    base_means = np.array([IRIS_CLASSES[name][0] for name in base_names])
+    base_stds = np.array([IRIS_CLASSES[name][1] for name in base_names])
+
+    class_names = base_names[:n_classes]
+    means, stds = list(base_means[:n_classes]), list(base_stds[:n_classes])
+    for k in range(len(class_names), n_classes):
+        weights = rng.dirichlet(np.ones(len(base_names)))
+        means.append(weights @ base_means + rng.normal(0, 0.3, 4))
+        stds.append(weights @ base_stds)
+        class_names.append(f'Iris-sintetica{k + 1}')
+    means, stds = np.array(means), np.array(stds)
+
+    feature_names = IRIS_FEATURES[:n_features]
+    if n_features > 4:
+        mixing = rng.normal(0, 0.5, (4, n_features - 4))
+        means = np.hstack([means, means @ mixing])
+        stds = np.hstack([stds, np.sqrt((stds ** 2) @ mixing ** 2) + 0.1])
+        feature_names = feature_names + [f'feature_{j + 1}_cm' for j in range(4, n_features)]
+    else:
+        means, stds = means[:, :n_features], stds[:, :n_features]
+
+    return feature_names, class_names, means, stds
+
+
+def generate_iris_csv(filename, n_rows, n_features=4, n_classes=3, seed=42):
+    """
+    Grava um CSV sintetico com o formato do iris.csv, em blocos
+
+    Args:
+        filename: Arquivo CSV de saida
+        n_rows: Numero de linhas
+        n_features: Numero de colunas de medidas
+        n_classes: Numero de especies
+        seed: Semente do gerador
+
+    Returns:
+        Tamanho do arquivo em bytes
+    """
+    feature_names, class_names, means, stds = synthetic_schema(n_features, n_classes, seed)
+    rng = np.random.default_rng(seed + 1)
+    species = np.array(class_names, dtype=object)
+
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        header = True
+        for start in range(0, n_rows, _GENERATE_CHUNK_ROWS):
+            size = min(_GENERATE_CHUNK_ROWS, n_rows - start)
+            labels = rng.integers(0, n_classes, size)
+            values = np.abs(rng.normal(means[labels], stds[labels]))
+            chunk = pd.DataFrame(values, columns=feature_names)
+            chunk['species'] = species[labels]
+            chunk.to_csv(f, header=header, index=False, float_format='%.1f')
+            header = False
+
+    return os.path.getsize(filename)
+
+
+def _measure(func, n_items, stages, name, per_stage_peak):
+    """
+    Executa uma fase, registrando tempo, vazao e pico de RSS
+    """
+    if per_stage_peak:
+        reset_peak_rss()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    stages[name] = {
+        'seconds': seconds,
+        'items': n_items,
+        'items_per_s': n_items / seconds if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    return result
+
+
+def _save_prepared(df, feature_names, species_map, train_rows, test_rows, dirname):
+    """
+    Grava a fonte e os indices da divisao, como o save_data do pipeline
+    """
+    from columnar_store import save_source, save_split
+    from data_loader import TARGET_COLUMN
+
+    save_source(df, feature_names, TARGET_COLUMN, species_map, dirname)
+    save_split(train_rows, test_rows, dirname=dirname)
+
+
+def _run_size(config):
+    """
+    Mede todas as fases para um tamanho de dados (executado em um processo novo)
+    """
+    from classifier_interface import classify_flower
+    from columnar_store import open_split
+    from data_loader import (DEFAULT_CSV_CHUNKSIZE, TARGET_COLUMN, encode_species, load_iris_from_csv,
+                             split_data)
+    from model_evaluator import evaluate_model
+    from model_trainer import train_decision_tree
+
+    warnings.filterwarnings('ignore')
+    n_rows = config['rows']
+    filename = os.path.join(config['workdir'], f'iris_sintetico_{n_rows}.csv')
+
+    start = time.perf_counter()
+    csv_bytes = generate_iris_csv(filename, n_rows, config['features'], config['classes'], config['seed'])
+    generate_seconds = time.perf_counter() - start
+
+    per_stage_peak = reset_peak_rss()
+    stages = {}
+    # As funcoes do pipeline imprimem relatorios; aqui so interessam os tempos
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            df = _measure(lambda: load_iris_from_csv(filename, chunksize=DEFAULT_CSV_CHUNKSIZE),
+                          n_rows, stages, 'load', per_stage_peak)
+        finally:
+            os.remove(filename)
+        # df entra como padrao dos lambdas: ele e apagado antes do treino
+        df, species_map = _measure(lambda df=df: encode_species(df), n_rows, stages, 'encode',
+                                   per_stage_peak)
+        train_rows, test_rows = _measure(lambda df=df: split_data(df), n_rows, stages, 'split',
+                                         per_stage_peak)
+
+        # Como no pipeline: fonte e indices em disco, linhas reunidas da fonte para o treino
+        feature_names = [c for c in df.columns if c != TARGET_COLUMN]
+        prepared_dir = os.path.join(config['workdir'], f'prepared_{n_rows}')
+        try:
+            _measure(lambda df=df: _save_prepared(df, feature_names, species_map, train_rows, test_rows,
+                                                  prepared_dir),
+                     n_rows, stages, 'save', per_stage_peak)
+            del df
+            X_train, y_train, X_test, y_test = _measure(
+                lambda: open_split('train', prepared_dir) + open_split('test', prepared_dir),
+                n_rows, stages, 'gather', per_stage_peak)
+        finally:
+            shutil.rmtree(prepared_dir, ignore_errors=True)
+        modelo = _measure(lambda: train_decision_tree(X_train, y_train), len(X_train), stages,
+                          'train', per_stage_peak)
+        _measure(lambda: evaluate_model(modelo, X_test, y_test, species_map), len(X_test), stages,
+                 'evaluate', per_stage_peak)
+
+        samples = X_test.to_numpy()[:config['predict_calls']]
+        _measure(lambda: [classify_flower(modelo, row.reshape(1, -1), species_map) for row in samples],
+                 len(samples), stages, 'classify_flower', per_stage_peak)
+
+    return {
+        'rows': n_rows,
+        'csv_mb': csv_bytes / 1024 ** 2,
+        'generate_seconds': generate_seconds,
+        'tree_depth': int(modelo.get_depth()),
+        'tree_leaves': int(modelo.get_n_leaves()),
+        'peak_rss_scope': ('unavailable' if peak_rss_mb() is None
+                           else 'stage' if per_stage_peak else 'process'),
+        'stages': stages,
+    }
+
+
+def environment_info():
+    """
+    Versoes e maquina da execucao (para saber se duas execucoes sao comparaveis)
+    """
+    import sklearn
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmark(rows=DEFAULT_ROWS, n_features=4, n_classes=3, seed=42,
+                  predict_calls=DEFAULT_PREDICT_CALLS, workdir=None):
+    """
+    Executa o benchmark para cada tamanho de dados
+
+    Args:
+        rows: Lista de numeros de linhas
+        n_features: Numero de colunas de medidas
+        n_classes: Numero de especies
+        seed: Semente dos dados sinteticos
+        predict_calls: Chamadas de classify_flower medidas por tamanho
+        workdir: Diretorio dos CSVs temporarios (None usa o diretorio temporario do sistema)
+
+    Returns:
+        Dicionario de resultados (serializavel em JSON)
+    """
+    config = {'features': n_features, 'classes': n_classes, 'seed': seed,
+              'predict_calls': predict_calls}
+    results = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'config': dict(config),
+        'runs': [],
+    }
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(dir=workdir) as tmpdir:
+        for n_rows in rows:
+            print(f"\n--- {n_rows:,} linhas ({n_features} features, {n_classes} classes) ---")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                run = pool.submit(_run_size, dict(config, rows=n_rows, workdir=tmpdir)).result()
+            results['runs'].append(run)
+            print_run(run)
+
+    return results
+
+
+def print_run(run):
+    """
+    Exibe as medidas de um tamanho de dados
+    """
+    print(f"CSV gerado: {run['csv_mb']:.1f} MB em {run['generate_seconds']:.2f}s "
+          f"(arvore: profundidade {run['tree_depth']}, {run['tree_leaves']} folhas)")
+    print(f"  {'Fase':<16} {'Tempo (s)':>10} {'Itens/s':>14} {'Pico RSS (MB)':>14}")
+    for name, stage in run['stages'].items():
+        rate = f"{stage['items_per_s']:,.0f}" if stage['items_per_s'] else '-'
+        rss = f"{stage['peak_rss_mb']:.1f}" if stage['peak_rss_mb'] is not None else 'indisponivel'
+        print(f"  {name:<16} {stage['seconds']:>10.4f} {rate:>14} {rss:>14}")
+
+
+def save_results(results, filename=DEFAULT_RESULTS_FILE):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_filename, filename)
+
+
+def load_results(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    if results.get('format_version') != RESULTS_FORMAT_VERSION:
+        raise ValueError(f"Formato de resultados nao suportado em '{filename}'.")
+    return results
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compara duas execucoes fase a fase
+
+    Uma medida (tempo ou pico de RSS) e regressao quando cresce mais que
+    `threshold` (fracao) em relacao a base e a diferenca absoluta passa do
+    minimo da medida, para nao acusar ruido em fases de milissegundos.
+
+    Args:
+        baseline: Resultados de referencia
+        current: Resultados novos
+        threshold: Aumento relativo tolerado (0.2 = 20%)
+
+    Returns:
+        Lista de comparacoes (uma por tamanho, fase e medida)
+    """
+    base_runs = {run['rows']: run for run in baseline['runs']}
+    comparisons = []
+    for run in current['runs']:
+        base_run = base_runs.get(run['rows'])
+        if base_run is None:
+            continue
+        for stage, measures in run['stages'].items():
+            base_measures = base_run['stages'].get(stage)
+            if base_measures is None:
+                continue
+            for metric, min_delta in COMPARED_METRICS:
+                old, new = base_measures[metric], measures[metric]
+                if old is None or new is None:
+                    # Pico de RSS indisponivel em uma das plataformas
+                    continue
+                change = (new - old) / old if old > 0 else 0.0
+                comparisons.append({
+                    'rows': run['rows'],
+                    'stage': stage,
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change': change,
+                    'regression': change > threshold and new - old > min_delta,
+                })
+    return comparisons
+
+
+def print_comparison(comparisons, baseline, current, threshold):
+    """
+    Exibe a comparacao e retorna o numero de regressoes
+    """
+    if baseline['config'] != current['config']:
+        print(f"AVISO: configuracoes diferentes ({baseline['config']} x {current['config']}).")
+    if baseline['environment'] != current['environment']:
+        print("AVISO: ambientes diferentes; as diferencas podem nao vir do codigo.")
+
+    print(f"\n{'Linhas':>12} {'Fase':<16} {'Medida':<12} {'Base':>10} {'Atual':>10} {'Variacao':>9}")
+    for c in comparisons:
+        flag = '  REGRESSAO' if c['regression'] else ''
+        print(f"{c['rows']:>12,} {c['stage']:<16} {c['metric']:<12} {c['baseline']:>10.4f} "
+              f"{c['current']:>10.4f} {c['change']:>+8.1%}{flag}")
+
+    n_regressions = sum(c['regression'] for c in comparisons)
+    if n_regressions:
+        print(f"\n{n_regressions} regressao(oes) acima de {threshold:.0%}.")
+    else:
+        print(f"\nNenhuma regressao acima de {threshold:.0%}.")
+    return n_regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark de escala do pipeline com dados sinteticos parecidos com o Iris.')
+    parser.add_argument('--rows', type=lambda s: int(float(s)), nargs='+', default=DEFAULT_ROWS,
+                        help='Tamanhos a medir (aceita notacao como 1e6)')
+    parser.add_argument('--features', type=int, default=4, help='Numero de colunas de medidas')
+    parser.add_argument('--classes', type=int, default=3, help='Numero de especies')
+    parser.add_argument('--seed', type=int, default=42, help='Semente dos dados sinteticos')
+    parser.add_argument('--predict-calls', type=int, default=DEFAULT_PREDICT_CALLS,
+                        help='Chamadas de classify_flower medidas por tamanho')
+    parser.add_argument('--workdir', default=None, help='Diretorio dos CSVs temporarios')
+    parser.add_argument('--output', default=DEFAULT_RESULTS_FILE,
+                        help=f'Arquivo JSON de resultados (padrao: {DEFAULT_RESULTS_FILE})')
+    parser.add_argument('--baseline', default=None,
+                        help='Resultados de referencia para comparar com esta execucao')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'ATUAL'),
+                        help='Apenas compara dois arquivos de resultados, sem medir')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Aumento relativo tolerado antes de apontar regressao (0.2 = 20%%)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Returns:
+        Codigo de saida (1 se houver regressao)
+    """
+    args = parse_args(argv)
+
+    if args.compare:
+        baseline, current = (load_results(filename) for filename in args.compare)
+    else:
+        print("=" * 70)
+        print("BENCHMARK DE ESCALA DO PIPELINE")
+        print("=" * 70)
+        current = run_benchmark(args.rows, args.features, args.classes, args.seed,
+                                args.predict_calls, args.workdir)
+        save_results(current, args.output)
+        print(f"\nResultados salvos em '{args.output}'.")
+        if args.baseline is None:
+            return 0
+        baseline = load_results(args.baseline)
+
+    comparisons = compare_results(baseline, current, args.threshold)
+    return 1 if print_comparison(comparisons, baseline, current, args.threshold) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,33 +1,89 @@
+import argparse
+import os
 import pickle
+import sys
 import numpy as np
 
+from model_bundle import BUNDLE_FILENAME, load_bundle
+from prediction_cache import PredictionCache
+
+# Numero de linhas lidas e classificadas por vez no modo em lote
+DEFAULT_CHUNK_SIZE = 10000
+
+# Confiança mínima da classe prevista; abaixo dela a amostra vai para revisão manual
+DEFAULT_CONFIDENCE_THRESHOLD = 0.6
+
+# Pacote de inferência carregado uma única vez por processo
+_loaded_bundle = None
+
+
+def _load_legacy_artifacts():
+    """
+    Monta o pacote de inferência a partir dos arquivos antigos (sem model_bundle.pkl).
+    """
+    with open('trained_model.pkl', 'rb') as f:
+        dados_modelo = pickle.load(f)
+        model = dados_modelo['modelo']
+
+    from columnar_store import load_prepared
+
+    data, prepared_path = load_prepared()
+
+    species_map = data.get('species_map')
+
+    if species_map is None:
+        raise ValueError(f"'species_map' não encontrado em '{prepared_path}'")
+
+    return {
+        'modelo': model,
+        'species_map': species_map,
+        'feature_names': data.get('feature_names'),
+        'checksum': None,
+        'format_version': None,
+        'created_at': None,
+    }
+
+
+def load_inference_bundle():
+    """
+    Carrega (na primeira chamada) e retorna o pacote de inferência do processo.
+
+    Lê apenas 'model_bundle.pkl'; os arquivos antigos só são usados quando o
+    pacote ainda não foi gerado pelo treinamento.
+    """
+    global _loaded_bundle
+
+    if _loaded_bundle is None:
+        if os.path.exists(BUNDLE_FILENAME):
+            bundle = load_bundle(BUNDLE_FILENAME)
+        else:
+            bundle = _load_legacy_artifacts()
+        bundle['class_names'] = class_display_names(bundle['modelo'], bundle['species_map'])
+        _loaded_bundle = bundle
+
+    return _loaded_bundle
+
+
 def load_classifier():
     """
     Carrega o modelo treinado e o mapa de espécies.
     """
     try:
-        with open('trained_model.pkl', 'rb') as f:
-            dados_modelo = pickle.load(f) 
-            model = dados_modelo['modelo'] 
-            
-        with open('prepared_data.pkl', 'rb') as f:
-            data = pickle.load(f)
-            
-        species_map = data.get('species_map')
-        
-        if species_map is None:
-            raise ValueError("'species_map' não encontrado em 'prepared_data.pkl'")
-            
-        return model, species_map
-        
+        bundle = load_inference_bundle()
+        return bundle['modelo'], bundle['species_map']
+
     except FileNotFoundError:
-        print("Erro: Não foi possível encontrar 'trained_model.pkl' ou 'prepared_data.pkl'.")
+        print(f"Erro: Não foi possível encontrar '{BUNDLE_FILENAME}' nem 'trained_model.pkl' e os dados preparados.")
         print("Certifique-se de que os arquivos existem no diretório.")
         return None, None
     except KeyError:
         print("Erro: O arquivo 'trained_model.pkl' não contém a chave 'modelo'.")
         print("Por favor, execute o script de treinamento novamente.")
         return None, None
+    except ValueError as e:
+        print(f"Erro: {e}")
+        print("Por favor, execute o script de treinamento novamente.")
+        return None, None
 
 def get_flower_measurements():
     """
@@ -50,39 +106,251 @@ def get_flower_measurements():
     except EOFError:
         return None
 
-def classify_flower(modelo, measurements, species_map):
+def class_display_names(modelo, species_map):
+    """
+    Nomes exibidos das classes, na ordem das colunas de modelo.predict_proba.
+    """
+    return np.array(
+        [species_display_name(species_map.get(c, "Espécie Desconhecida")) for c in modelo.classes_],
+        dtype=object
+    )
+
+
+def predict_with_confidence(modelo, X, class_names, threshold=DEFAULT_CONFIDENCE_THRESHOLD, top_k=2,
+                            cache=None, model_version=None):
+    """
+    Classifica um lote com uma única chamada de predict_proba.
+
+    A classe prevista é a de maior probabilidade (a mesma de modelo.predict) e
+    a amostra é marcada para abstenção quando essa probabilidade fica abaixo
+    do limite de confiança.
+
+    Args:
+        modelo: Modelo treinado
+        X: Lote de medidas (array 2D ou DataFrame)
+        class_names: Nomes das classes na ordem de modelo.classes_ (class_display_names)
+        threshold: Confiança mínima para não se abster
+        top_k: Número de classes mais prováveis retornadas por amostra
+        cache: PredictionCache opcional; só as amostras fora dele vão ao modelo
+        model_version: Versão do modelo para o cache (ex: checksum do pacote)
+
+    Returns:
+        Dicionario com arrays por amostra: 'classes', 'labels', 'confidence',
+        'abstain', 'probabilities', 'top_k_classes', 'top_k_labels' e
+        'top_k_probabilities'
+    """
+    if cache is not None:
+        probabilities = cache.predict_proba(modelo, X, model_version)
+    else:
+        probabilities = np.asarray(modelo.predict_proba(X))
+    classes = np.asarray(modelo.classes_)
+    # Aceita lista ou tupla: a indexação abaixo precisa de um array
+    class_names = np.asarray(class_names)
+
+    # Ordenação estável: em empates vence a primeira classe, como no argmax do predict
+    top = np.argsort(-probabilities, axis=1, kind='stable')[:, :max(1, top_k)]
+    top_probabilities = np.take_along_axis(probabilities, top, axis=1)
+    confidence = top_probabilities[:, 0]
+
+    return {
+        'classes': classes[top[:, 0]],
+        'labels': class_names[top[:, 0]],
+        'confidence': confidence,
+        'abstain': confidence < threshold,
+        'probabilities': probabilities,
+        'top_k_classes': classes[top],
+        'top_k_labels': class_names[top],
+        'top_k_probabilities': top_probabilities,
+    }
+
+
+def classify_flower(modelo, measurements, species_map, class_names=None,
+                    threshold=DEFAULT_CONFIDENCE_THRESHOLD, cache=None, model_version=None):
     """
     Prevê a espécie da flor e exibe o resultado formatado.
     """
-   
-    prediction_index = modelo.predict(measurements)[0]
-    
-    predicted_species_full = species_map.get(prediction_index, "Espécie Desconhecida")
-    
-    predicted_species_name = predicted_species_full.split('-')[-1].lower()
+    if class_names is None:
+        class_names = class_display_names(modelo, species_map)
 
-    print(f"\n--- Resultado da Classificação ---")
-    print(f"A espécie prevista é: {predicted_species_name.capitalize()}")
+    result = predict_with_confidence(modelo, measurements, class_names, threshold,
+                                     cache=cache, model_version=model_version)
+
+    print("\n--- Resultado da Classificação ---")
+    print(f"A espécie prevista é: {result['labels'][0]}")
     print("----------------------------------")
 
-    if hasattr(modelo, 'predict_proba'):
-        probabilities = modelo.predict_proba(measurements)[0]
-        
-        print("Probabilidades (Confiança):")
-        
-        try:
-            class_names = [species_map[i].split('-')[-1] for i in sorted(species_map.keys())]
-            
-            if len(probabilities) == len(class_names):
-                for i, name in enumerate(class_names):
-                    print(f"  {name.capitalize():<10}: {probabilities[i]:.2%}")
-            else:
-                 print("  (Não foi possível mapear probabilidades aos nomes das classes.)")
-        except Exception:
-             print("  (Erro ao exibir probabilidades detalhadas.)")
+    print("Probabilidades (Confiança):")
+    for name, probability in zip(class_names, result['probabilities'][0]):
+        print(f"  {name:<10}: {probability:.2%}")
+    print("----------------------------------")
+
+    if result['abstain'][0]:
+        print(f"Confiança baixa ({result['confidence'][0]:.2%} < {threshold:.0%}): "
+              f"encaminhar para revisão manual.")
         print("----------------------------------")
 
 
+def species_display_name(species_full):
+    """
+    Converte o nome completo da espécie (ex: 'Iris-setosa') no nome exibido.
+    """
+    return species_full.split('-')[-1].lower().capitalize()
+
+
+def _csv_chunks(source, chunk_size, n_features, feature_names, header):
+    """
+    Lê um CSV em blocos de tamanho fixo, mantendo só as colunas de medidas.
+    """
+    import pandas as pd
+
+    if header:
+        usecols = None
+        if source is not sys.stdin and feature_names is not None:
+            columns = pd.read_csv(source, nrows=0).columns
+            if set(feature_names) <= set(columns):
+                usecols = list(feature_names)
+        reader = pd.read_csv(source, chunksize=chunk_size, usecols=usecols)
+    else:
+        reader = pd.read_csv(source, chunksize=chunk_size, header=None, usecols=range(n_features))
+
+    for chunk in reader:
+        if feature_names is not None and set(feature_names) <= set(chunk.columns):
+            chunk = chunk[list(feature_names)]
+        yield chunk.iloc[:, :n_features].to_numpy(dtype=np.float64)
+
+
+def _npy_chunks(source, chunk_size):
+    """
+    Lê um arquivo .npy em blocos, via memory map (arquivo) ou leitura sequencial (stdin).
+    """
+    if source is not sys.stdin:
+        data = np.load(source, mmap_mode='r')
+        for start in range(0, data.shape[0], chunk_size):
+            yield np.asarray(data[start:start + chunk_size], dtype=np.float64)
+        return
+
+    stream = sys.stdin.buffer
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    if fortran_order or len(shape) != 2:
+        raise ValueError("Pela entrada padrão só são aceitos arrays .npy 2D em ordem C.")
+
+    row_bytes = shape[1] * dtype.itemsize
+    remaining = shape[0]
+    while remaining > 0:
+        n_rows = min(chunk_size, remaining)
+        buffer = stream.read(n_rows * row_bytes)
+        if len(buffer) != n_rows * row_bytes:
+            raise ValueError("Arquivo .npy truncado na entrada padrão.")
+        yield np.frombuffer(buffer, dtype=dtype).reshape(n_rows, shape[1]).astype(np.float64)
+        remaining -= n_rows
+
+
+def iter_measurement_chunks(path, input_format=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                            n_features=4, feature_names=None, header=True):
+    """
+    Lê medidas de um CSV ou NPY (caminho ou '-' para stdin) em blocos de tamanho fixo.
+    """
+    if input_format is None:
+        input_format = 'npy' if path.lower().endswith('.npy') else 'csv'
+    source = sys.stdin if path == '-' else path
+
+    if input_format == 'npy':
+        chunks = _npy_chunks(source, chunk_size)
+    elif input_format == 'csv':
+        chunks = _csv_chunks(source, chunk_size, n_features, feature_names, header)
+    else:
+        raise ValueError(f"Formato de entrada desconhecido: '{input_format}' (use 'csv' ou 'npy').")
+
+    for chunk in chunks:
+        if chunk.ndim != 2 or chunk.shape[1] != n_features:
+            raise ValueError(f"Esperadas {n_features} medidas por linha, recebido {chunk.shape}.")
+        yield chunk
+
+
+def score_stream(modelo, species_map, chunks, output, threshold=None, cache=None, model_version=None):
+    """
+    Classifica cada bloco com uma única chamada vetorizada e escreve o resultado em CSV.
+
+    Cada linha de saída traz a espécie prevista e a probabilidade de cada classe,
+    com os mesmos nomes exibidos por classify_flower. Com `threshold`, uma coluna
+    'abstain' (1/0) marca as amostras de baixa confiança para revisão manual.
+    Com `cache`, só as medidas ainda não vistas são enviadas ao modelo.
+    """
+    class_names = class_display_names(modelo, species_map)
+    header = ["species"] + [f"prob_{name}" for name in class_names]
+    if threshold is not None:
+        header.append("abstain")
+    output.write(",".join(header) + "\n")
+
+    total = 0
+    for chunk in chunks:
+        result = predict_with_confidence(modelo, chunk, class_names,
+                                         threshold if threshold is not None else 0.0, top_k=1,
+                                         cache=cache, model_version=model_version)
+        lines = [
+            ",".join([label] + [f"{p:.6f}" for p in row])
+            for label, row in zip(result['labels'], result['probabilities'])
+        ]
+        if threshold is not None:
+            lines = [f"{line},{int(flag)}" for line, flag in zip(lines, result['abstain'])]
+        output.write("\n".join(lines) + "\n")
+        total += len(chunk)
+
+    return total
+
+
+def run_batch(path, input_format=None, output_path='-', chunk_size=DEFAULT_CHUNK_SIZE, header=True,
+              threshold=None, cache_size=0, workers=0):
+    """
+    Modo não interativo: classifica um arquivo inteiro de medidas em blocos.
+
+    Com `workers`, cada bloco é dividido entre processos trabalhadores que
+    leem a árvore compilada da memória compartilhada (inference_pool).
+    """
+    model, s_map = load_classifier()
+    if model is None or s_map is None:
+        return False
+
+    cache = PredictionCache(cache_size) if cache_size else None
+    version = load_inference_bundle()['checksum']
+
+    pool = None
+    if workers:
+        from inference_pool import InferencePool
+        pool = InferencePool(model, s_map, workers)
+
+    chunks = iter_measurement_chunks(
+        path,
+        input_format=input_format,
+        chunk_size=chunk_size,
+        n_features=model.n_features_in_,
+        feature_names=getattr(model, 'feature_names_in_', None),
+        header=header
+    )
+
+    scorer = pool if pool is not None else model
+    try:
+        if output_path == '-':
+            total = score_stream(scorer, s_map, chunks, sys.stdout, threshold, cache, version)
+        else:
+            with open(output_path, 'w', encoding='utf-8') as output:
+                total = score_stream(scorer, s_map, chunks, output, threshold, cache, version)
+    finally:
+        if pool is not None:
+            pool.close()
+
+    print(f"{total} flores classificadas.", file=sys.stderr)
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} acertos, {stats['misses']} faltas, "
+              f"{stats['evictions']} descartes ({stats['hit_rate']:.1%} de acerto).", file=sys.stderr)
+    return True
+
+
 def show_examples():
     """
     Mostra exemplos de entrada para o usuário testar.
@@ -94,9 +362,12 @@ def show_examples():
     print("  3. Virginica:  7.2, 3.0, 5.8, 1.6")
     print("----------------------------------------------------")
 
-def run_classifier():
+def run_classifier(cache_size=0):
     """
     Função principal que executa o loop da interface.
+
+    Com `cache_size`, as previsões das últimas N medidas distintas ficam em um
+    PredictionCache e medidas repetidas não voltam ao modelo.
     """
     print("Carregando classificador de Íris 'David'...")
     model, s_map = load_classifier()
@@ -105,6 +376,9 @@ def run_classifier():
         print("Encerrando programa devido a erro no carregamento.")
         return
 
+    bundle = load_inference_bundle()
+    class_names = bundle['class_names']
+    cache = PredictionCache(cache_size) if cache_size else None
     print("Classificador carregado com sucesso!")
     show_examples()
     
@@ -112,7 +386,8 @@ def run_classifier():
         measurements = get_flower_measurements()
         
         if measurements is not None:
-            classify_flower(model, measurements, s_map)
+            classify_flower(model, measurements, s_map, class_names,
+                            cache=cache, model_version=bundle['checksum'])
         else:
             pass 
         
@@ -125,5 +400,35 @@ def run_classifier():
             
     print("\nObrigado por usar o classificador 'David'. Encerrando...")
 
+def parse_args(argv=None):
+    """
+    Lê os argumentos de linha de comando (sem argumentos, abre a interface interativa).
+    """
+    parser = argparse.ArgumentParser(description="Classificador de flores Iris")
+    parser.add_argument('--batch', metavar='ARQUIVO',
+                        help="Classifica um arquivo CSV/NPY em lote ('-' para stdin)")
+    parser.add_argument('--format', choices=['csv', 'npy'], dest='input_format',
+                        help="Formato da entrada (padrão: pela extensão, CSV para stdin)")
+    parser.add_argument('--output', default='-',
+                        help="Arquivo CSV de saída ('-' para stdout)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Linhas classificadas por bloco")
+    parser.add_argument('--no-header', action='store_true',
+                        help="O CSV de entrada não tem linha de cabeçalho")
+    parser.add_argument('--review-threshold', type=float, default=None, metavar='CONFIANCA',
+                        help="Adiciona a coluna 'abstain' marcando previsões com confiança abaixo deste valor")
+    parser.add_argument('--workers', type=int, default=0, metavar='N',
+                        help="Divide cada bloco entre N processos com o modelo em memória compartilhada (0 = sem processos)")
+    parser.add_argument('--cache-size', type=int, default=0, metavar='N',
+                        help="Guarda as previsões das últimas N medidas distintas, no lote ou na "
+                             "interface interativa (0 = sem cache)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    run_classifier()
\ No newline at end of file
+    args = parse_args()
+    if args.batch:
+        ok = run_batch(args.batch, args.input_format, args.output, args.chunk_size, not args.no_header,
+                       args.review_threshold, args.cache_size, args.workers)
+        sys.exit(0 if ok else 1)
+    run_classifier(args.cache_size)
\ No newline at end of file
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Formato em disco para os dados preparados (fonte unica + divisoes por indice)
+
+O conjunto de dados codificado e gravado uma unica vez como fonte: uma matriz
+de features float32 contigua (ordem C, uma linha por amostra), o array de
+labels no menor tipo inteiro e o indice das linhas. Cada divisao em treino e
+teste (uma "variante": outra semente, outro fold...) guarda so as posicoes
+das linhas na fonte, mais a impressao digital (sha256) da fonte para a qual
+foi gerada:
+
+    prepared_data/
+        manifest.json
+        source-<impressao>/features.npy, species.npy, index.npy
+        splits/default/train.npy, test.npy
+        splits/<variante>/train.npy, test.npy
+
+Uma variante custa alguns bytes por linha, em vez de uma copia dos dados, e
+regravar a mesma fonte nao reescreve nada. Quando a fonte muda, as variantes
+geradas para a fonte anterior sao descartadas.
+
+Os arrays sao abertos com memory map, e as linhas de um split so sao reunidas
+quando pedidas (open_split, iter_split_chunks ou o acesso a X_train/X_test em
+load_prepared), ja no tipo e no layout que as arvores usam.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+PREPARED_DIR = 'prepared_data'
+LEGACY_PREPARED_FILE = 'prepared_data.pkl'
+MANIFEST_FILENAME = 'manifest.json'
+STORE_FORMAT_VERSION = 3
+SPLITS = ('train', 'test')
+DEFAULT_VARIANT = 'default'
+FEATURE_DTYPE = np.float32
+SOURCE_DIR_PREFIX = 'source-'
+SPLITS_DIRNAME = 'splits'
+
+
+def _save_array(path, values):
+    np.save(path, np.ascontiguousarray(values))
+
+
+def _label_dtype(y):
+    """
+    Menor tipo inteiro que comporta os labels (os codigos das especies)
+    """
+    values = np.asarray(y)
+    if not len(values) or not np.issubdtype(values.dtype, np.integer):
+        return values.dtype
+    return np.promote_types(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+
+
+def _write_manifest(dirname, manifest):
+    """
+    Grava o manifest de forma atomica (o manifest e o que torna a gravacao visivel)
+    """
+    tmp_path = os.path.join(dirname, MANIFEST_FILENAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(dirname, MANIFEST_FILENAME))
+
+
+def _current_manifest(dirname):
+    """
+    Manifest atual, ou None se nao houver um no formato desta versao
+    """
+    try:
+        return read_manifest(dirname)
+    except (OSError, ValueError):
+        return None
+
+
+def source_fingerprint(df, feature_names, target_name, species_map):
+    """
+    Impressao digital (sha256) dos dados de origem ja codificados
+
+    Cobre os nomes das features, o mapa de especies, as medidas em float32,
+    os labels e o indice das linhas, coluna a coluna, sem montar a matriz.
+    """
+    digest = hashlib.sha256()
+    header = {
+        'feature_names': list(feature_names),
+        'target_name': target_name,
+        'species_map': {str(k): v for k, v in species_map.items()},
+        'n_rows': len(df),
+    }
+    digest.update(json.dumps(header, sort_keys=True).encode('utf-8'))
+    for name in feature_names:
+        digest.update(np.ascontiguousarray(df[name].to_numpy(dtype=FEATURE_DTYPE)).data)
+    labels = df[target_name].to_numpy()
+    digest.update(np.ascontiguousarray(labels.astype(_label_dtype(labels), copy=False)).data)
+    digest.update(np.ascontiguousarray(df.index.to_numpy(dtype=np.int64)).data)
+    return digest.hexdigest()
+
+
+def save_source(df, feature_names, target_name, species_map, dirname=PREPARED_DIR):
+    """
+    Grava a fonte (conjunto codificado inteiro), se ela ainda nao estiver gravada
+
+    A matriz e preenchida coluna a coluna direto no arquivo, sem montar uma
+    copia dos dados na memoria. A nova fonte so fica visivel quando o manifest
+    e substituido; a fonte anterior e as variantes geradas para ela sao
+    removidas em seguida.
+
+    Args:
+        df: DataFrame com as features e a coluna de labels (codigos inteiros)
+        feature_names: Colunas das features, na ordem da matriz
+        target_name: Coluna dos labels
+        species_map: Dicionario de mapeamento das especies
+        dirname: Diretorio de destino
+
+    Returns:
+        (manifest, True se a fonte foi gravada ou False se foi reaproveitada)
+    """
+    fingerprint = source_fingerprint(df, feature_names, target_name, species_map)
+    manifest = _current_manifest(dirname)
+    if manifest is not None and manifest['source']['fingerprint'] == fingerprint:
+        return manifest, False
+
+    if manifest is None:
+        # Nada reaproveitavel (diretorio ausente ou de outra versao do formato)
+        shutil.rmtree(dirname, ignore_errors=True)
+    os.makedirs(dirname, exist_ok=True)
+
+    source_dirname = SOURCE_DIR_PREFIX + fingerprint[:16]
+    tmp_dir = os.path.join(dirname, source_dirname + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    features = np.lib.format.open_memmap(os.path.join(tmp_dir, 'features.npy'), mode='w+',
+                                         dtype=FEATURE_DTYPE, shape=(len(df), len(feature_names)))
+    for j, name in enumerate(feature_names):
+        features[:, j] = df[name].to_numpy()
+    features.flush()
+    del features
+
+    labels = df[target_name].to_numpy()
+    labels = labels.astype(_label_dtype(labels), copy=False)
+    _save_array(os.path.join(tmp_dir, 'species.npy'), labels)
+    _save_array(os.path.join(tmp_dir, 'index.npy'), df.index.to_numpy())
+
+    final_dir = os.path.join(dirname, source_dirname)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+
+    new_manifest = {
+        'format_version': STORE_FORMAT_VERSION,
+        'feature_names': list(feature_names),
+        'target_name': target_name,
+        'species_map': {str(k): v for k, v in species_map.items()},
+        'source': {
+            'dir': source_dirname,
+            'fingerprint': fingerprint,
+            'n_rows': len(df),
+            'features': {'file': 'features.npy', 'dtype': np.dtype(FEATURE_DTYPE).name},
+            'labels': {'file': 'species.npy', 'dtype': labels.dtype.name},
+            'index': 'index.npy',
+        },
+        'variants': {},
+    }
+    _write_manifest(dirname, new_manifest)
+
+    # Fonte anterior e variantes dela ja nao sao referenciadas pelo manifest
+    for entry in os.listdir(dirname):
+        if entry.startswith(SOURCE_DIR_PREFIX) and entry != source_dirname:
+            shutil.rmtree(os.path.join(dirname, entry), ignore_errors=True)
+    shutil.rmtree(os.path.join(dirname, SPLITS_DIRNAME), ignore_errors=True)
+
+    return new_manifest, True
+
+
+def save_split(train_rows, test_rows, variant=DEFAULT_VARIANT, dirname=PREPARED_DIR, params=None):
+    """
+    Grava uma variante de divisao: so as posicoes das linhas na fonte
+
+    Args:
+        train_rows, test_rows: Posicoes das linhas de treino e de teste na fonte
+        variant: Nome da variante (ex: 'default', 'seed7', 'fold3')
+        dirname: Diretorio com a fonte ja gravada (save_source)
+        params: Parametros que geraram a divisao (guardados no manifest)
+
+    Returns:
+        Dicionario com o manifest gravado
+    """
+    manifest = read_manifest(dirname)
+    n_rows = manifest['source']['n_rows']
+    # Posicoes no menor tipo inteiro que enderece a fonte
+    index_dtype = np.min_scalar_type(max(n_rows - 1, 0))
+
+    split_root = os.path.join(dirname, SPLITS_DIRNAME)
+    tmp_dir = os.path.join(split_root, variant + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    info = {'fingerprint': manifest['source']['fingerprint'], 'params': params or {}}
+    for split, rows in (('train', train_rows), ('test', test_rows)):
+        rows = np.asarray(rows)
+        if len(rows) and (rows.min() < 0 or rows.max() >= n_rows):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise ValueError(f"Posicoes de '{split}' fora da fonte ({n_rows} linhas).")
+        filename = f'{split}.npy'
+        _save_array(os.path.join(tmp_dir, filename), rows.astype(index_dtype))
+        info[split] = {'file': filename, 'n_rows': len(rows)}
+
+    final_dir = os.path.join(split_root, variant)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+
+    manifest['variants'][variant] = info
+    _write_manifest(dirname, manifest)
+    return manifest
+
+
+def read_manifest(dirname=PREPARED_DIR):
+    """
+    Le o manifest do formato em disco e confere a versao
+    """
+    with open(os.path.join(dirname, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != STORE_FORMAT_VERSION:
+        raise ValueError(
+            f"Versao do formato em '{dirname}' nao suportada: {manifest.get('format_version')}."
+        )
+    return manifest
+
+
+def open_source(dirname=PREPARED_DIR, manifest=None):
+    """
+    Abre a fonte com memory map, sem copiar os dados
+
+    Returns:
+        (matriz de features, labels, indice das linhas)
+    """
+    if manifest is None:
+        manifest = read_manifest(dirname)
+    info = manifest['source']
+    source_dir = os.path.join(dirname, info['dir'])
+    return (np.load(os.path.join(source_dir, info['features']['file']), mmap_mode='r'),
+            np.load(os.path.join(source_dir, info['labels']['file']), mmap_mode='r'),
+            np.load(os.path.join(source_dir, info['index']), mmap_mode='r'))
+
+
+def split_rows(split, dirname=PREPARED_DIR, manifest=None, variant=DEFAULT_VARIANT):
+    """
+    Posicoes na fonte das linhas de um split, conferindo a impressao digital
+
+    Returns:
+        Array (memory map) com as posicoes, na ordem do split
+    """
+    if manifest is None:
+        manifest = read_manifest(dirname)
+
+    info = manifest['variants'].get(variant)
+    if info is None:
+        available = ', '.join(sorted(manifest['variants'])) or 'nenhuma'
+        raise ValueError(f"Variante '{variant}' nao encontrada em '{dirname}' (disponiveis: {available}).")
+    if info['fingerprint'] != manifest['source']['fingerprint']:
+        raise ValueError(f"A variante '{variant}' foi gerada para outros dados de origem.")
+
+    return np.load(os.path.join(dirname, SPLITS_DIRNAME, variant, info[split]['file']), mmap_mode='r')
+
+
+def _feature_positions(manifest, columns):
+    """
+    Posicoes das colunas pedidas na matriz da fonte, na ordem pedida
+    """
+    feature_names = manifest['feature_names']
+    if columns is None:
+        return feature_names, None
+    missing = [name for name in columns if name not in feature_names]
+    if missing:
+        raise ValueError(f"Features inexistentes nos dados preparados: {missing}")
+    return list(columns), [feature_names.index(name) for name in columns]
+
+
+def open_split(split, dirname=PREPARED_DIR, manifest=None, columns=None, variant=DEFAULT_VARIANT):
+    """
+    Reune as linhas de um split a partir da fonte (aberta com memory map)
+
+    Args:
+        split: 'train' ou 'test'
+        dirname: Diretorio do formato em disco
+        manifest: Manifest ja lido (opcional)
+        columns: Subconjunto de features, na ordem desejada (opcional)
+        variant: Variante de divisao
+
+    Returns:
+        X (DataFrame sobre uma matriz float32 contigua), y (Series), com o
+        indice original das linhas
+    """
+    if manifest is None:
+        manifest = read_manifest(dirname)
+
+    features, labels, index = open_source(dirname, manifest)
+    rows = np.asarray(split_rows(split, dirname, manifest, variant), dtype=np.intp)
+    feature_names, positions = _feature_positions(manifest, columns)
+
+    values = features[rows] if positions is None else features[np.ix_(rows, positions)]
+    split_index = pd.Index(index[rows], copy=False)
+    X = pd.DataFrame(values, index=split_index, columns=feature_names, copy=False)
+    y = pd.Series(labels[rows], index=split_index, name=manifest['target_name'], copy=False)
+
+    return X, y
+
+
+def iter_split_chunks(split, chunk_size, dirname=PREPARED_DIR, manifest=None, columns=None,
+                      variant=DEFAULT_VARIANT):
+    """
+    Reune as linhas de um split em blocos, sem o split inteiro na memoria
+
+    Yields:
+        (X, y): matriz float32 contigua e labels de cada bloco
+    """
+    if manifest is None:
+        manifest = read_manifest(dirname)
+
+    features, labels, _ = open_source(dirname, manifest)
+    rows = split_rows(split, dirname, manifest, variant)
+    _, positions = _feature_positions(manifest, columns)
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = np.asarray(rows[start:start + chunk_size], dtype=np.intp)
+        values = features[chunk] if positions is None else features[np.ix_(chunk, positions)]
+        yield values, labels[chunk]
+
+
+class PreparedData(Mapping):
+    """
+    Dados preparados de uma variante; X_train, y_train, X_test e y_test so sao
+    reunidos da fonte quando acessados
+
+    Chaves: X_train, X_test, y_train, y_test, feature_names e species_map
+    """
+
+    KEYS = ('X_train', 'X_test', 'y_train', 'y_test', 'feature_names', 'species_map')
+
+    def __init__(self, dirname=PREPARED_DIR, variant=DEFAULT_VARIANT, manifest=None):
+        self.dirname = dirname
+        self.variant = variant
+        self.manifest = manifest if manifest is not None else read_manifest(dirname)
+        # Confere a variante ja na abertura, e nao no primeiro acesso aos dados
+        split_rows('train', dirname, self.manifest, variant)
+        self._values = {
+            'feature_names': self.manifest['feature_names'],
+            'species_map': {int(k): v for k, v in self.manifest['species_map'].items()},
+        }
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self.KEYS:
+                raise KeyError(key)
+            split = key.split('_', 1)[1]
+            X, y = open_split(split, self.dirname, self.manifest, variant=self.variant)
+            self._values['X_' + split] = X
+            self._values['y_' + split] = y
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+
+def open_prepared(dirname=PREPARED_DIR, variant=DEFAULT_VARIANT):
+    """
+    Abre os dados preparados de uma variante de divisao
+
+    Returns:
+        PreparedData com X_train, X_test, y_train, y_test, feature_names e species_map
+    """
+    return PreparedData(dirname, variant)
+
+
+def load_prepared(dirname=PREPARED_DIR, legacy_filename=LEGACY_PREPARED_FILE, variant=DEFAULT_VARIANT):
+    """
+    Abre os dados preparados, aceitando tambem o pickle das versoes anteriores
+
+    Returns:
+        (dicionario com os dados, caminho efetivamente lido)
+    """
+    if os.path.exists(os.path.join(dirname, MANIFEST_FILENAME)):
+        return open_prepared(dirname, variant), dirname
+
+    if os.path.exists(legacy_filename):
+        with open(legacy_filename, 'rb') as f:
+            return pickle.load(f), legacy_filename
+
+    raise FileNotFoundError(
+        f"Dados preparados nao encontrados ('{dirname}/' ou '{legacy_filename}')."
+    )
+
+
+def store_size(dirname=PREPARED_DIR):
+    """
+    Tamanho total em bytes dos arquivos do formato em disco
+    """
+    total = 0
+    for root, _, files in os.walk(dirname):
+        for filename in files:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
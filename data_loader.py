@@ -1,90 +1,221 @@
 # -*- coding: utf-8 -*-
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
-import pickle
-from sklearn.model_selection import train_test_split
+from pandas.api.types import union_categoricals
+from sklearn.model_selection import StratifiedShuffleSplit
+
+import verbosity
+from columnar_store import DEFAULT_VARIANT, PREPARED_DIR, SPLITS_DIRNAME, save_source, save_split
+
+# Esquema explicito da leitura: features float32 e especie categorica
+FEATURE_DTYPE = 'float32'
+TARGET_COLUMN = 'species'
+DEFAULT_CSV_CHUNKSIZE = 1_000_000
+
+
+def csv_schema(filename, usecols=None):
+    """
+    Monta o esquema explicito de leitura a partir do cabecalho do CSV
+
+    Args:
+        filename: Nome do arquivo CSV
+        usecols: Colunas a manter (projecao); None mantem todas
+
+    Returns:
+        (lista de colunas na ordem do arquivo, dicionario de dtypes)
+    """
+    header = pd.read_csv(filename, nrows=0).columns
+    if usecols is None:
+        columns = list(header)
+    else:
+        missing = set(usecols) - set(header)
+        if missing:
+            raise ValueError(f"Colunas inexistentes em '{filename}': {sorted(missing)}")
+        columns = [c for c in header if c in usecols]
+
+    dtype = {c: ('category' if c == TARGET_COLUMN else FEATURE_DTYPE) for c in columns}
+    return columns, dtype
+
+
+def iter_iris_csv_chunks(filename='iris.csv', chunksize=DEFAULT_CSV_CHUNKSIZE, usecols=None):
+    """
+    Le o CSV em blocos ja tipados (features float32, especie categorica)
+
+    Args:
+        filename: Nome do arquivo CSV
+        chunksize: Numero de linhas por bloco
+        usecols: Colunas a manter (projecao); None mantem todas
+
+    Yields:
+        DataFrames com ate `chunksize` linhas
+    """
+    columns, dtype = csv_schema(filename, usecols)
+    reader = pd.read_csv(
+        filename,
+        usecols=columns,
+        dtype=dtype,
+        chunksize=chunksize,
+        engine='c'
+    )
+    for chunk in reader:
+        yield chunk[columns]
+
 
+def read_iris_csv_chunked(filename='iris.csv', chunksize=DEFAULT_CSV_CHUNKSIZE, usecols=None):
+    """
+    Le o CSV em blocos tipados e junta tudo em um DataFrame compacto
+
+    Cada coluna de cada bloco e guardada separadamente e as colunas sao
+    concatenadas uma de cada vez, liberando os blocos logo em seguida; assim
+    o pico de memoria fica proximo do tamanho final do DataFrame compacto.
+
+    Args:
+        filename: Nome do arquivo CSV
+        chunksize: Numero de linhas por bloco
+        usecols: Colunas a manter (projecao); None mantem todas
 
-def load_iris_from_csv(filename='iris.csv'):
+    Returns:
+        DataFrame com features float32 e especie categorica
+    """
+    columns, _ = csv_schema(filename, usecols)
+    parts = {c: [] for c in columns}
+
+    for chunk in iter_iris_csv_chunks(filename, chunksize, usecols):
+        for c in columns:
+            if c == TARGET_COLUMN:
+                parts[c].append(chunk[c].array)
+            else:
+                parts[c].append(chunk[c].to_numpy(copy=True))
+        del chunk
+
+    data = {}
+    for c in columns:
+        if c == TARGET_COLUMN:
+            data[c] = union_categoricals(parts.pop(c), sort_categories=True)
+        elif parts[c]:
+            data[c] = np.concatenate(parts.pop(c))
+        else:
+            data[c] = np.empty(0, dtype=FEATURE_DTYPE)
+            parts.pop(c)
+
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def load_iris_from_csv(filename='iris.csv', chunksize=None, usecols=None):
     """
     Etapa 1: Carrega o dataset Iris de um arquivo CSV
 
+    A leitura usa o esquema explicito (features float32, especie categorica):
+    as medidas tem uma casa decimal e as arvores comparam em float32, entao
+    nada se perde e a memoria cai pela metade em relacao ao float64/object.
+    Com `chunksize`, le em blocos e mostra apenas um resumo compacto, sem
+    precisar do arquivo inteiro na memoria durante a leitura.
+
     Args:
         filename: Nome do arquivo CSV a ser carregado
+        chunksize: Numero de linhas por bloco (None le o arquivo de uma vez)
+        usecols: Colunas a manter na leitura em blocos (None mantem todas)
 
     Returns:
         DataFrame com os dados do Iris
     """
-    print("=" * 70)
-    print("ETAPA 1: CARREGANDO DADOS DO ARQUIVO CSV")
-    print("=" * 70)
+    verbosity.section("ETAPA 1: CARREGANDO DADOS DO ARQUIVO CSV", newline=False)
+
+    if chunksize is not None:
+        df = read_iris_csv_chunked(filename, chunksize, usecols)
+    else:
+        df = pd.read_csv(filename, dtype=csv_schema(filename)[1])
+
+    verbosity.record('data.file', filename)
+    verbosity.record('data.rows', df.shape[0])
+    verbosity.record('data.columns', df.shape[1])
 
-    df = pd.read_csv(filename)
+    if chunksize is not None:
+        verbosity.say(f"\nArquivo '{filename}' carregado em blocos de {chunksize} linhas!")
+        verbosity.say(f"\nDimensoes do dataset: {df.shape[0]} linhas x {df.shape[1]} colunas")
+        if verbosity.enabled(verbosity.DETAILED):
+            print("\n--- Tipos de dados ---")
+            print(df.dtypes)
+            print(f"\nMemoria ocupada: {df.memory_usage(index=False).sum() / 1024 ** 2:.2f} MB")
+        return df
 
-    print(f"\nArquivo '{filename}' carregado com sucesso!")
-    print(f"\nDimensoes do dataset: {df.shape[0]} linhas x {df.shape[1]} colunas")
+    verbosity.say(f"\nArquivo '{filename}' carregado com sucesso!")
+    verbosity.say(f"\nDimensoes do dataset: {df.shape[0]} linhas x {df.shape[1]} colunas")
 
-    print("\n--- Primeiras 5 linhas do dataset ---")
-    print(df.head())
+    if verbosity.enabled(verbosity.DETAILED):
+        print("\n--- Primeiras 5 linhas do dataset ---")
+        print(df.head())
 
-    print("\n--- Tipos de dados ---")
-    print(df.dtypes)
+        print("\n--- Tipos de dados ---")
+        print(df.dtypes)
 
-    print("\n--- Informacoes gerais ---")
-    print(df.info())
+        print("\n--- Informacoes gerais ---")
+        print(df.info())
 
     return df
 
 
-def convert_species_to_int(df):
+def encode_species(df, column=TARGET_COLUMN, start=1):
     """
-    Etapa 2: Converte as especies de string para inteiros
+    Etapa 2: Converte as especies para codigos inteiros usando categorias
+
+    A coluna e substituida no proprio DataFrame (as colunas de features nao
+    sao copiadas) pelos codigos categoricos, no menor tipo inteiro que comporta
+    o vocabulario. O vocabulario vem dos proprios dados, em ordem alfabetica.
 
     Args:
-        df: DataFrame com os dados
+        df: DataFrame com os dados (modificado no lugar)
+        column: Nome da coluna com as especies
+        start: Codigo da primeira especie
 
     Returns:
-        DataFrame com a coluna species convertida para int
+        df, species_map (dicionario codigo -> nome da especie)
     """
-    print("\n" + "=" * 70)
-    print("ETAPA 2: CONVERTENDO ESPECIES PARA VALORES INTEIROS")
-    print("=" * 70)
+    verbosity.section("ETAPA 2: CONVERTENDO ESPECIES PARA VALORES INTEIROS")
+
+    species = df[column]
+    verbosity.say(f"\nTipo da coluna '{column}' ANTES da conversao: {species.dtype}")
 
-    print("\n--- Valores ANTES da conversao ---")
-    print(f"Tipo da coluna 'species': {df['species'].dtype}")
-    print(f"Valores unicos:\n{df['species'].value_counts()}")
+    if not isinstance(species.dtype, pd.CategoricalDtype):
+        species = species.astype('category')
 
-    # Criar uma copia para nao modificar o original
-    df_converted = df.copy()
+    categories = species.cat.categories
+    codes = species.cat.codes.to_numpy()
+    if (codes < 0).any():
+        raise ValueError(f"A coluna '{column}' contem valores ausentes.")
 
-    # Conversao das especies para inteiros
-    df_converted['species'] = df_converted['species'].replace({
-        'Iris-setosa': 1,
-        'Iris-versicolor': 2,
-        'Iris-virginica': 3
-    }).astype('int64')
+    dtype = np.min_scalar_type(len(categories) - 1 + start)
+    df[column] = codes.astype(dtype) + dtype.type(start)
 
-    print("\n--- Valores DEPOIS da conversao ---")
-    print(f"Tipo da coluna 'species': {df_converted['species'].dtype}")
-    print(f"Valores unicos:\n{df_converted['species'].value_counts()}")
+    species_map = {i + start: str(name) for i, name in enumerate(categories)}
+    verbosity.record('data.species_map', species_map)
 
-    print("\nMapeamento aplicado:")
-    print("  Iris-setosa     -> 1")
-    print("  Iris-versicolor -> 2")
-    print("  Iris-virginica  -> 3")
+    verbosity.say(f"Tipo da coluna '{column}' DEPOIS da conversao: {df[column].dtype}")
+    if verbosity.enabled(verbosity.DETAILED):
+        counts = np.bincount(codes, minlength=len(categories))
+        print("\nMapeamento aplicado:")
+        for (code, name), count in zip(species_map.items(), counts):
+            print(f"  {name:<16} -> {code}  ({count} amostras)")
 
-    return df_converted
+    return df, species_map
 
 
-def explore_data(df):
+def explore_data(df, species_map):
     """
     Etapa 3: Explora os dados do dataset
 
     Args:
         df: DataFrame com os dados
+        species_map: Dicionario de mapeamento das especies
     """
-    print("\n" + "=" * 70)
-    print("ETAPA 3: EXPLORANDO OS DADOS")
-    print("=" * 70)
+    verbosity.section("ETAPA 3: EXPLORANDO OS DADOS")
+
+    # Toda a exploracao e diagnostico: so e calculada no nivel detalhado
+    if not verbosity.enabled(verbosity.DETAILED):
+        return
 
     print("\n--- Informacoes gerais do dataset ---")
     df.info()
@@ -102,107 +233,118 @@ def explore_data(df):
     print("\nDistribuicao percentual:")
     for species, count in class_distribution.items():
         percentage = (count / len(df)) * 100
-        species_name = {1: 'Iris-setosa', 2: 'Iris-versicolor', 3: 'Iris-virginica'}[species]
+        species_name = species_map[species]
         print(f"  Classe {species} ({species_name}): {count} amostras ({percentage:.1f}%)")
 
     print(f"\nTotal de amostras: {len(df)}")
 
 
-def split_data(df):
+def split_data(df, random_state=42, test_size=0.2):
     """
     Etapa 3 (continuacao): Divide os dados em conjuntos de treino e teste
 
+    A divisao estratificada (a mesma do train_test_split com stratify=y) so
+    produz as posicoes das linhas: os dados nao sao copiados, e o treino e a
+    avaliacao reunem as linhas da fonte gravada por save_data.
+
     Args:
         df: DataFrame com os dados
+        random_state: Semente da divisao
+        test_size: Fracao das amostras no conjunto de teste
 
     Returns:
-        X_train, X_test, y_train, y_test
+        train_rows, test_rows (posicoes das linhas em df)
     """
-    print("\n" + "=" * 70)
-    print("DIVIDINDO DADOS EM TREINO E TESTE")
-    print("=" * 70)
+    verbosity.section("DIVIDINDO DADOS EM TREINO E TESTE")
 
     # Separar features (X) e target (y)
-    X = df.drop('species', axis=1)
-    y = df['species']
-
-    print(f"\nFeatures (X): {X.shape[1]} colunas")
-    print(f"Colunas: {list(X.columns)}")
-    print(f"\nTarget (y): {y.name}")
-    print(f"Classes: {sorted(y.unique())}")
-
-    # Dividir em treino e teste
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y,
-        test_size=0.2,
-        random_state=42,
-        shuffle=True,
-        stratify=y
-    )
+    feature_names = [c for c in df.columns if c != TARGET_COLUMN]
+    y = df[TARGET_COLUMN]
+
+    verbosity.say(f"\nFeatures (X): {len(feature_names)} colunas")
+    verbosity.say(f"Colunas: {feature_names}")
+    verbosity.say(f"\nTarget (y): {y.name}")
+    if verbosity.enabled(verbosity.DETAILED):
+        print(f"Classes: {sorted(y.unique())}")
+
+    # Dividir as posicoes em treino e teste (a divisao so depende de y; X de 0 colunas nao ocupa memoria)
+    splitter = StratifiedShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    train_rows, test_rows = next(splitter.split(np.empty((len(df), 0)), y))
 
-    print("\n--- Divisao dos dados ---")
-    print(f"Conjunto de TREINO: {len(X_train)} amostras ({len(X_train)/len(df)*100:.1f}%)")
-    print(f"Conjunto de TESTE:  {len(X_test)} amostras ({len(X_test)/len(df)*100:.1f}%)")
+    verbosity.record('split.train_rows', len(train_rows))
+    verbosity.record('split.test_rows', len(test_rows))
 
-    print("\n--- Distribuicao das classes no conjunto de TREINO ---")
-    train_distribution = y_train.value_counts().sort_index()
-    for species, count in train_distribution.items():
-        percentage = (count / len(y_train)) * 100
-        print(f"  Classe {species}: {count} amostras ({percentage:.1f}%)")
+    verbosity.say("\n--- Divisao dos dados ---")
+    verbosity.say(f"Conjunto de TREINO: {len(train_rows)} amostras ({len(train_rows)/len(df)*100:.1f}%)")
+    verbosity.say(f"Conjunto de TESTE:  {len(test_rows)} amostras ({len(test_rows)/len(df)*100:.1f}%)")
 
-    print("\n--- Distribuicao das classes no conjunto de TESTE ---")
-    test_distribution = y_test.value_counts().sort_index()
-    for species, count in test_distribution.items():
-        percentage = (count / len(y_test)) * 100
-        print(f"  Classe {species}: {count} amostras ({percentage:.1f}%)")
+    if not verbosity.enabled(verbosity.DETAILED):
+        return train_rows, test_rows
 
-    return X_train, X_test, y_train, y_test
+    labels = y.to_numpy()
+    for title, rows in (('TREINO', train_rows), ('TESTE', test_rows)):
+        print(f"\n--- Distribuicao das classes no conjunto de {title} ---")
+        species, counts = np.unique(labels[rows], return_counts=True)
+        for code, count in zip(species, counts):
+            percentage = (count / len(rows)) * 100
+            print(f"  Classe {code}: {count} amostras ({percentage:.1f}%)")
 
+    return train_rows, test_rows
 
-def save_data(X_train, X_test, y_train, y_test):
+
+def save_data(df, train_rows, test_rows, species_map, variant=DEFAULT_VARIANT, params=None):
     """
-    Salva os dados processados em arquivo pickle
+    Salva os dados processados: a fonte uma unica vez e a divisao como indices
+
+    A fonte (features float32 e labels inteiros de todas as linhas) so e
+    regravada quando sua impressao digital muda; a divisao grava apenas as
+    posicoes das linhas de treino e de teste.
 
     Args:
-        X_train, X_test, y_train, y_test: Dados divididos
+        df: DataFrame com os dados (de encode_species)
+        train_rows, test_rows: Posicoes das linhas (de split_data)
+        species_map: Dicionario de mapeamento das especies (de encode_species)
+        variant: Nome da variante de divisao
+        params: Parametros que geraram a divisao (guardados no manifest)
     """
-    print("\n" + "=" * 70)
-    print("SALVANDO DADOS PROCESSADOS")
-    print("=" * 70)
+    verbosity.section("SALVANDO DADOS PROCESSADOS")
+
+    feature_names = [c for c in df.columns if c != TARGET_COLUMN]
+
+    dirname = PREPARED_DIR
+    manifest, source_written = save_source(df, feature_names, TARGET_COLUMN, species_map, dirname)
+    save_split(train_rows, test_rows, variant, dirname, params)
+    verbosity.record('artifacts.prepared_data', dirname)
+    verbosity.record('data.source_fingerprint', manifest['source']['fingerprint'])
+    verbosity.record('data.source_written', source_written)
+
+    split_dir = os.path.join(dirname, SPLITS_DIRNAME, variant)
+    split_bytes = sum(os.path.getsize(os.path.join(split_dir, f)) for f in os.listdir(split_dir))
 
-    # Criar dicionario com todos os dados
-    feature_names = list(X_train.columns)
-    species_map = {
-        1: 'Iris-setosa',
-        2: 'Iris-versicolor',
-        3: 'Iris-virginica'
-    }
-
-    data_dict = {
-        'X_train': X_train,
-        'X_test': X_test,
-        'y_train': y_train,
-        'y_test': y_test,
-        'feature_names': feature_names,
-        'species_map': species_map
-    }
-
-    # Salvar em pickle
-    filename = 'prepared_data.pkl'
-    with open(filename, 'wb') as f:
-        pickle.dump(data_dict, f)
-
-    print(f"\nDados salvos com sucesso em '{filename}'!")
-    print("\nConteudo do arquivo:")
-    print(f"  - X_train: {X_train.shape}")
-    print(f"  - X_test: {X_test.shape}")
-    print(f"  - y_train: {y_train.shape}")
-    print(f"  - y_test: {y_test.shape}")
-    print(f"  - feature_names: {feature_names}")
-    print(f"  - species_map: {species_map}")
+    verbosity.say(f"\nDados salvos com sucesso em '{dirname}/'!")
+    verbosity.say("\nConteudo do arquivo:")
+    verbosity.say(f"  - fonte: {len(df)} linhas x {len(feature_names)} features float32 "
+                  f"({'gravada' if source_written else 'inalterada, reaproveitada'}; "
+                  f"sha256 {manifest['source']['fingerprint'][:12]})")
+    verbosity.say(f"  - variante '{variant}': {len(train_rows)} linhas de treino, {len(test_rows)} de teste "
+                  f"(so indices, {split_bytes / 1024:.2f} KB)")
+    verbosity.say(f"  - feature_names: {feature_names}")
+    verbosity.say(f"  - species_map: {species_map}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Prepara o dataset Iris: fonte codificada e divisao em treino/teste por indices.')
+    parser.add_argument('--seed', type=int, default=42, help='Semente da divisao (padrao: 42)')
+    parser.add_argument('--test-size', type=float, default=0.2, help='Fracao de teste (padrao: 0.2)')
+    parser.add_argument('--variant', default=DEFAULT_VARIANT,
+                        help=f"Nome da variante de divisao a gravar (padrao: '{DEFAULT_VARIANT}')")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
+    args = parse_args()
+
     print("\n" + "=" * 70)
     print("INICIANDO PROCESSAMENTO DO DATASET IRIS")
     print("=" * 70)
@@ -211,16 +353,17 @@ if __name__ == "__main__":
     df = load_iris_from_csv('iris.csv')
 
     # Etapa 2: Converter especies para inteiros
-    df = convert_species_to_int(df)
+    df, species_map = encode_species(df)
 
     # Etapa 3: Explorar dados
-    explore_data(df)
+    explore_data(df, species_map)
 
     # Etapa 3 (continuacao): Dividir dados
-    X_train, X_test, y_train, y_test = split_data(df)
+    train_rows, test_rows = split_data(df, args.seed, args.test_size)
 
-    # Salvar dados processados
-    save_data(X_train, X_test, y_train, y_test)
+    # Salvar dados processados (a fonte so e regravada se mudou)
+    save_data(df, train_rows, test_rows, species_map, args.variant,
+              params={'seed': args.seed, 'test_size': args.test_size})
 
     print("\n" + "=" * 70)
     print("PROCESSAMENTO CONCLUIDO COM SUCESSO!")
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Exportacao do modelo treinado para um modulo Python sem dependencias
+
+Gera um arquivo .py com a arvore (ou as arvores do ensemble) escrita como
+comparacoes aninhadas e o mapa de especies embutido. O modulo gerado usa so a
+biblioteca padrao: nao importa numpy, pandas nem scikit-learn e inicia em
+milissegundos, servindo como CLI de uma previsao ou como worker que le
+medidas da entrada padrao.
+
+Para reproduzir exatamente o modelo.predict, cada medida e arredondada para
+float32 antes das comparacoes (o scikit-learn converte a entrada para float32)
+e os valores ausentes (NaN) seguem o mesmo lado que no scikit-learn.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+import numpy as np
+
+import tree_engine
+
+DEFAULT_OUTPUT = 'iris_predictor.py'
+
+# Limite de aninhamento do tokenizador do Python (100 niveis de indentacao)
+_MAX_EXPORT_DEPTH = 90
+
+_MODULE_HEADER = '''# -*- coding: utf-8 -*-
+"""
+Classificador de flores Iris gerado por export_predictor.py (nao editar)
+
+Modelo: {model_name} ({n_trees} arvore(s), profundidade maxima {max_depth})
+
+Uso:
+    python {filename} 5.1 3.5 1.4 0.2     # uma flor
+    python {filename} < medidas.csv        # worker: uma flor por linha
+"""
+
+import struct
+import sys
+
+FEATURE_NAMES = {feature_names!r}
+CLASSES = {classes!r}
+LABELS = {labels!r}
+N_TREES = {n_trees}
+
+_pack_f32 = struct.Struct('f')
+
+
+def _to_float32(value):
+    """
+    Arredonda para float32, como o scikit-learn faz com a entrada
+    """
+    try:
+        return _pack_f32.unpack(_pack_f32.pack(value))[0]
+    except OverflowError:
+        return float('inf') if value > 0 else float('-inf')
+'''
+
+_MODULE_FOOTER = '''
+
+def predict_proba(measurements):
+    """
+    Probabilidade de cada classe (na ordem de CLASSES) para uma flor
+    """
+    if len(measurements) != len(FEATURE_NAMES):
+        raise ValueError(f"Esperadas {{len(FEATURE_NAMES)}} medidas, recebidas {{len(measurements)}}.")
+    x = [_to_float32(float(v)) for v in measurements]
+{proba_body}
+
+
+def predict(measurements):
+    """
+    Classe prevista (codigo inteiro, como modelo.predict) para uma flor
+    """
+    proba = predict_proba(measurements)
+    return CLASSES[proba.index(max(proba))]
+
+
+def predict_label(measurements):
+    """
+    Nome da especie prevista para uma flor
+    """
+    proba = predict_proba(measurements)
+    return LABELS[proba.index(max(proba))]
+
+
+def _serve(stdin, stdout):
+    """
+    Le uma flor por linha (medidas separadas por virgula) e responde uma especie por linha
+    """
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            label = predict_label(line.split(',')[:len(FEATURE_NAMES)])
+        except ValueError as e:
+            label = f'erro: {{e}}'
+        stdout.write(label + '\\n')
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        try:
+            print(predict_label(sys.argv[1:]))
+        except ValueError as e:
+            print(f'Erro: {{e}}', file=sys.stderr)
+            sys.exit(1)
+    else:
+        _serve(sys.stdin, sys.stdout)
+'''
+
+
+def _float_literal(value):
+    """
+    Literal Python exato de um float (inclusive infinito, usado em cortes so de NaN)
+    """
+    if np.isinf(value):
+        return "float('inf')" if value > 0 else "float('-inf')"
+    return repr(float(value))
+
+
+def _emit_node(tree, node, depth, lines):
+    """
+    Escreve um no da arvore compilada como if/else aninhado
+    """
+    indent = '    ' * depth
+    left = int(tree['left'][node])
+    if left == node:
+        value = ', '.join(_float_literal(v) for v in tree['value'][node])
+        lines.append(f'{indent}return ({value},)')
+        return
+
+    feature = int(tree['feature'][node])
+    threshold = _float_literal(tree['threshold'][node])
+    # "not x > t" tambem e verdadeiro para NaN, que entao desce pela esquerda
+    if tree['missing_left'][node]:
+        lines.append(f'{indent}if not x[{feature}] > {threshold}:')
+    else:
+        lines.append(f'{indent}if x[{feature}] <= {threshold}:')
+    _emit_node(tree, left, depth + 1, lines)
+    lines.append(f'{indent}else:')
+    _emit_node(tree, int(tree['right'][node]), depth + 1, lines)
+
+
+def generate_predictor_source(modelo, species_map, feature_names, filename=DEFAULT_OUTPUT):
+    """
+    Gera o codigo-fonte do modulo de previsao sem dependencias
+
+    Args:
+        modelo: DecisionTreeClassifier ou TreeEnsembleClassifier treinado
+        species_map: Dicionario {codigo: nome_especie}
+        feature_names: Nomes das medidas, na ordem usada no treino
+        filename: Nome do arquivo gerado (usado na ajuda do modulo)
+
+    Returns:
+        Codigo-fonte Python do modulo
+    """
+    from classifier_interface import species_display_name
+
+    tree = tree_engine.compile_model(modelo)
+    if tree['max_depth'] > _MAX_EXPORT_DEPTH:
+        raise ValueError(f"Arvore profunda demais para exportar "
+                         f"({tree['max_depth']} niveis, maximo {_MAX_EXPORT_DEPTH}).")
+
+    classes = [int(c) for c in tree['classes']]
+    labels = [species_display_name(species_map[c]) for c in classes]
+
+    roots = [int(r) for r in tree['roots']]
+    lines = [_MODULE_HEADER.format(
+        model_name=type(modelo).__name__, n_trees=len(roots), max_depth=tree['max_depth'],
+        filename=os.path.basename(filename), feature_names=list(feature_names),
+        classes=classes, labels=labels,
+    )]
+
+    for i, root in enumerate(roots):
+        lines.append('')
+        lines.append(f'def _tree_{i}(x):')
+        _emit_node(tree, root, 1, lines)
+        lines.append('')
+
+    if len(roots) == 1:
+        proba_body = '    return _tree_0(x)'
+    else:
+        # Mesma ordem de soma do tree_engine: arvore a arvore, depois divide por N_TREES
+        body = ['    proba = list(_tree_0(x))']
+        body.append('    for tree in (' + ', '.join(f'_tree_{i}' for i in range(1, len(roots))) + ',):')
+        body.append('        proba = [p + v for p, v in zip(proba, tree(x))]')
+        body.append('    return tuple(p / N_TREES for p in proba)')
+        proba_body = '\n'.join(body)
+
+    lines.append(_MODULE_FOOTER.format(proba_body=proba_body))
+    return '\n'.join(lines)
+
+
+def export_predictor(modelo, species_map, feature_names, filename=DEFAULT_OUTPUT):
+    """
+    Grava o modulo de previsao gerado
+
+    Returns:
+        Caminho do arquivo gerado
+    """
+    source = generate_predictor_source(modelo, species_map, feature_names, filename)
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        f.write(source)
+    os.replace(tmp_filename, filename)
+    return filename
+
+
+def load_predictor(filename=DEFAULT_OUTPUT):
+    """
+    Importa o modulo gerado a partir do caminho do arquivo
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def verify_predictor(predictor, modelo, X):
+    """
+    Confere se o modulo gerado concorda com o modelo em todas as amostras
+
+    Compara a classe prevista com modelo.predict e as probabilidades com
+    modelo.predict_proba (igualdade exata).
+
+    Args:
+        predictor: Modulo gerado (retornado por load_predictor)
+        modelo: Modelo original
+        X: Amostras (DataFrame ou array)
+
+    Returns:
+        Numero de amostras em que o modulo e o modelo discordam
+    """
+    expected_class = np.asarray(modelo.predict(X))
+    expected_proba = np.asarray(modelo.predict_proba(X))
+
+    rows = np.asarray(X, dtype=np.float64).tolist()
+    mismatches = 0
+    for row, cls, proba in zip(rows, expected_class, expected_proba):
+        if predictor.predict(row) != cls or predictor.predict_proba(row) != tuple(proba.tolist()):
+            mismatches += 1
+    return mismatches
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Exporta o modelo treinado para um modulo Python sem dependencias.')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                        help=f'Arquivo gerado (padrao: {DEFAULT_OUTPUT})')
+    parser.add_argument('--no-verify', action='store_true',
+                        help='Nao confere o modulo gerado contra o modelo no conjunto de teste')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Exporta o modelo salvo e confere o modulo gerado no conjunto de teste
+
+    Returns:
+        Codigo de saida (0 = sucesso)
+    """
+    from classifier_interface import load_classifier
+    from columnar_store import load_prepared
+
+    args = parse_args(argv)
+
+    print("=" * 60)
+    print("EXPORTACAO DO MODELO PARA MODULO PYTHON")
+    print("=" * 60)
+
+    modelo, species_map = load_classifier()
+    if modelo is None:
+        return 1
+
+    data, _ = load_prepared()
+    X_test = data['X_test']
+
+    filename = export_predictor(modelo, species_map, list(X_test.columns), args.output)
+    print(f"\nModulo gerado: {filename} ({os.path.getsize(filename) / 1024:.2f} KB)")
+
+    if args.no_verify:
+        return 0
+
+    mismatches = verify_predictor(load_predictor(filename), modelo, X_test)
+    if mismatches:
+        print(f"ERRO: o modulo gerado discorda do modelo em {mismatches} de {len(X_test)} amostras de teste.")
+        return 1
+
+    print(f"Verificacao: identico ao modelo.predict/predict_proba nas {len(X_test)} amostras de teste.")
+    print(f"\nUso: python {filename} 5.1 3.5 1.4 0.2")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Tabela de consulta em grade: previsao em tempo constante para arvores rasas
+
+Os cortes de uma arvore (ou de todas as arvores de um ensemble) dividem cada
+feature em poucos intervalos, e o espaco das medidas em uma grade de caixas
+alinhadas aos eixos em que a previsao e constante. A grade e pre-calculada
+uma vez: para cada feature, os cortes ordenados; para cada celula, o indice
+da linha de probabilidades do modelo naquela caixa.
+
+Prever vira descobrir em qual intervalo de cada feature cai a medida
+(comparacoes com os poucos cortes, ou um searchsorted quando sao muitos) e
+uma unica leitura na tabela, sem percorrer a arvore.
+
+A medida e convertida para float32, como no scikit-learn, e os cortes sao
+arredondados para o float32 equivalente; cada celula e preenchida prevendo
+um ponto float32 que cai nela, entao a tabela reproduz o modelo.predict bit
+a bit. Amostras com valores ausentes (NaN) seguem pela arvore, e quando a
+grade passaria de `max_cells` celulas a tabela nao e montada e a previsao
+usa a arvore compilada.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import tree_engine
+
+# Limite de celulas da grade (as tabelas usam ate 12 bytes por celula)
+DEFAULT_MAX_CELLS = 1_000_000
+
+# Ate quantos cortes por feature o intervalo e obtido somando comparacoes
+# (mais rapido que o searchsorted quando os cortes sao poucos)
+COMPARE_MAX_THRESHOLDS = 8
+
+
+def _split_thresholds(tree):
+    """
+    Cortes distintos e ordenados de cada feature (vazio para features nao usadas)
+    """
+    internal = tree['left'] != np.arange(len(tree['feature']))
+    features = tree['feature'][internal]
+    thresholds = tree['threshold'][internal]
+    return [np.unique(thresholds[features == f]) for f in range(tree['n_features'])]
+
+
+def _float32_thresholds(thresholds):
+    """
+    Maior float32 <= cada corte
+
+    Para uma medida float32 x, x > corte (comparado em float64) equivale a
+    x > esse valor, entao a comparacao pode ser feita toda em float32.
+    """
+    down = thresholds.astype(np.float32)
+    above = down > thresholds
+    down[above] = np.nextafter(down[above], np.float32(-np.inf))
+    return down
+
+
+def grid_cells(thresholds):
+    """
+    Numero de celulas da grade formada pelos cortes de cada feature
+    """
+    return int(np.prod([len(t) + 1 for t in thresholds], dtype=np.float64))
+
+
+def _cell_representatives(thresholds):
+    """
+    Um valor float32 dentro de cada intervalo entre cortes consecutivos
+
+    O intervalo i (com i cortes menores que a medida) vai de t[i-1]
+    (exclusivo) a t[i] (inclusivo). Intervalos sem nenhum float32 dentro sao
+    inalcancaveis e recebem o valor do intervalo anterior.
+    """
+    if not len(thresholds):
+        return np.zeros(1, dtype=np.float32)
+
+    # Maior float32 <= t[0] e, para os demais, menor float32 > t[i-1]
+    down = _float32_thresholds(thresholds)
+    above = np.nextafter(down, np.float32(np.inf))
+
+    representatives = np.concatenate([down[:1], above])
+    upper = np.append(thresholds, np.inf)
+    for i in range(1, len(representatives)):
+        if not np.isfinite(representatives[i]) or representatives[i] > upper[i]:
+            representatives[i] = representatives[i - 1]
+    return representatives
+
+
+def compile_grid(modelo, max_cells=DEFAULT_MAX_CELLS):
+    """
+    Monta a tabela de consulta em grade do modelo
+
+    Args:
+        modelo: DecisionTreeClassifier ou TreeEnsembleClassifier treinado
+        max_cells: Limite de celulas; acima dele a tabela nao e montada
+
+    Returns:
+        Dicionario da grade. Com 'table' None (grade grande demais), as
+        previsoes usam a arvore compilada em 'tree'
+    """
+    tree = tree_engine.compile_model(modelo)
+    thresholds = _split_thresholds(tree)
+    n_cells = grid_cells(thresholds)
+
+    grid = {
+        'tree': tree,
+        'classes': tree['classes'],
+        'n_features': tree['n_features'],
+        'thresholds': thresholds,
+        'thresholds32': [_float32_thresholds(t) for t in thresholds],
+        'used_features': [f for f, t in enumerate(thresholds) if len(t)],
+        'n_cells': n_cells,
+        'max_cells': max_cells,
+        'table': None,
+        'values': None,
+        'cell_class': None,
+    }
+    if n_cells > max_cells:
+        return grid
+
+    # Passo de cada feature no indice plano da celula (ordem C)
+    sizes = [len(t) + 1 for t in thresholds]
+    grid['strides'] = np.array([int(np.prod(sizes[f + 1:])) for f in range(len(sizes))], dtype=np.intp)
+
+    # Um ponto por celula, na mesma ordem do indice plano
+    axes = [_cell_representatives(t) for t in thresholds]
+    points = np.stack([a.ravel() for a in np.meshgrid(*axes, indexing='ij')], axis=1)
+    proba = tree_engine.predict_proba_batch(tree, points)
+
+    # Linhas de probabilidade distintas (no maximo uma por folha) e o indice de cada celula
+    values, cell_value = np.unique(proba, axis=0, return_inverse=True)
+    index_dtype = np.min_scalar_type(max(len(values) - 1, 0))
+    grid['table'] = cell_value.reshape(-1).astype(index_dtype)
+    grid['values'] = values
+    # Classe de cada celula direto na tabela: o predict fica com uma unica leitura.
+    # Em empates vence a primeira classe, como no argmax do predict
+    grid['cell_class'] = grid['classes'].take(np.argmax(values, axis=1)).take(cell_value.reshape(-1))
+    grid['points'] = points
+    return grid
+
+
+def _validate_batch(grid, X):
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.ndim != 2 or X.shape[1] != grid['n_features']:
+        raise ValueError(f"Esperado um array (n_amostras, {grid['n_features']}), recebido {X.shape}.")
+    if np.isinf(X).any():
+        raise ValueError("O lote contem valores infinitos.")
+    return X
+
+
+def lookup_cells(grid, X):
+    """
+    Indice da celula de cada amostra (um searchsorted por feature usada)
+
+    Returns:
+        (indices das celulas, mascara das amostras com NaN, que nao tem celula)
+    """
+    X = _validate_batch(grid, X)
+    # Uma coluna contigua por feature
+    columns = np.ascontiguousarray(X.T)
+    cells = np.zeros(len(X), dtype=np.intp)
+    for f in grid['used_features']:
+        # Intervalo = quantos cortes sao menores que a medida (quantas vezes iria para a direita)
+        thresholds, stride = grid['thresholds32'][f], grid['strides'][f]
+        if len(thresholds) <= COMPARE_MAX_THRESHOLDS:
+            for threshold in thresholds:
+                right = columns[f] > threshold
+                cells += right * stride if stride > 1 else right
+        else:
+            cells += np.searchsorted(thresholds, columns[f], side='left') * stride
+    return cells, np.isnan(columns).any(axis=0)
+
+
+def predict_proba_grid(grid, X):
+    """
+    Probabilidades de cada classe (igual a modelo.predict_proba)
+    """
+    if grid['table'] is None:
+        return tree_engine.predict_proba_batch(grid['tree'], X)
+
+    cells, missing = lookup_cells(grid, X)
+    proba = grid['values'].take(grid['table'].take(cells), axis=0)
+    if missing.any():
+        proba[missing] = tree_engine.predict_proba_batch(grid['tree'], np.asarray(X, dtype=np.float32)[missing])
+    return proba
+
+
+def predict_grid(grid, X):
+    """
+    Classe prevista de cada amostra (igual a modelo.predict)
+    """
+    if grid['table'] is None:
+        return tree_engine.predict_batch(grid['tree'], X)
+
+    cells, missing = lookup_cells(grid, X)
+    predicted = grid['cell_class'].take(cells)
+    if missing.any():
+        predicted[missing] = tree_engine.predict_batch(grid['tree'], np.asarray(X, dtype=np.float32)[missing])
+    return predicted
+
+
+def grid_nbytes(grid):
+    """
+    Memoria usada pela tabela, pelos cortes e pelas linhas de probabilidade
+    """
+    if grid['table'] is None:
+        return 0
+    return (grid['table'].nbytes + grid['values'].nbytes + grid['cell_class'].nbytes
+            + sum(t.nbytes for t in grid['thresholds32']))
+
+
+def verify_grid(grid, modelo, X=None):
+    """
+    Confere a grade contra o modelo.predict e o modelo.predict_proba
+
+    Alem das amostras dadas, usa o ponto de cada celula: eles ficam dos dois
+    lados de cada corte (o maior float32 <= corte e o menor > corte), entao
+    cobrem todas as fronteiras da grade.
+
+    Returns:
+        True se classes e probabilidades coincidem bit a bit
+    """
+    samples = [] if X is None else [np.asarray(X, dtype=np.float32)]
+    if grid['table'] is not None:
+        samples.append(grid['points'])
+
+    for values in samples:
+        if not np.array_equal(predict_grid(grid, values), np.asarray(modelo.predict(values))):
+            return False
+        if not np.array_equal(predict_proba_grid(grid, values), np.asarray(modelo.predict_proba(values))):
+            return False
+    return True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Monta a tabela de consulta em grade do modelo treinado, confere e mede a vazao.')
+    parser.add_argument('--max-cells', type=int, default=DEFAULT_MAX_CELLS,
+                        help=f'Limite de celulas da grade (padrao: {DEFAULT_MAX_CELLS:,})')
+    parser.add_argument('--rows', type=float, default=1e6, help='Linhas sinteticas da medida de vazao')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Monta a grade, confere contra o modelo no teste e em todas as celulas e compara a vazao
+
+    Returns:
+        Codigo de saida (0 = sucesso)
+    """
+    import warnings
+    from classifier_interface import load_classifier
+    from columnar_store import load_prepared
+
+    args = parse_args(argv)
+    modelo, _ = load_classifier()
+    if modelo is None:
+        return 1
+    X_test = load_prepared()[0]['X_test'].to_numpy(dtype=np.float32)
+
+    start = time.perf_counter()
+    grid = compile_grid(modelo, args.max_cells)
+    build_time = time.perf_counter() - start
+
+    cuts = ', '.join(str(len(t)) for t in grid['thresholds'])
+    print(f"Cortes por feature: {cuts} -> {grid['n_cells']:,} celulas")
+    if grid['table'] is None:
+        print(f"Grade acima do limite ({args.max_cells:,} celulas): previsao pela arvore compilada.")
+        return 0
+    print(f"Tabela: {grid_nbytes(grid) / 1024:.1f} KB, {len(grid['values'])} linhas de probabilidade, "
+          f"montada em {build_time * 1000:.1f} ms")
+
+    with warnings.catch_warnings():
+        # Arrays sem nomes de colunas: o modelo avisa, mas preve igual
+        warnings.simplefilter('ignore', UserWarning)
+        if not verify_grid(grid, modelo, X_test):
+            print("ERRO: a grade discorda do modelo.")
+            return 1
+    print(f"Verificacao: identica ao modelo no teste e nos {grid['n_cells']:,} pontos das celulas.")
+
+    # Medidas sinteticas dentro da faixa de cada feature no conjunto de teste
+    low, high = X_test.min(axis=0), X_test.max(axis=0)
+    rng = np.random.default_rng(42)
+    X = (low + rng.random((int(args.rows), len(low))) * (high - low)).astype(np.float32)
+    tree = grid['tree']
+    for name, func in (('tree_engine', lambda: tree_engine.predict_batch(tree, X)),
+                       ('grade', lambda: predict_grid(grid, X))):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<12} {len(X) / elapsed:>14,.0f} linhas/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Busca paralela de hiperparametros para o Decision Tree
+
+Avalia combinacoes de max_depth, min_samples_leaf, criterion, max_features e
+ccp_alpha com validacao cruzada estratificada (k-fold) em um pool de
+processos do tamanho dos nucleos disponiveis. Os dados de treino sao
+publicados uma unica vez em memoria compartilhada, sem pickle por tarefa.
+Opcionalmente, candidatos ruins sao descartados cedo com successive halving.
+"""
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.tree import DecisionTreeClassifier
+
+from shared_arrays import attach_array, release, share_array
+
+DEFAULT_PARAM_GRID = {
+    'max_depth': [None, 2, 3, 4, 5, 6, 8],
+    'min_samples_leaf': [1, 2, 4, 8],
+    'criterion': ['gini', 'entropy', 'log_loss'],
+    'max_features': [None, 'sqrt'],
+    'ccp_alpha': [0.0, 0.005, 0.01, 0.02],
+}
+DEFAULT_N_SPLITS = 5
+DEFAULT_HALVING_FACTOR = 3
+DEFAULT_SEED = 42
+
+# Estado de cada processo trabalhador, preenchido uma vez por _init_worker
+_worker = {}
+
+
+def available_cores():
+    """
+    Numero de nucleos que este processo pode usar
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(X_spec, y_spec, folds, seed):
+    blocks = []
+    shm, X = attach_array(X_spec)
+    blocks.append(shm)
+    shm, y = attach_array(y_spec)
+    blocks.append(shm)
+    _worker.update(blocks=blocks, X=X, y=y, folds=folds, seed=seed)
+
+
+def _evaluate_candidate(task):
+    """
+    Treina e pontua um candidato em todos os folds (executado no trabalhador)
+    """
+    candidate_id, params, n_resources = task
+    X, y, seed = _worker['X'], _worker['y'], _worker['seed']
+
+    scores = []
+    start = time.perf_counter()
+    for train_idx, val_idx in _worker['folds']:
+        if n_resources is not None:
+            train_idx = train_idx[:n_resources]
+        modelo = DecisionTreeClassifier(random_state=seed, **params)
+        modelo.fit(X[train_idx], y[train_idx])
+        scores.append(float(np.mean(modelo.predict(X[val_idx]) == y[val_idx])))
+
+    return {
+        'candidate': candidate_id,
+        'params': params,
+        'n_resources': n_resources,
+        'mean_score': float(np.mean(scores)),
+        'std_score': float(np.std(scores)),
+        'fold_scores': scores,
+        'fit_time_s': time.perf_counter() - start,
+    }
+
+
+def _halving_schedule(n_candidates, n_train, factor, min_resources):
+    """
+    Numero de amostras de treino por rodada do successive halving
+
+    Para quando restar um unico candidato ou quando a rodada seguinte ja
+    usaria o treino completo; a ultima rodada sempre usa o treino completo.
+    """
+    by_candidates = int(math.log(max(n_candidates, 1), factor))
+    by_resources = int(math.log(max(n_train / min_resources, 1), factor))
+    n_rounds = 1 + min(by_candidates, by_resources)
+    resources = [int(min_resources * factor ** r) for r in range(n_rounds - 1)]
+    return resources + [None]
+
+
+def search_decision_tree(X_train, y_train, param_grid=None, n_splits=DEFAULT_N_SPLITS,
+                         n_jobs=None, halving=False, halving_factor=DEFAULT_HALVING_FACTOR,
+                         seed=DEFAULT_SEED):
+    """
+    Busca os melhores hiperparametros do Decision Tree por validacao cruzada
+
+    Args:
+        X_train: Features de treino
+        y_train: Labels de treino
+        param_grid: Dicionario {parametro: valores}; None usa DEFAULT_PARAM_GRID
+        n_splits: Numero de folds da validacao cruzada estratificada
+        n_jobs: Processos trabalhadores; None usa todos os nucleos disponiveis
+        halving: Descarta candidatos ruins com successive halving
+        halving_factor: Fracao (1/fator) de candidatos mantida a cada rodada
+        seed: Semente dos folds, da subamostragem e das arvores
+
+    Returns:
+        (melhor modelo retreinado no treino completo, leaderboard ordenado)
+    """
+    candidates = list(ParameterGrid(param_grid or DEFAULT_PARAM_GRID))
+    n_jobs = n_jobs or available_cores()
+
+    X = np.ascontiguousarray(X_train, dtype=np.float32)
+    y = np.ascontiguousarray(y_train)
+
+    rng = np.random.default_rng(seed)
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    # O treino de cada fold e embaralhado para que os prefixos usados no
+    # successive halving sejam subamostras aleatorias
+    folds = [(rng.permutation(train_idx), val_idx) for train_idx, val_idx in skf.split(X, y)]
+
+    if halving:
+        n_train = min(len(train_idx) for train_idx, _ in folds)
+        min_resources = max(2 * len(np.unique(y)), n_train // halving_factor ** 3)
+        schedule = _halving_schedule(len(candidates), n_train, halving_factor, min_resources)
+    else:
+        schedule = [None]
+
+    X_shm, X_spec = share_array(X)
+    y_shm, y_spec = share_array(y)
+    leaderboard = []
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(X_spec, y_spec, folds, seed)) as pool:
+            alive = list(enumerate(candidates))
+            for round_index, n_resources in enumerate(schedule):
+                tasks = [(cid, params, n_resources) for cid, params in alive]
+                chunksize = max(1, len(tasks) // (4 * n_jobs))
+                results = list(pool.map(_evaluate_candidate, tasks, chunksize=chunksize))
+                for result in results:
+                    result['round'] = round_index
+
+                results.sort(key=lambda r: (-r['mean_score'], r['candidate']))
+                leaderboard = results + [r for r in leaderboard if r['candidate'] not in
+                                         {res['candidate'] for res in results}]
+
+                if round_index + 1 < len(schedule):
+                    n_keep = max(1, math.ceil(len(results) / halving_factor))
+                    alive = [(r['candidate'], r['params']) for r in results[:n_keep]]
+    finally:
+        release([X_shm, y_shm])
+
+    best = leaderboard[0]
+    modelo = DecisionTreeClassifier(random_state=seed, **best['params'])
+    modelo.fit(X_train, y_train)
+
+    return modelo, leaderboard
+
+
+def leaderboard_to_frame(leaderboard):
+    """
+    Converte o leaderboard em DataFrame (uma coluna por hiperparametro)
+    """
+    import pandas as pd
+
+    rows = []
+    for rank, result in enumerate(leaderboard, start=1):
+        row = {'rank': rank, 'candidate': result['candidate'], 'round': result['round'],
+               'n_resources': result['n_resources'], 'mean_score': result['mean_score'],
+               'std_score': result['std_score'], 'fit_time_s': result['fit_time_s']}
+        row.update({f'param_{k}': v for k, v in result['params'].items()})
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Inferencia em varios processos com o modelo em memoria compartilhada
+
+O processo principal compila o modelo com o tree_engine e publica os arrays
+da arvore (ou das arvores do ensemble) uma unica vez em memoria
+compartilhada. Cada processo trabalhador se conecta a esses blocos pelo nome,
+sem copiar os arrays e sem desserializar o modelo, entao a memoria e o tempo
+de partida nao crescem com o tamanho do modelo.
+
+As medidas e as probabilidades tambem passam por memoria compartilhada: dois
+buffers reutilizados (entrada float32 e saida de probabilidades) com
+`buffer_rows` linhas. O lote e copiado para o buffer de entrada em janelas
+desse tamanho, cada trabalhador recebe so (inicio, tamanho) da sua parte
+contigua e escreve as probabilidades no buffer de saida, na ordem original.
+Nada do lote e serializado pelos pipes.
+
+Quando o pool e mais lento que prever no processo principal:
+- com menos nucleos livres que trabalhadores (com 1 nucleo, qualquer pool
+  e mais lento: os processos disputam a mesma CPU e ainda pagam a copia
+  para os buffers e a troca de mensagens);
+- em lotes pequenos, onde a ida e volta entre processos custa mais que a
+  previsao. Por isso lotes com menos de 2 * `min_rows_per_worker` linhas
+  sao previstos no proprio processo principal.
+Para uma arvore rasa, o percurso custa poucas dezenas de nanossegundos por
+linha; o ganho aparece em lotes grandes, em ensembles ou arvores fundas, e
+com um nucleo por trabalhador.
+
+O InferencePool se comporta como um modelo (predict_proba, predict, classes_,
+n_features_in_), entao pode ser usado no lugar dele em predict_with_confidence,
+score_stream e no PredictionCache. As previsoes sao identicas as do modelo.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import tree_engine
+from shared_arrays import attach_array, release, share_array
+
+# Abaixo disso o lote e previsto no processo principal
+DEFAULT_MIN_ROWS_PER_WORKER = 2048
+
+# Linhas dos buffers compartilhados de entrada e saida (lotes maiores passam em janelas)
+DEFAULT_BUFFER_ROWS = 1 << 18
+
+# Estado de cada processo trabalhador
+_worker = {}
+
+
+def _init_worker(specs, scalars, buffer_specs):
+    blocks = []
+    tree = dict(scalars)
+    for key, spec in specs.items():
+        shm, values = attach_array(spec)
+        blocks.append(shm)
+        tree[key] = values
+    buffers = {}
+    for key, spec in buffer_specs.items():
+        shm, values = attach_array(spec)
+        blocks.append(shm)
+        buffers[key] = values
+    _worker.update(blocks=blocks, tree=tree, **buffers)
+
+
+def _predict_part(start, length):
+    """
+    Preve as linhas [start, start + length) do buffer de entrada e escreve
+    as probabilidades no buffer de saida (executado no processo trabalhador)
+    """
+    stop = start + length
+    _worker['output'][start:stop] = tree_engine.predict_proba_batch(_worker['tree'], _worker['input'][start:stop])
+
+
+def _worker_ready(_):
+    return 'tree' in _worker
+
+
+class InferencePool:
+    """
+    Processos trabalhadores que preveem com a arvore compilada em memoria compartilhada
+
+    Args:
+        modelo: DecisionTreeClassifier ou TreeEnsembleClassifier treinado
+        species_map: Dicionario {codigo: nome_especie} (nomes exibidos em class_names)
+        n_workers: Numero de processos (padrao: nucleos disponiveis)
+        min_rows_per_worker: Linhas minimas por parte enviada a um trabalhador
+        buffer_rows: Linhas dos buffers compartilhados de entrada e saida
+    """
+
+    def __init__(self, modelo, species_map, n_workers=None,
+                 min_rows_per_worker=DEFAULT_MIN_ROWS_PER_WORKER, buffer_rows=DEFAULT_BUFFER_ROWS):
+        from classifier_interface import class_display_names
+        from hyperparameter_search import available_cores
+
+        self.n_workers = n_workers or available_cores()
+        self.min_rows_per_worker = max(1, min_rows_per_worker)
+        self.buffer_rows = max(1, buffer_rows)
+        self.tree = tree_engine.compile_model(modelo)
+        self.classes_ = np.asarray(modelo.classes_)
+        self.n_features_in_ = int(modelo.n_features_in_)
+        self.feature_names_in_ = getattr(modelo, 'feature_names_in_', None)
+        self.class_names = np.asarray(class_display_names(modelo, species_map), dtype=object)
+
+        shared = {key: value for key, value in self.tree.items() if isinstance(value, np.ndarray)}
+        scalars = {key: value for key, value in self.tree.items() if key not in shared}
+        value = self.tree['value']
+        buffers = {
+            'input': np.zeros((self.buffer_rows, self.n_features_in_), dtype=np.float32),
+            'output': np.zeros((self.buffer_rows, value.shape[1]), dtype=value.dtype),
+        }
+
+        self._blocks = []
+        specs, buffer_specs = {}, {}
+        try:
+            for key, values in shared.items():
+                shm, specs[key] = share_array(values)
+                self._blocks.append(shm)
+            for key, values in buffers.items():
+                shm, buffer_specs[key] = share_array(values)
+                self._blocks.append(shm)
+                buffers[key] = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+            self._executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_worker,
+                                                 initargs=(specs, scalars, buffer_specs))
+        except BaseException:
+            # Sem views apontando para os blocos, eles podem ser fechados
+            buffers.clear()
+            release(self._blocks)
+            raise
+
+        self._input, self._output = buffers['input'], buffers['output']
+        # Os buffers sao unicos: uma previsao por vez pelos trabalhadores
+        self._lock = threading.Lock()
+        self.shared_bytes = sum(values.nbytes for values in shared.values())
+        self.buffer_bytes = self._input.nbytes + self._output.nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def warm_up(self):
+        """
+        Inicia os trabalhadores agora, em vez de na primeira previsao
+        """
+        if not all(self._executor.map(_worker_ready, range(self.n_workers))):
+            raise RuntimeError("Trabalhador sem a arvore compartilhada.")
+
+    def predict_proba(self, X):
+        """
+        Probabilidades de cada amostra, com o lote dividido entre os trabalhadores
+
+        Returns:
+            Array (n_amostras, n_classes) na ordem de X, igual a modelo.predict_proba
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        if min(self.n_workers, len(X) // self.min_rows_per_worker) <= 1:
+            return tree_engine.predict_proba_batch(self.tree, X)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Esperado um array (n_amostras, {self.n_features_in_}), recebido {X.shape}.")
+
+        proba = np.empty((len(X), self._output.shape[1]), dtype=self._output.dtype)
+        with self._lock:
+            for start in range(0, len(X), self.buffer_rows):
+                stop = min(start + self.buffer_rows, len(X))
+                n_rows = stop - start
+                self._input[:n_rows] = X[start:stop]
+
+                # Partes contiguas do buffer; os trabalhadores so recebem (inicio, tamanho)
+                n_parts = max(1, min(self.n_workers, n_rows // self.min_rows_per_worker))
+                bounds = np.linspace(0, n_rows, n_parts + 1).astype(np.intp)
+                starts, lengths = bounds[:-1].tolist(), np.diff(bounds).tolist()
+                for _ in self._executor.map(_predict_part, starts, lengths):
+                    pass
+                proba[start:stop] = self._output[:n_rows]
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def close(self):
+        """
+        Encerra os trabalhadores e libera a memoria compartilhada
+        """
+        self._executor.shutdown(wait=True)
+        self._input = self._output = None
+        release(self._blocks)
+        self._blocks = []
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Mede a vazao da previsao em varios processos com o modelo em memoria compartilhada.')
+    parser.add_argument('--rows', type=float, default=1e6, help='Linhas sinteticas por lote (padrao: 1e6)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='Numeros de processos a medir (padrao: 1 2 4)')
+    parser.add_argument('--repeats', type=int, default=3, help='Lotes previstos por medida')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Compara a vazao para cada numero de processos e confere as previsoes com o modelo
+
+    Returns:
+        Codigo de saida (0 = sucesso)
+    """
+    from classifier_interface import load_classifier
+    from columnar_store import load_prepared
+
+    args = parse_args(argv)
+    modelo, species_map = load_classifier()
+    if modelo is None:
+        return 1
+
+    # Medidas sinteticas dentro da faixa de cada feature no conjunto de teste
+    X_test = load_prepared()[0]['X_test'].to_numpy(dtype=np.float64)
+    low, high = X_test.min(axis=0), X_test.max(axis=0)
+    rng = np.random.default_rng(42)
+    n_rows = int(args.rows)
+    X = (low + rng.random((n_rows, len(low))) * (high - low)).astype(np.float32)
+    expected = tree_engine.predict_proba_batch(tree_engine.compile_model(modelo), X)
+
+    print(f"{n_rows:,} linhas, {type(modelo).__name__} (com 1 processo, o lote e previsto no principal)")
+    print(f"  {'Processos':>9} {'Partida (s)':>12} {'Linhas/s':>14} {'Ganho':>7}")
+    base_rate = None
+    for n_workers in args.workers:
+        start = time.perf_counter()
+        with InferencePool(modelo, species_map, n_workers, min_rows_per_worker=1) as pool:
+            pool.warm_up()
+            startup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                result = pool.predict_proba(X)
+            rate = n_rows * args.repeats / (time.perf_counter() - start)
+
+        if not np.array_equal(result, expected):
+            print(f"ERRO: previsoes com {n_workers} processos diferem do modelo.")
+            return 1
+        base_rate = base_rate or rate
+        print(f"  {n_workers:>9} {startup:>12.3f} {rate:>14,.0f} {rate / base_rate:>6.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentacao das fases do pipeline: tempo, CPU, memoria e vazao
+
+Cada fase (e cada passo dentro dela, como read_csv, split, fit, predict e
+plot) e medida com um bloco `with`:
+
+    with instrumentation.step('fit', rows=len(X_train)):
+        modelo.fit(X_train, y_train)
+
+Para cada passo sao registrados tempo de relogio, tempo de CPU do processo,
+pico de memoria residente (RSS), pico de memoria alocada pelo Python
+(tracemalloc, opcional por ser mais lento) e linhas por segundo. Os passos
+podem ser aninhados; o pico de um passo inclui o dos passos internos.
+
+Os registros podem ser exportados em JSON e no formato texto do Prometheus.
+Opcionalmente, cada fase de primeiro nivel e executada sob o cProfile e o
+perfil e salvo em disco para localizar os pontos quentes.
+
+Enquanto nenhuma instrumentacao estiver ativa (activate), `step` nao mede
+nada e custa praticamente zero.
+"""
+
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Windows: sem getrusage, o pico de RSS so vem do /proc (quando existe)
+    resource = None
+
+METRICS_JSON_FILE = 'pipeline_metrics.json'
+METRICS_PROM_FILE = 'pipeline_metrics.prom'
+DEFAULT_PROFILE_DIR = 'profiles'
+PROFILE_TOP_FUNCTIONS = 15
+METRIC_PREFIX = 'iris_pipeline'
+
+# Instrumentacao usada por step(); None desliga as medidas
+_active = None
+
+
+def reset_peak_rss():
+    """
+    Zera o pico de RSS do processo (Linux); retorna False se nao for possivel
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Pico de memoria residente do processo em MB (None se a plataforma nao informa)
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss e em KB no Linux e em bytes no macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 ** 2 if sys.platform == 'darwin' else maxrss / 1024
+
+
+class Instrumentation:
+    """
+    Coleta as medidas dos passos do pipeline
+
+    Args:
+        trace_memory: Mede tambem o pico de memoria alocada pelo Python (tracemalloc)
+        profile: None desliga o cProfile; uma colecao vazia perfila todas as
+            fases de primeiro nivel; caso contrario, so as fases listadas
+        profile_dir: Diretorio dos arquivos .prof
+    """
+
+    def __init__(self, trace_memory=False, profile=None, profile_dir=DEFAULT_PROFILE_DIR):
+        self.trace_memory = trace_memory
+        self.profile = None if profile is None else set(profile)
+        self.profile_dir = profile_dir
+        self.records = []
+        self.profiles = {}
+        self._open = []
+        if peak_rss_mb() is None:
+            self.peak_rss_scope = 'unavailable'
+        else:
+            self.peak_rss_scope = 'step' if reset_peak_rss() else 'process'
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _fold_peaks(self):
+        """
+        Repassa os picos atuais a todos os passos abertos (antes de zerar os contadores)
+        """
+        rss = peak_rss_mb()
+        traced = tracemalloc.get_traced_memory()[1] / 1024 ** 2 if self.trace_memory else None
+        for record in self._open:
+            if rss is not None:
+                record['peak_rss_mb'] = max(record['peak_rss_mb'], rss)
+            if traced is not None:
+                record['peak_traced_mb'] = max(record['peak_traced_mb'], traced)
+
+    def _reset_peaks(self):
+        if self.peak_rss_scope == 'step':
+            reset_peak_rss()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+    def _should_profile(self, name):
+        return (self.profile is not None and not self._open
+                and (not self.profile or name in self.profile))
+
+    @contextlib.contextmanager
+    def step(self, name, rows=None):
+        """
+        Mede um passo; o dicionario retornado aceita `rows` depois de conhecido
+
+        Args:
+            name: Nome do passo
+            rows: Linhas processadas (para calcular linhas/s)
+        """
+        record = {
+            'name': name,
+            'stage': self._open[0]['name'] if self._open else name,
+            'path': '/'.join([r['name'] for r in self._open] + [name]),
+            'depth': len(self._open),
+            'status': 'ok',
+            'rows': rows,
+            'peak_rss_mb': None if self.peak_rss_scope == 'unavailable' else 0.0,
+            'peak_traced_mb': 0.0 if self.trace_memory else None,
+        }
+
+        profiler = cProfile.Profile() if self._should_profile(name) else None
+        self._fold_peaks()
+        self._reset_peaks()
+        self._open.append(record)
+        self.records.append(record)
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        except BaseException:
+            record['status'] = 'error'
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            self._fold_peaks()
+            self._open.pop()
+
+            rows = record['rows']
+            record['rows_per_s'] = rows / record['wall_s'] if rows and record['wall_s'] > 0 else None
+            if profiler is not None:
+                self._save_profile(name, profiler)
+
+    def record_cached(self, name):
+        """
+        Registra uma fase reaproveitada do cache (sem medidas)
+        """
+        self.records.append({
+            'name': name, 'stage': name, 'path': name, 'depth': 0, 'status': 'cached',
+            'rows': None, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows_per_s': None,
+            'peak_rss_mb': None, 'peak_traced_mb': None,
+        })
+
+    def _save_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        filename = os.path.join(self.profile_dir, f'{name}.prof')
+        profiler.dump_stats(filename)
+
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        self.profiles[name] = {'file': filename, 'top': report.getvalue()}
+
+    def to_dict(self):
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'peak_rss_scope': self.peak_rss_scope,
+            'trace_memory': self.trace_memory,
+            'steps': self.records,
+            'profiles': {name: info['file'] for name, info in self.profiles.items()},
+        }
+
+    def save_json(self, filename=METRICS_JSON_FILE):
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_filename, filename)
+
+    def to_prometheus(self):
+        """
+        Registros no formato texto de exposicao do Prometheus (metricas gauge)
+        """
+        metrics = [
+            ('wall_seconds', 'wall_s', 1, 'Tempo de relogio do passo'),
+            ('cpu_seconds', 'cpu_s', 1, 'Tempo de CPU do processo durante o passo'),
+            ('peak_rss_bytes', 'peak_rss_mb', 1024 ** 2, 'Pico de memoria residente durante o passo'),
+            ('peak_traced_bytes', 'peak_traced_mb', 1024 ** 2,
+             'Pico de memoria alocada pelo Python (tracemalloc) durante o passo'),
+            ('rows', 'rows', 1, 'Linhas processadas pelo passo'),
+            ('rows_per_second', 'rows_per_s', 1, 'Vazao do passo em linhas por segundo'),
+        ]
+
+        lines = []
+        for metric, key, scale, help_text in metrics:
+            samples = [r for r in self.records if r.get(key) is not None and r['status'] != 'cached']
+            if not samples:
+                continue
+            name = f'{METRIC_PREFIX}_{metric}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for r in samples:
+                step = r['path'].split('/', 1)[1] if r['depth'] else 'total'
+                labels = f'stage="{_escape_label(r["stage"])}",step="{_escape_label(step)}"'
+                lines.append(f'{name}{{{labels}}} {r[key] * scale:.9g}')
+
+        cached = [r for r in self.records if r['status'] == 'cached']
+        if cached:
+            name = f'{METRIC_PREFIX}_stage_cached'
+            lines.append(f'# HELP {name} 1 se a fase foi reaproveitada do cache')
+            lines.append(f'# TYPE {name} gauge')
+            for r in self.records:
+                if r['depth'] == 0:
+                    lines.append(f'{name}{{stage="{_escape_label(r["stage"])}"}} '
+                                 f'{int(r["status"] == "cached")}')
+
+        return '\n'.join(lines) + '\n'
+
+    def save_prometheus(self, filename=METRICS_PROM_FILE):
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_filename, filename)
+
+    def print_report(self):
+        """
+        Exibe uma tabela com as medidas de cada fase e passo
+        """
+        traced = ' Pico Py (MB)' if self.trace_memory else ''
+        print(f"  {'Fase / passo':<30} {'Tempo (s)':>10} {'CPU (s)':>9} {'Pico RSS (MB)':>14}"
+              f"{traced} {'Linhas/s':>12}")
+        for r in self.records:
+            label = '  ' * r['depth'] + r['name']
+            if r['status'] == 'cached':
+                print(f"  {label:<30} {'(cache)':>10}")
+                continue
+            rate = f"{r['rows_per_s']:,.0f}" if r['rows_per_s'] else '-'
+            traced_value = f" {r['peak_traced_mb']:>12.2f}" if self.trace_memory else ''
+            rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else 'indisponivel'
+            print(f"  {label:<30} {r['wall_s']:>10.4f} {r['cpu_s']:>9.4f} {rss:>14}"
+                  f"{traced_value} {rate:>12}")
+
+        for name, info in self.profiles.items():
+            print(f"\n--- Perfil (cProfile) da fase '{name}': {info['file']} ---")
+            print(info['top'])
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def activate(instrumentation):
+    """
+    Define a instrumentacao usada por step() (None desliga)
+    """
+    global _active
+    _active = instrumentation
+
+
+def active():
+    return _active
+
+
+def step(name, rows=None):
+    """
+    Mede um passo com a instrumentacao ativa (sem instrumentacao, nao faz nada)
+    """
+    if _active is None:
+        return contextlib.nullcontext({})
+    return _active.step(name, rows)
@@ -4,32 +4,49 @@ Main Pipeline - Classificador Iris
 Integra todos os modulos do projeto em um pipeline completo
 """
 
+import argparse
 import sys
 import os
 from datetime import datetime
 
+import numpy
+import pandas
+import sklearn
+
 # Importar modulos do projeto
+import columnar_store
 import data_loader
+import export_predictor
+import instrumentation
+import hyperparameter_search
+import model_bundle
 import model_trainer
 import model_evaluator
 import classifier_interface
+import shared_arrays
+import stage_cache
+import tree_engine
+import tree_ensemble
+import verbosity
+
+DATASET_FILE = 'iris.csv'
 
 
 def print_banner():
     """
     Exibe o banner inicial com titulo, equipe e informacoes do modelo
     """
-    print("\n" + "=" * 70)
-    print(" " * 15 + "CLASSIFICADOR IRIS - DECISION TREE")
-    print("=" * 70)
-    print("\nEquipe:")
-    print("  - Alexandre Tommasi")
-    print("  - Davi Rabelo")
-    print("\nModelo: Decision Tree Classifier")
-    print("Dataset: Iris (150 amostras, 3 classes)")
-    print("Objetivo: Classificar especies de flores Iris")
-    print("\nData de execucao:", datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
-    print("=" * 70 + "\n")
+    verbosity.say("\n" + "=" * 70)
+    verbosity.say(" " * 15 + "CLASSIFICADOR IRIS - DECISION TREE")
+    verbosity.say("=" * 70)
+    verbosity.say("\nEquipe:")
+    verbosity.say("  - Alexandre Tommasi")
+    verbosity.say("  - Davi Rabelo")
+    verbosity.say("\nModelo: Decision Tree Classifier")
+    verbosity.say("Dataset: Iris (150 amostras, 3 classes)")
+    verbosity.say("Objetivo: Classificar especies de flores Iris")
+    verbosity.say("\nData de execucao:", datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
+    verbosity.say("=" * 70 + "\n")
 
 
 def check_dataset_exists():
@@ -57,66 +74,86 @@ def execute_data_loading():
     Executa todas as funcoes do modulo data_loader
 
     Returns:
-        tuple: (X_train, X_test, y_train, y_test) ou None em caso de erro
+        tuple: (train_rows, test_rows), as posicoes das linhas de cada conjunto
     """
     try:
-        print("\n" + "#" * 70)
-        print("FASE 1: CARREGAMENTO E PREPARACAO DOS DADOS")
-        print("#" * 70 + "\n")
+        verbosity.say("\n" + "#" * 70)
+        verbosity.say("FASE 1: CARREGAMENTO E PREPARACAO DOS DADOS")
+        verbosity.say("#" * 70 + "\n")
 
         # Carregar dados do CSV
-        df = data_loader.load_iris_from_csv('iris.csv')
+        with instrumentation.step('read_csv') as medida:
+            df = data_loader.load_iris_from_csv('iris.csv')
+            medida['rows'] = len(df)
 
         # Converter especies para inteiros
-        df = data_loader.convert_species_to_int(df)
+        with instrumentation.step('encode', rows=len(df)):
+            df, species_map = data_loader.encode_species(df)
 
         # Explorar dados
-        data_loader.explore_data(df)
+        with instrumentation.step('explore', rows=len(df)):
+            data_loader.explore_data(df, species_map)
 
         # Dividir dados em treino e teste
-        X_train, X_test, y_train, y_test = data_loader.split_data(df)
+        with instrumentation.step('split', rows=len(df)):
+            train_rows, test_rows = data_loader.split_data(df)
 
-        # Salvar dados preparados
-        data_loader.save_data(X_train, X_test, y_train, y_test)
+        # Salvar dados preparados (fonte so se mudou; divisao como indices)
+        with instrumentation.step('save', rows=len(df)):
+            data_loader.save_data(df, train_rows, test_rows, species_map)
 
-        print("\n" + "#" * 70)
-        print("FASE 1 CONCLUIDA COM SUCESSO!")
-        print("#" * 70 + "\n")
+        verbosity.say("\n" + "#" * 70)
+        verbosity.say("FASE 1 CONCLUIDA COM SUCESSO!")
+        verbosity.say("#" * 70 + "\n")
 
-        return X_train, X_test, y_train, y_test
+        return train_rows, test_rows
 
     except Exception as e:
         print(f"\nERRO na Fase 1 (Carregamento de Dados): {e}")
         raise
 
 
-def execute_model_training():
+def execute_model_training(search=False, halving=False, ensemble=None, n_estimators=100):
     """
     Executa todas as funcoes do modulo model_trainer
 
+    Args:
+        search: Escolhe os hiperparametros por busca em validacao cruzada
+        halving: Usa successive halving na busca
+        ensemble: 'bagging' ou 'random' para treinar um ensemble (None = arvore unica)
+        n_estimators: Numero de arvores do ensemble
+
     Returns:
         tuple: (modelo, y_pred, accuracy) ou None em caso de erro
     """
     try:
-        print("\n" + "#" * 70)
-        print("FASE 2: TREINAMENTO DO MODELO")
-        print("#" * 70 + "\n")
+        verbosity.say("\n" + "#" * 70)
+        verbosity.say("FASE 2: TREINAMENTO DO MODELO")
+        verbosity.say("#" * 70 + "\n")
 
         # Carregar dados preparados
-        X_train, X_test, y_train, y_test, feature_names, species_map = model_trainer.load_prepared_data()
+        with instrumentation.step('load') as medida:
+            X_train, X_test, y_train, y_test, feature_names, species_map = model_trainer.load_prepared_data()
+            medida['rows'] = len(X_train) + len(X_test)
 
         # Treinar Decision Tree
-        modelo = model_trainer.train_decision_tree(X_train, y_train)
+        with instrumentation.step('fit', rows=len(X_train)):
+            if ensemble:
+                modelo = model_trainer.train_tree_ensemble(X_train, y_train, ensemble, n_estimators)
+            else:
+                modelo = model_trainer.train_decision_tree(X_train, y_train, search=search, halving=halving)
 
         # Avaliar modelo preliminarmente
-        y_pred = model_trainer.evaluate_preliminary(modelo, X_test, y_test, species_map)
+        with instrumentation.step('predict', rows=len(X_test)):
+            y_pred = model_trainer.evaluate_preliminary(modelo, X_test, y_test, species_map)
 
         # Salvar modelo
-        model_trainer.save_model(modelo, y_pred)
+        with instrumentation.step('save'):
+            model_trainer.save_model(modelo, y_pred, species_map, feature_names)
 
-        print("\n" + "#" * 70)
-        print("FASE 2 CONCLUIDA COM SUCESSO!")
-        print("#" * 70 + "\n")
+        verbosity.say("\n" + "#" * 70)
+        verbosity.say("FASE 2 CONCLUIDA COM SUCESSO!")
+        verbosity.say("#" * 70 + "\n")
 
         # Calcular acuracia para retornar
         from sklearn.metrics import accuracy_score
@@ -129,32 +166,49 @@ def execute_model_training():
         raise
 
 
-def execute_model_evaluation():
+def execute_model_evaluation(plot=True, plot_dpi=model_evaluator.DEFAULT_PLOT_DPI):
     """
     Executa todas as funcoes do modulo model_evaluator
 
+    As metricas sao calculadas em uma passada e salvas em JSON/CSV; a imagem
+    da matriz de confusao (opcional) e desenhada em uma thread de fundo.
+
+    Args:
+        plot: Desenha a matriz de confusao em PNG
+        plot_dpi: Resolucao da imagem
+
     Returns:
-        float: Acuracia final do modelo ou None em caso de erro
+        tuple: (acuracia final, Future do desenho ou None)
     """
     try:
-        print("\n" + "#" * 70)
-        print("FASE 3: AVALIACAO DO MODELO")
-        print("#" * 70 + "\n")
+        verbosity.say("\n" + "#" * 70)
+        verbosity.say("FASE 3: AVALIACAO DO MODELO")
+        verbosity.say("#" * 70 + "\n")
 
         # Carregar modelo e dados
-        X_test, y_test, model, species_map = model_evaluator.load_model_and_data()
+        with instrumentation.step('load') as medida:
+            X_test, y_test, model, species_map = model_evaluator.load_model_and_data()
+            medida['rows'] = len(X_test)
 
         # Avaliar modelo
-        y_pred, accuracy = model_evaluator.evaluate_model(model, X_test, y_test)
+        with instrumentation.step('predict', rows=len(X_test)):
+            y_pred, metrics = model_evaluator.evaluate_model(model, X_test, y_test, species_map)
 
-        # Criar matriz de confusao
-        model_evaluator.create_confusion_matrix(y_test, y_pred)
+        # Desenhar a matriz de confusao sem bloquear o pipeline
+        render = None
+        if plot:
+            verbosity.say("Gerando matriz de confusao em segundo plano...")
+            render = model_evaluator.start_confusion_matrix_render(metrics, dpi=plot_dpi)
 
-        print("\n" + "#" * 70)
-        print("FASE 3 CONCLUIDA COM SUCESSO!")
-        print("#" * 70 + "\n")
+        # Salvar metricas em JSON/CSV
+        with instrumentation.step('report', rows=len(y_test)):
+            model_evaluator.save_metrics(metrics)
 
-        return accuracy
+        verbosity.say("\n" + "#" * 70)
+        verbosity.say("FASE 3 CONCLUIDA COM SUCESSO!")
+        verbosity.say("#" * 70 + "\n")
+
+        return metrics['accuracy'], render
 
     except Exception as e:
         print(f"\nERRO na Fase 3 (Avaliacao do Modelo): {e}")
@@ -168,6 +222,10 @@ def ask_interactive_mode():
     Returns:
         bool: True se o usuario quer usar a interface, False caso contrario
     """
+    # Sem saida na tela (modo silencioso) nao faz sentido perguntar
+    if not verbosity.enabled(verbosity.SUMMARY):
+        return False
+
     print("\n" + "=" * 70)
     print("INTERFACE INTERATIVA")
     print("=" * 70)
@@ -187,13 +245,88 @@ def ask_interactive_mode():
             return False
 
 
-def print_final_summary(accuracy):
+def stage_keys(args):
+    """
+    Calcula as chaves de cache das tres fases do pipeline
+
+    Cada chave depende das entradas, dos parametros e do codigo da fase e da
+    chave da fase anterior, entao uma mudanca no inicio invalida as seguintes.
+    O codigo inclui os modulos do projeto importados pela fase, direta ou
+    indiretamente (ex: shared_arrays pelo hyperparameter_search).
+
+    Args:
+        args: Argumentos de linha de comando do pipeline
+
+    Returns:
+        dict: {nome_da_fase: chave}
+    """
+    versions = {
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+    data_key = stage_cache.stage_key(
+        'data_loading',
+        inputs=[DATASET_FILE],
+        params={'dataset': DATASET_FILE, **versions},
+        modules=[data_loader, columnar_store, verbosity]
+    )
+    training_key = stage_cache.stage_key(
+        'model_training',
+        params={'search': args.search, 'halving': args.halving, 'ensemble': args.ensemble,
+                'n_estimators': args.n_estimators, **versions},
+        modules=[model_trainer, hyperparameter_search, tree_ensemble, tree_engine,
+                 columnar_store, model_bundle, shared_arrays, verbosity],
+        upstream=[data_key]
+    )
+    evaluation_key = stage_cache.stage_key(
+        'model_evaluation',
+        params={'plot': not args.no_plot, 'plot_dpi': args.plot_dpi, **versions},
+        modules=[model_evaluator, columnar_store, data_loader, tree_engine,
+                 hyperparameter_search, shared_arrays, verbosity],
+        upstream=[training_key]
+    )
+
+    return {
+        'data_loading': data_key,
+        'model_training': training_key,
+        'model_evaluation': evaluation_key,
+    }
+
+
+def load_cached_stage(name, key, title, use_cache):
+    """
+    Procura uma fase no cache e avisa quando ela sera reaproveitada
+
+    Returns:
+        dict com os resultados salvos da fase, ou None se ela precisa ser executada
+    """
+    if not use_cache:
+        return None
+
+    result = stage_cache.lookup(name, key)
+    if result is not None:
+        verbosity.say("\n" + "#" * 70)
+        verbosity.say(f"{title}: REAPROVEITADA DO CACHE")
+        verbosity.say("#" * 70)
+        verbosity.say(f"\nEntradas, parametros e codigo inalterados (chave {key[:12]}).")
+        verbosity.say("Artefatos da execucao anterior mantidos.\n")
+    return result
+
+
+def print_final_summary(accuracy, cached_stages=(), medidas=None):
     """
     Exibe o resumo final da execucao do pipeline
 
     Args:
         accuracy: Acuracia final do modelo
+        cached_stages: Fases reaproveitadas do cache
+        medidas: Instrumentacao com tempo, memoria e vazao de cada fase
     """
+    if not verbosity.enabled(verbosity.SUMMARY):
+        return
+
     print("\n" + "=" * 70)
     print(" " * 20 + "RESUMO FINAL DA EXECUCAO")
     print("=" * 70)
@@ -203,22 +336,37 @@ def print_final_summary(accuracy):
 
     print("\n--- Arquivos Gerados ---")
     arquivos = [
-        ('prepared_data.pkl', 'Dados preprocessados (treino e teste)'),
+        ('prepared_data', 'Dados preprocessados (fonte float32 + divisao por indices)'),
         ('trained_model.pkl', 'Modelo Decision Tree treinado'),
-        ('matriz_confusao.png', 'Visualizacao da matriz de confusao')
+        ('model_bundle.pkl', 'Pacote de inferencia (modelo + mapa de especies)'),
+        (model_evaluator.METRICS_JSON_FILENAME, 'Metricas da avaliacao (tambem em CSV)'),
     ]
+    if os.path.exists(model_evaluator.CONFUSION_PNG_FILENAME):
+        arquivos.append((model_evaluator.CONFUSION_PNG_FILENAME, 'Visualizacao da matriz de confusao'))
+    if os.path.exists(export_predictor.DEFAULT_OUTPUT):
+        arquivos.append((export_predictor.DEFAULT_OUTPUT, 'Modulo de previsao sem dependencias'))
 
     for arquivo, descricao in arquivos:
         if os.path.exists(arquivo):
-            tamanho = os.path.getsize(arquivo)
+            if os.path.isdir(arquivo):
+                tamanho = columnar_store.store_size(arquivo)
+            else:
+                tamanho = os.path.getsize(arquivo)
             tamanho_kb = tamanho / 1024
             print(f"  {arquivo:<25} - {descricao} ({tamanho_kb:.2f} KB)")
         else:
             print(f"  {arquivo:<25} - {descricao} (NAO ENCONTRADO)")
 
+    if medidas is not None:
+        print("\n--- Desempenho por Fase ---")
+        medidas.print_report()
+        print(f"  Metricas exportadas em {instrumentation.METRICS_JSON_FILE} e "
+              f"{instrumentation.METRICS_PROM_FILE}")
+
     print("\n--- Estatisticas do Pipeline ---")
-    print(f"  Total de fases executadas: 3")
-    print(f"  Status: SUCESSO")
+    print(f"  Total de fases executadas: {3 - len(cached_stages)}")
+    print(f"  Fases reaproveitadas do cache: {len(cached_stages)}")
+    print("  Status: SUCESSO")
     print(f"  Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
 
     print("\n" + "=" * 70)
@@ -226,10 +374,51 @@ def print_final_summary(accuracy):
     print("=" * 70 + "\n")
 
 
-def main():
+def parse_args(argv=None):
+    """
+    Le os argumentos de linha de comando do pipeline
+    """
+    parser = argparse.ArgumentParser(description="Pipeline completo do classificador Iris")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Executa todas as fases, ignorando o cache de fases")
+    parser.add_argument('--search', action='store_true',
+                        help="Busca hiperparametros do Decision Tree com validacao cruzada em paralelo")
+    parser.add_argument('--halving', action='store_true',
+                        help="Usa successive halving na busca de hiperparametros")
+    parser.add_argument('--ensemble', choices=['bagging', 'random'], default=None,
+                        help="Treina um ensemble de arvores em paralelo em vez de uma unica arvore")
+    parser.add_argument('--n-estimators', type=int, default=100,
+                        help="Numero de arvores do ensemble")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Mede tambem o pico de memoria alocada pelo Python (tracemalloc, mais lento)")
+    parser.add_argument('--profile', nargs='*', default=None, metavar='FASE',
+                        choices=['data_loading', 'model_training', 'model_evaluation', 'export'],
+                        help="Executa as fases (todas, se nenhuma for dada) sob o cProfile e salva "
+                             f"os perfis em {instrumentation.DEFAULT_PROFILE_DIR}/")
+    parser.add_argument('--quiet', action='store_const', const='quiet', dest='verbosity',
+                        help="Nao exibe nada alem de erros (e do resumo JSON, se pedido)")
+    parser.add_argument('--verbosity', choices=list(verbosity.LEVEL_NAMES), default=None,
+                        help="Nivel de detalhe da saida (padrao: detailed, ou IRIS_VERBOSITY)")
+    parser.add_argument('--json-summary', action='store_true',
+                        help="Exibe ao final um resumo da execucao em JSON (uma linha)")
+    parser.add_argument('--no-plot', action='store_true',
+                        help="Nao desenha a matriz de confusao (metricas so em JSON/CSV; dispensa o matplotlib)")
+    parser.add_argument('--plot-dpi', type=int, default=model_evaluator.DEFAULT_PLOT_DPI,
+                        help=f"Resolucao da imagem da matriz de confusao (padrao: {model_evaluator.DEFAULT_PLOT_DPI})")
+    parser.add_argument('--export', action='store_true',
+                        help=f"Gera {export_predictor.DEFAULT_OUTPUT} (previsao sem dependencias) e confere no teste")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """
     Funcao principal que orquestra todo o pipeline
     """
+    args = parse_args(argv)
+    use_cache = not args.no_cache
+    if args.verbosity is not None:
+        verbosity.set_level(verbosity.LEVEL_NAMES[args.verbosity])
+
     # Exibir banner inicial
     print_banner()
 
@@ -237,14 +426,73 @@ def main():
     if not check_dataset_exists():
         sys.exit(1)
 
+    keys = stage_keys(args)
+    cached_stages = []
+
+    medidas = instrumentation.Instrumentation(trace_memory=args.trace_memory, profile=args.profile)
+    instrumentation.activate(medidas)
+
     # Fase 1: Carregamento e preparacao dos dados
-    X_train, X_test, y_train, y_test = execute_data_loading()
+    if load_cached_stage('data_loading', keys['data_loading'], "FASE 1", use_cache) is not None:
+        cached_stages.append('data_loading')
+        medidas.record_cached('data_loading')
+    else:
+        with instrumentation.step('data_loading'):
+            execute_data_loading()
+        stage_cache.store('data_loading', keys['data_loading'],
+                          artifacts=[columnar_store.PREPARED_DIR])
 
     # Fase 2: Treinamento do modelo
-    modelo, y_pred, accuracy_train = execute_model_training()
+    cached = load_cached_stage('model_training', keys['model_training'], "FASE 2", use_cache)
+    if cached is not None:
+        cached_stages.append('model_training')
+        medidas.record_cached('model_training')
+    else:
+        with instrumentation.step('model_training'):
+            modelo, y_pred, accuracy_train = execute_model_training(
+                args.search, args.halving, args.ensemble, args.n_estimators
+            )
+        stage_cache.store('model_training', keys['model_training'],
+                          artifacts=['trained_model.pkl', model_bundle.BUNDLE_FILENAME],
+                          result={'accuracy': float(accuracy_train)})
 
     # Fase 3: Avaliacao do modelo
-    accuracy_final = execute_model_evaluation()
+    cached = load_cached_stage('model_evaluation', keys['model_evaluation'], "FASE 3", use_cache)
+    if cached is not None:
+        cached_stages.append('model_evaluation')
+        medidas.record_cached('model_evaluation')
+        accuracy_final = cached['accuracy']
+    else:
+        with instrumentation.step('model_evaluation'):
+            accuracy_final, render = execute_model_evaluation(not args.no_plot, args.plot_dpi)
+
+    # Exportacao opcional do modelo para um modulo Python sem dependencias
+    if args.export:
+        verbosity.say("\n")
+        with instrumentation.step('export'):
+            if export_predictor.main([]) != 0:
+                raise RuntimeError("O modulo exportado nao reproduz o modelo treinado.")
+
+    # A imagem e desenhada enquanto as etapas acima rodam; a fase 3 so entra
+    # no cache depois que todos os seus artefatos existem
+    if 'model_evaluation' not in cached_stages:
+        evaluation_artifacts = [model_evaluator.METRICS_JSON_FILENAME, model_evaluator.REPORT_CSV_FILENAME,
+                                model_evaluator.CONFUSION_CSV_FILENAME]
+        if render is not None:
+            with instrumentation.step('plot_wait'):
+                png = model_evaluator.finish_confusion_matrix_render(render)
+            if png is None:
+                # Sem a imagem a fase nao entra no cache e e refeita na proxima execucao
+                evaluation_artifacts = None
+            else:
+                evaluation_artifacts.append(png)
+        if evaluation_artifacts is not None:
+            stage_cache.store('model_evaluation', keys['model_evaluation'],
+                              artifacts=evaluation_artifacts,
+                              result={'accuracy': float(accuracy_final)})
+
+    medidas.save_json(instrumentation.METRICS_JSON_FILE)
+    medidas.save_prometheus(instrumentation.METRICS_PROM_FILE)
 
     # Perguntar sobre interface interativa
     if ask_interactive_mode():
@@ -259,10 +507,17 @@ def main():
         print("INTERFACE INTERATIVA ENCERRADA")
         print("=" * 70)
     else:
-        print("\nInterface interativa nao sera executada.")
+        verbosity.say("\nInterface interativa nao sera executada.")
 
     # Exibir resumo final
-    print_final_summary(accuracy_final)
+    print_final_summary(accuracy_final, cached_stages, medidas)
+
+    if args.json_summary:
+        verbosity.record('pipeline.accuracy', float(accuracy_final))
+        verbosity.record('pipeline.cached_stages', cached_stages)
+        verbosity.record('pipeline.step_seconds',
+                         {r['path']: r['wall_s'] for r in medidas.records if r['status'] != 'cached'})
+        print(verbosity.summary_json())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Pacote de inferencia do classificador
+
+Um unico arquivo versionado com tudo o que a inferencia precisa (modelo,
+mapa de especies e nomes das features) e um checksum do modelo, para que
+classificar flores nao dependa de carregar os dados de treino e teste.
+"""
+
+import hashlib
+import os
+import pickle
+from datetime import datetime
+
+BUNDLE_FILENAME = 'model_bundle.pkl'
+BUNDLE_FORMAT_VERSION = 1
+
+
+def save_bundle(modelo, species_map, feature_names, filename=BUNDLE_FILENAME):
+    """
+    Salva o pacote de inferencia
+
+    Args:
+        modelo: Modelo treinado
+        species_map: Dicionario de mapeamento das especies
+        feature_names: Lista com os nomes das features
+        filename: Arquivo de destino
+
+    Returns:
+        Checksum SHA-256 do modelo serializado
+    """
+    model_bytes = pickle.dumps(modelo, protocol=pickle.HIGHEST_PROTOCOL)
+    checksum = hashlib.sha256(model_bytes).hexdigest()
+
+    bundle = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'checksum': checksum,
+        'model': model_bytes,
+        'species_map': dict(species_map),
+        'feature_names': list(feature_names),
+    }
+
+    # Troca atomica: quem observa o arquivo (model_registry) nunca le um pacote pela metade
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filename, filename)
+
+    return checksum
+
+
+def load_bundle(filename=BUNDLE_FILENAME):
+    """
+    Carrega o pacote de inferencia e confere versao e checksum
+
+    Args:
+        filename: Arquivo gerado por save_bundle
+
+    Returns:
+        Dicionario com 'modelo', 'species_map', 'feature_names', 'checksum',
+        'format_version' e 'created_at'
+    """
+    with open(filename, 'rb') as f:
+        bundle = pickle.load(f)
+
+    version = bundle.get('format_version')
+    if version != BUNDLE_FORMAT_VERSION:
+        raise ValueError(
+            f"Versao do pacote '{filename}' nao suportada: {version} "
+            f"(esperada {BUNDLE_FORMAT_VERSION})."
+        )
+
+    model_bytes = bundle['model']
+    if hashlib.sha256(model_bytes).hexdigest() != bundle['checksum']:
+        raise ValueError(f"Checksum invalido em '{filename}': o arquivo esta corrompido.")
+
+    return {
+        'modelo': pickle.loads(model_bytes),
+        'species_map': bundle['species_map'],
+        'feature_names': bundle['feature_names'],
+        'checksum': bundle['checksum'],
+        'format_version': version,
+        'created_at': bundle.get('created_at'),
+    }
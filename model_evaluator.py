@@ -1,113 +1,602 @@
+import argparse
+import csv
+import io
+import json
+import os
 import pickle
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
-def load_model_and_data():
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import RepeatedStratifiedKFold
+
+import tree_engine
+import verbosity
+from columnar_store import DEFAULT_VARIANT, iter_split_chunks, load_prepared
+from data_loader import DEFAULT_CSV_CHUNKSIZE, TARGET_COLUMN, iter_iris_csv_chunks
+from hyperparameter_search import available_cores
+from shared_arrays import attach_array, release, share_array
+
+CV_REPORT_FILENAME = 'cv_report.json'
+METRICS_JSON_FILENAME = 'evaluation_metrics.json'
+REPORT_CSV_FILENAME = 'classification_report.csv'
+CONFUSION_CSV_FILENAME = 'confusion_matrix.csv'
+CONFUSION_PNG_FILENAME = 'matriz_confusao.png'
+DEFAULT_PLOT_DPI = 150
+
+# Estado de cada processo trabalhador da validação cruzada
+_cv_worker = {}
+
+# Estado de cada processo trabalhador da avaliação em blocos
+_stream_worker = {}
+
+def load_trained_model():
     """
-    Carrega os dados de teste e o modelo treinado.
+    Carrega o modelo treinado.
     """
-    print("Carregando dados e modelo...")
-    with open('prepared_data.pkl', 'rb') as f:
-        data = pickle.load(f)
-        
     with open('trained_model.pkl', 'rb') as f:
         dados_modelo = pickle.load(f) 
-        model = dados_modelo['modelo'] 
+        return dados_modelo['modelo'] 
+
+def load_model_and_data(variant=DEFAULT_VARIANT):
+    """
+    Carrega os dados de teste (da variante de divisão indicada) e o modelo treinado.
+    """
+    verbosity.say("Carregando dados e modelo...")
+    data, prepared_path = load_prepared(variant=variant)
+
+    model = load_trained_model()
 
     X_test = data.get('X_test')
     y_test = data.get('y_test')
     species_map = data.get('species_map')
 
     if X_test is None or y_test is None or species_map is None:
-        raise ValueError("Arquivo 'prepared_data.pkl' não contém X_test, y_test ou species_map.")
+        raise ValueError(f"'{prepared_path}' não contém X_test, y_test ou species_map.")
 
     return X_test, y_test, model, species_map
 
-def evaluate_model(modelo, X_test, y_test):
+def class_labels(species_map):
+    """
+    Retorna os códigos das classes e os nomes exibidos (ex: 'Setosa') a partir do species_map.
+    """
+    labels_list = sorted(species_map)
+    names_list = [species_map[label].split('-')[-1].capitalize() for label in labels_list]
+    return labels_list, names_list
+
+def _label_positions(labels, values, kind):
+    """
+    Posição de cada rótulo em `labels` (ordenado); rótulos desconhecidos geram ValueError.
+    """
+    values = np.asarray(values)
+    # searchsorted devolve uma posição até para rótulos ausentes: confere o rótulo encontrado
+    positions = np.searchsorted(labels, values)
+    found = labels[np.minimum(positions, len(labels) - 1)] == values
+    if not found.all():
+        unknown = np.unique(values[~found])
+        raise ValueError(f"Rótulos {kind} fora das classes conhecidas {labels.tolist()}: {unknown.tolist()}")
+    return positions
+
+def confusion_counts(y_true, y_pred, labels):
     """
-    Calcula a acurácia e o relatório de classificação.
+    Matriz de confusão por contagem, em uma única passada (linhas: real, colunas: previsto).
     """
-    print("Avaliando modelo...")
+    labels = np.asarray(labels)
+    # Posição (real, previsto) -> índice plano da matriz
+    true_pos = _label_positions(labels, y_true, 'reais')
+    pred_pos = _label_positions(labels, y_pred, 'previstos')
+    cm = np.bincount(true_pos * len(labels) + pred_pos, minlength=len(labels) ** 2)
+    return cm.reshape(len(labels), len(labels))
+
+def compute_metrics(y_true, y_pred, species_map):
+    """
+    Calcula matriz de confusão, acurácia e precisão/recall/F1/suporte por classe.
+    """
+    labels_list, _ = class_labels(species_map)
+    return metrics_from_counts(confusion_counts(y_true, y_pred, labels_list), species_map)
+
+def metrics_from_counts(cm, species_map):
+    """
+    Monta o dicionário de métricas a partir de uma matriz de confusão já contada.
+
+    As médias macro e ponderada seguem as do classification_report do scikit-learn.
+    """
+    labels_list, names_list = class_labels(species_map)
+    cm = np.asarray(cm)
+    accuracy, precision, recall, f1 = metrics_from_confusion(cm)
+    support = cm.sum(axis=1)
+
+    per_class = np.column_stack([precision, recall, f1])
+    weights = support / support.sum() if support.sum() else np.zeros(len(support))
+    macro = per_class.mean(axis=0)
+    weighted = weights @ per_class
+
+    def averages(values):
+        return {'precision': float(values[0]), 'recall': float(values[1]),
+                'f1': float(values[2]), 'support': int(support.sum())}
+
+    return {
+        'labels': [int(label) for label in labels_list],
+        'class_names': names_list,
+        'n_samples': int(support.sum()),
+        'accuracy': float(accuracy),
+        'confusion_matrix': cm.tolist(),
+        'classes': {
+            name: {'precision': float(precision[i]), 'recall': float(recall[i]),
+                   'f1': float(f1[i]), 'support': int(support[i])}
+            for i, name in enumerate(names_list)
+        },
+        'macro_avg': averages(macro),
+        'weighted_avg': averages(weighted),
+    }
+
+def format_classification_report(metrics, digits=2):
+    """
+    Relatório de classificação em texto, no mesmo formato do scikit-learn.
+    """
+    headers = ['precision', 'recall', 'f1-score', 'support']
+    width = max(max(len(name) for name in metrics['class_names']), len('weighted avg'), digits)
+    row_fmt = '{:>{width}s} ' + ' {:>9.{digits}f}' * 3 + ' {:>9}\n'
+
+    report = ('{:>{width}s} ' + ' {:>9}' * len(headers)).format('', *headers, width=width) + '\n\n'
+    for name, values in metrics['classes'].items():
+        report += row_fmt.format(name, values['precision'], values['recall'], values['f1'],
+                                 values['support'], width=width, digits=digits)
+    report += '\n'
+    report += ('{:>{width}s} ' + ' {:>9}' * 2 + ' {:>9.{digits}f} {:>9}\n').format(
+        'accuracy', '', '', metrics['accuracy'], metrics['n_samples'], width=width, digits=digits)
+    for heading, key in (('macro avg', 'macro_avg'), ('weighted avg', 'weighted_avg')):
+        values = metrics[key]
+        report += row_fmt.format(heading, values['precision'], values['recall'], values['f1'],
+                                 values['support'], width=width, digits=digits)
+    return report
+
+def evaluate_model(modelo, X_test, y_test, species_map):
+    """
+    Prevê o conjunto de teste e calcula todas as métricas em uma passada.
+
+    Returns:
+        Previsões e dicionário de métricas (ver compute_metrics)
+    """
+    verbosity.say("Avaliando modelo...")
     y_pred = modelo.predict(X_test)
-    
-    accuracy = accuracy_score(y_test, y_pred)
-    
-    labels_list = [1, 2, 3]
-    target_names_list = ['Setosa', 'Versicolor', 'Virginica']
-    
-    report = classification_report(
-        y_test, 
-        y_pred, 
-        labels=labels_list, 
-        target_names=target_names_list
-    )
-    
-    print("\n--- Relatório de Classificação ---")
-    print(report)
-    print("----------------------------------")
-    
-    return y_pred, accuracy
-
-def create_confusion_matrix(y_test, y_pred):
-    """
-    Cria, salva e interpreta a matriz de confusão.
-    """
-    print("Gerando Matriz de Confusão...")
-    labels_list = [1, 2, 3]
-    display_labels = ['Setosa', 'Versicolor', 'Virginica']
-    
-    cm = confusion_matrix(y_test, y_pred, labels=labels_list)
-    
-    plt.figure(figsize=(8, 6))
-    ax = sns.heatmap(
-        cm, 
-        annot=False, 
-        fmt='d', 
-        cmap='Blues', 
-        xticklabels=display_labels, 
-        yticklabels=display_labels,
-        cbar=True 
-    )
-    
-    plt.title('Matriz de Confusão', fontsize=18)
-    plt.ylabel('Classe Verdadeira', fontsize=12)
-    plt.xlabel('Classe Prevista', fontsize=12)
+
+    metrics = compute_metrics(y_test, y_pred, species_map)
+    verbosity.record('evaluation.accuracy', metrics['accuracy'])
+    verbosity.record('evaluation.confusion_matrix', metrics['confusion_matrix'])
+
+    if verbosity.enabled(verbosity.DETAILED):
+        print("\n--- Relatório de Classificação ---")
+        print(format_classification_report(metrics))
+        print("----------------------------------")
+
+    return y_pred, metrics
+
+def _write_atomic(filename, text):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp_filename, filename)
+
+def save_metrics(metrics, json_filename=METRICS_JSON_FILENAME, report_csv=REPORT_CSV_FILENAME,
+                 confusion_csv=CONFUSION_CSV_FILENAME):
+    """
+    Salva as métricas em JSON e o relatório e a matriz de confusão em CSV.
+
+    Returns:
+        Lista com os arquivos gravados
+    """
+    _write_atomic(json_filename, json.dumps(metrics, indent=2, ensure_ascii=False))
+
+    rows = io.StringIO()
+    writer = csv.writer(rows, lineterminator='\n')
+    writer.writerow(['class', 'precision', 'recall', 'f1', 'support'])
+    for name, values in metrics['classes'].items():
+        writer.writerow([name, values['precision'], values['recall'], values['f1'], values['support']])
+    writer.writerow(['accuracy', '', '', metrics['accuracy'], metrics['n_samples']])
+    for heading, key in (('macro avg', 'macro_avg'), ('weighted avg', 'weighted_avg')):
+        values = metrics[key]
+        writer.writerow([heading, values['precision'], values['recall'], values['f1'], values['support']])
+    _write_atomic(report_csv, rows.getvalue())
+
+    rows = io.StringIO()
+    writer = csv.writer(rows, lineterminator='\n')
+    writer.writerow(['real/previsto'] + metrics['class_names'])
+    for name, counts in zip(metrics['class_names'], metrics['confusion_matrix']):
+        writer.writerow([name] + counts)
+    _write_atomic(confusion_csv, rows.getvalue())
+
+    files = [json_filename, report_csv, confusion_csv]
+    verbosity.record('artifacts.evaluation_metrics', files)
+    verbosity.say(f"Métricas salvas em {', '.join(repr(f) for f in files)}")
+    return files
+
+def render_confusion_matrix(metrics, filename=CONFUSION_PNG_FILENAME, dpi=DEFAULT_PLOT_DPI):
+    """
+    Desenha a matriz de confusão em PNG.
+
+    O matplotlib só é importado aqui, e com o backend Agg (sem tela). A figura
+    é criada sem o pyplot, que não é seguro fora da thread principal.
+
+    Returns:
+        Nome do arquivo gravado
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+
+    cm = np.asarray(metrics['confusion_matrix'])
+    names = metrics['class_names']
+
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    image = ax.imshow(cm, cmap='Blues', aspect='auto')
+    fig.colorbar(image, ax=ax)
+    ax.set_xticks(range(len(names)), names)
+    ax.set_yticks(range(len(names)), names)
+    ax.set_title('Matriz de Confusão', fontsize=18)
+    ax.set_ylabel('Classe Verdadeira', fontsize=12)
+    ax.set_xlabel('Classe Prevista', fontsize=12)
 
     thresh = cm.max() / 2.
-    
-
-    for i in range(cm.shape[0]):
-        for j in range(cm.shape[1]):
-            
-            ax.text(
-                j + 0.5,
-                i + 0.5, 
-                f"{cm[i, j]}", 
-                ha="center", 
-                va="center",
-                
-                color="white" if cm[i, j] > thresh else "black",
-                fontsize=16 # Tamanho da fonte
-            )
-    
-    plt.savefig('matriz_confusao.png', dpi=300, bbox_inches='tight')
-    print(f"Matriz de confusão salva como 'matriz_confusao.png'")
-
-    print("\n--- Interpretação da Matriz ---")
-    print("A diagonal principal (de cima-esquerda para baixo-direita) mostra os acertos.")
-    print("Valores fora da diagonal indicam classificações incorretas (erros).")
-    print("-------------------------------")
+    for (i, j), count in np.ndenumerate(cm):
+        ax.text(j, i, f"{count}", ha="center", va="center", fontsize=16,
+                color="white" if count > thresh else "black")
+
+    tmp_filename = filename + '.tmp.png'
+    fig.savefig(tmp_filename, dpi=dpi, bbox_inches='tight')
+    os.replace(tmp_filename, filename)
+    return filename
+
+def start_confusion_matrix_render(metrics, filename=CONFUSION_PNG_FILENAME, dpi=DEFAULT_PLOT_DPI):
+    """
+    Desenha a matriz de confusão em uma thread de fundo, sem bloquear o pipeline.
+
+    Returns:
+        Future com o nome do arquivo gravado; result() relança o erro, se houver
+        (ImportError quando o matplotlib não está instalado)
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plot')
+    future = executor.submit(render_confusion_matrix, metrics, filename, dpi)
+    executor.shutdown(wait=False)
+    return future
+
+def finish_confusion_matrix_render(future):
+    """
+    Espera o desenho da matriz de confusão e informa o resultado.
+
+    Returns:
+        Nome do arquivo gravado, ou None se o desenho falhou
+    """
+    try:
+        filename = future.result()
+    except ImportError:
+        print("Aviso: matplotlib não instalado; matriz de confusão não desenhada (métricas salvas em JSON/CSV).")
+        return None
+    except Exception as e:
+        print(f"Aviso: não foi possível desenhar a matriz de confusão: {e}")
+        return None
+
+    verbosity.record('artifacts.confusion_matrix_png', filename)
+    verbosity.say(f"Matriz de confusão salva como '{filename}'")
+    verbosity.say("\n--- Interpretação da Matriz ---", level=verbosity.DETAILED)
+    verbosity.say("A diagonal principal (de cima-esquerda para baixo-direita) mostra os acertos.", level=verbosity.DETAILED)
+    verbosity.say("Valores fora da diagonal indicam classificações incorretas (erros).", level=verbosity.DETAILED)
+    verbosity.say("-------------------------------", level=verbosity.DETAILED)
+    return filename
+
+def metrics_from_confusion(cm):
+    """
+    Calcula acurácia e precisão/recall/F1 por classe a partir da matriz de confusão.
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    tp = np.diag(cm)
+    predicted = cm.sum(axis=0)
+    actual = cm.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(actual > 0, tp / actual, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    total = cm.sum()
+    accuracy = tp.sum() / total if total else 0.0
+    return accuracy, precision, recall, f1
+
+def mean_confidence_interval(values, confidence=0.95):
+    """
+    Média e meia-largura do intervalo de confiança (distribuição t) de uma amostra.
+    """
+    from scipy import stats
+
+    values = np.asarray(values, dtype=np.float64)
+    mean = values.mean(axis=0)
+    if len(values) < 2:
+        return mean, np.zeros_like(mean)
+    sem = values.std(axis=0, ddof=1) / np.sqrt(len(values))
+    return mean, sem * stats.t.ppf((1 + confidence) / 2, len(values) - 1)
+
+def load_full_dataset():
+    """
+    Junta treino e teste dos dados preparados para a validação cruzada.
+    """
+    data, prepared_path = load_prepared()
+    X = np.concatenate([np.asarray(data['X_train']), np.asarray(data['X_test'])])
+    y = np.concatenate([np.asarray(data['y_train']), np.asarray(data['y_test'])])
+    return X, y, data['species_map']
+
+def _init_cv_worker(X_spec, y_spec, folds, estimator, labels):
+    X_shm, X = attach_array(X_spec)
+    y_shm, y = attach_array(y_spec)
+    _cv_worker.update(blocks=[X_shm, y_shm], X=X, y=y, folds=folds,
+                      estimator=estimator, labels=np.asarray(labels))
+
+def _run_cv_fold(fold_id):
+    """
+    Treina e avalia um fold (executado no processo trabalhador).
+    """
+    start = time.perf_counter()
+    X, y, labels = _cv_worker['X'], _cv_worker['y'], _cv_worker['labels']
+    train_idx, test_idx = _cv_worker['folds'][fold_id]
+
+    modelo = clone(_cv_worker['estimator'])
+    modelo.fit(X[train_idx], y[train_idx])
+    fit_time = time.perf_counter() - start
+    y_pred = modelo.predict(X[test_idx])
+
+    return {
+        'fold': fold_id,
+        'confusion_matrix': confusion_counts(y[test_idx], y_pred, labels),
+        'fit_time_s': fit_time,
+        'wall_time_s': time.perf_counter() - start,
+    }
+
+def cross_validate_model(modelo, X, y, species_map, n_splits=5, n_repeats=3,
+                         n_jobs=None, seed=42, confidence=0.95):
+    """
+    Validação cruzada estratificada repetida, com os folds rodando em paralelo.
+
+    Cada fold treina uma cópia não treinada de `modelo` (mesmos hiperparâmetros).
+    Os dados são publicados uma vez em memória compartilhada para os processos.
+    Os intervalos de confiança tratam os folds como independentes, o que os
+    torna um pouco otimistas na validação cruzada repetida.
+    """
+    n_jobs = n_jobs or available_cores()
+    labels_list, names_list = class_labels(species_map)
+
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.ascontiguousarray(y)
+    cv = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=seed)
+    folds = list(cv.split(X, y))
+
+    verbosity.say(f"Validação cruzada: {n_repeats}x {n_splits} folds ({len(folds)} ajustes) em {n_jobs} processos...")
+
+    X_shm, X_spec = share_array(X)
+    y_shm, y_spec = share_array(y)
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_cv_worker,
+                                 initargs=(X_spec, y_spec, folds, clone(modelo), labels_list)) as pool:
+            results = list(pool.map(_run_cv_fold, range(len(folds))))
+    finally:
+        release([X_shm, y_shm])
+    total_time = time.perf_counter() - start
+
+    per_fold = [metrics_from_confusion(r['confusion_matrix']) for r in results]
+    accuracy = mean_confidence_interval([m[0] for m in per_fold], confidence)
+    precision = mean_confidence_interval([m[1] for m in per_fold], confidence)
+    recall = mean_confidence_interval([m[2] for m in per_fold], confidence)
+    f1 = mean_confidence_interval([m[3] for m in per_fold], confidence)
+    cm_total = np.sum([r['confusion_matrix'] for r in results], axis=0)
+
+    fold_times = np.array([r['wall_time_s'] for r in results])
+    report = {
+        'n_splits': n_splits,
+        'n_repeats': n_repeats,
+        'n_jobs': n_jobs,
+        'confidence': confidence,
+        'accuracy': {'mean': float(accuracy[0]), 'ci': float(accuracy[1])},
+        'classes': {
+            name: {
+                'precision': {'mean': float(precision[0][i]), 'ci': float(precision[1][i])},
+                'recall': {'mean': float(recall[0][i]), 'ci': float(recall[1][i])},
+                'f1': {'mean': float(f1[0][i]), 'ci': float(f1[1][i])},
+            }
+            for i, name in enumerate(names_list)
+        },
+        'confusion_matrix_total': cm_total.tolist(),
+        'confusion_matrix_mean': (cm_total / n_repeats).tolist(),
+        'labels': [int(label) for label in labels_list],
+        'fold_times_s': fold_times.tolist(),
+        'total_time_s': total_time,
+    }
+
+    verbosity.record('cv.accuracy_mean', report['accuracy']['mean'])
+    verbosity.record('cv.accuracy_ci', report['accuracy']['ci'])
+    verbosity.record('cv.total_seconds', total_time)
+
+    verbosity.say(f"\n--- Validação Cruzada ({confidence:.0%} de confiança) ---")
+    verbosity.say(f"Acurácia: {accuracy[0]:.4f} ± {accuracy[1]:.4f}")
+    if verbosity.enabled(verbosity.DETAILED):
+        print(f"\n{'':>12} {'precision':>18} {'recall':>18} {'f1-score':>18}")
+        for i, name in enumerate(names_list):
+            print(f"{name:>12} {precision[0][i]:>10.4f} ± {precision[1][i]:.3f} "
+                  f"{recall[0][i]:>10.4f} ± {recall[1][i]:.3f} {f1[0][i]:>10.4f} ± {f1[1][i]:.3f}")
+        print("\nMatriz de confusão somada nos folds (linhas: real, colunas: previsto):")
+        print(cm_total)
+    verbosity.say(f"\nTempo por fold: média {fold_times.mean() * 1000:.1f} ms, máximo {fold_times.max() * 1000:.1f} ms")
+    verbosity.say(f"Tempo total: {total_time:.2f}s ({fold_times.sum() / total_time:.2f}x de paralelismo efetivo)")
+    verbosity.say("------------------------------------------")
+
+    return report
+
+def iter_labeled_chunks(source=None, species_map=None, feature_names=None,
+                        chunk_size=DEFAULT_CSV_CHUNKSIZE, variant=DEFAULT_VARIANT):
+    """
+    Lê amostras rotuladas em blocos, sem carregar o conjunto inteiro na memória.
+
+    Args:
+        source: CSV com as medidas e a coluna 'species' (nomes das espécies), ou
+            None para o conjunto de teste dos dados preparados (linhas reunidas
+            da fonte bloco a bloco)
+        species_map: Dicionário {código: nome_especie}, para converter a coluna do CSV
+        feature_names: Colunas das medidas, na ordem usada no treino
+        chunk_size: Linhas por bloco
+        variant: Variante de divisão dos dados preparados
+
+    Yields:
+        (X, y): medidas float32 e códigos das classes de cada bloco
+    """
+    if source is None:
+        yield from iter_split_chunks('test', chunk_size, columns=feature_names, variant=variant)
+        return
+
+    codes = {name: code for code, name in species_map.items()}
+    for chunk in iter_iris_csv_chunks(source, chunk_size, usecols=list(feature_names) + [TARGET_COLUMN]):
+        # Converte pelas categorias do bloco; o -1 extra recebe os valores ausentes
+        species = chunk[TARGET_COLUMN].array
+        lookup = np.array([codes.get(name, -1) for name in species.categories] + [-1])
+        y = lookup[species.codes]
+        if (y < 0).any():
+            unknown = sorted(set(chunk[TARGET_COLUMN][y < 0].astype(str)))
+            raise ValueError(f"Espécies fora do species_map em '{source}': {unknown}")
+        yield chunk[list(feature_names)].to_numpy(dtype=np.float32), y
+
+def _init_stream_worker(tree, labels):
+    _stream_worker.update(tree=tree, labels=np.asarray(labels))
+
+def _count_chunk(X, y):
+    """
+    Prevê um bloco e conta sua matriz de confusão parcial.
+    """
+    predictions = tree_engine.predict_batch(_stream_worker['tree'], X)
+    return confusion_counts(y, predictions, _stream_worker['labels'])
+
+def evaluate_stream(modelo, chunks, species_map, n_jobs=1):
+    """
+    Avaliação fora da memória: prevê bloco a bloco e acumula a matriz de confusão.
+
+    Entre os blocos só a matriz de confusão (classes x classes) é mantida; as
+    métricas saem das contagens acumuladas no final. Com n_jobs > 1 os blocos
+    são previstos em processos trabalhadores e as matrizes parciais somadas,
+    com no máximo 2 * n_jobs blocos em trânsito. A previsão usa o tree_engine,
+    idêntico ao modelo.predict.
+
+    Args:
+        modelo: Modelo treinado (árvore ou ensemble)
+        chunks: Iterável de (X, y), como o de iter_labeled_chunks
+        species_map: Dicionário {código: nome_especie}
+        n_jobs: Processos de previsão (1 = no próprio processo)
+
+    Returns:
+        Dicionário de métricas (ver metrics_from_counts)
+    """
+    labels_list, _ = class_labels(species_map)
+    tree = tree_engine.compile_model(modelo)
+    cm = np.zeros((len(labels_list), len(labels_list)), dtype=np.int64)
+    n_chunks = 0
+
+    verbosity.say(f"Avaliação em blocos com {n_jobs} processo(s)...")
+    start = time.perf_counter()
+    if n_jobs <= 1:
+        _init_stream_worker(tree, labels_list)
+        for X, y in chunks:
+            cm += _count_chunk(X, y)
+            n_chunks += 1
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_stream_worker,
+                                 initargs=(tree, labels_list)) as pool:
+            pending = set()
+            for X, y in chunks:
+                if len(pending) >= 2 * n_jobs:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        cm += future.result()
+                pending.add(pool.submit(_count_chunk, X, y))
+                n_chunks += 1
+            for future in pending:
+                cm += future.result()
+    total_time = time.perf_counter() - start
+
+    metrics = metrics_from_counts(cm, species_map)
+    verbosity.record('evaluation.accuracy', metrics['accuracy'])
+    verbosity.record('evaluation.confusion_matrix', metrics['confusion_matrix'])
+    verbosity.record('evaluation.stream_chunks', n_chunks)
+
+    rate = metrics['n_samples'] / total_time if total_time > 0 else 0.0
+    verbosity.say(f"{metrics['n_samples']:,} amostras em {n_chunks} bloco(s), "
+                  f"{total_time:.2f}s ({rate:,.0f} amostras/s)")
+    if verbosity.enabled(verbosity.DETAILED):
+        print("\n--- Relatório de Classificação ---")
+        print(format_classification_report(metrics))
+        print("----------------------------------")
+
+    return metrics
+
+def parse_args(argv=None):
+    """
+    Lê os argumentos de linha de comando da avaliação.
+    """
+    parser = argparse.ArgumentParser(description="Avaliação do classificador Iris")
+    parser.add_argument('--cv', action='store_true',
+                        help="Avalia com validação cruzada estratificada repetida")
+    parser.add_argument('--folds', type=int, default=5, help="Número de folds")
+    parser.add_argument('--repeats', type=int, default=3, help="Número de repetições")
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help="Processos (padrão: todos os núcleos disponíveis)")
+    parser.add_argument('--stream', nargs='?', const='', default=None, metavar='CSV',
+                        help="Avalia em blocos lidos do disco, acumulando a matriz de confusão "
+                             "(CSV rotulado com a coluna 'species'; sem arquivo, o teste dos dados preparados)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CSV_CHUNKSIZE,
+                        help=f"Linhas por bloco em --stream (padrão: {DEFAULT_CSV_CHUNKSIZE})")
+    parser.add_argument('--no-plot', action='store_true',
+                        help="Não desenha a matriz de confusão (só métricas em JSON/CSV)")
+    parser.add_argument('--plot-dpi', type=int, default=DEFAULT_PLOT_DPI,
+                        help=f"Resolução da imagem da matriz de confusão (padrão: {DEFAULT_PLOT_DPI})")
+    parser.add_argument('--variant', default=DEFAULT_VARIANT,
+                        help=f"Variante de divisão dos dados preparados (padrão: '{DEFAULT_VARIANT}')")
+    args = parser.parse_args(argv)
+    if args.cv and args.stream is not None:
+        parser.error("--cv e --stream não podem ser usados juntos")
+    return args
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        X_test, y_test, model, _ = load_model_and_data()
-        y_pred, final_accuracy = evaluate_model(model, X_test, y_test)
-        create_confusion_matrix(y_test, y_pred)
-        
-        print(f"\n✅ Acurácia Final do Modelo: {final_accuracy:.4f}")
+        if args.stream is None:
+            X_test, y_test, model, species_map = load_model_and_data(args.variant)
+
+        if args.cv:
+            X, y, species_map = load_full_dataset()
+            report = cross_validate_model(model, X, y, species_map, args.folds, args.repeats, args.n_jobs)
+            with open(CV_REPORT_FILENAME, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"Relatório salvo em '{CV_REPORT_FILENAME}'")
+        elif args.stream is not None:
+            # Sem reunir o conjunto de teste inteiro: os blocos saem direto da fonte
+            model = load_trained_model()
+            data, _ = load_prepared(variant=args.variant)
+            species_map = data['species_map']
+            chunks = iter_labeled_chunks(args.stream or None, species_map, data['feature_names'],
+                                         args.chunk_size, args.variant)
+            metrics = evaluate_stream(model, chunks, species_map, args.n_jobs or available_cores())
+            save_metrics(metrics)
+            if not args.no_plot:
+                finish_confusion_matrix_render(start_confusion_matrix_render(metrics, dpi=args.plot_dpi))
+
+            print(f"\n✅ Acurácia Final do Modelo: {metrics['accuracy']:.4f}")
+        else:
+            y_pred, metrics = evaluate_model(model, X_test, y_test, species_map)
+            render = None if args.no_plot else start_confusion_matrix_render(metrics, dpi=args.plot_dpi)
+            save_metrics(metrics)
+            if render is not None:
+                verbosity.say("Gerando Matriz de Confusão...")
+                finish_confusion_matrix_render(render)
+
+            print(f"\n✅ Acurácia Final do Modelo: {metrics['accuracy']:.4f}")
         
     except FileNotFoundError:
-        print("Erro: Arquivos 'prepared_data.pkl' ou 'trained_model.pkl' não encontrados.")
+        print("Erro: Dados preparados ('prepared_data/') ou 'trained_model.pkl' não encontrados.")
     except Exception as e:
         print(f"Ocorreu um erro: {e}")
\ No newline at end of file
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de modelos com troca a quente para processos de inferencia longos
+
+Mantem varias versoes do pacote de inferencia (model_bundle.pkl) na memoria,
+identificadas pelo checksum do modelo. Um observador em segundo plano percebe
+quando o treinamento grava um pacote novo, carrega e valida esse pacote fora
+do caminho de previsao e so entao o torna ativo.
+
+A troca e a atribuicao de uma unica referencia: quem preve le `active()` uma
+vez por lote e usa esse pacote do inicio ao fim, sem lock no caminho de
+previsao. As versoes anteriores continuam carregadas para rollback.
+
+Opcionalmente, uma segunda versao pode receber uma fracao do trafego como
+sombra: ela preve as mesmas amostras em uma thread separada, sem afetar a
+resposta, e o registro conta quantas previsoes concordam com a versao ativa.
+"""
+
+import os
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import tree_engine
+from classifier_interface import class_display_names
+from model_bundle import BUNDLE_FILENAME, load_bundle
+
+DEFAULT_MAX_VERSIONS = 3
+DEFAULT_WATCH_INTERVAL = 1.0
+# Prefixo do checksum usado como identificador da versao
+VERSION_ID_LENGTH = 12
+
+
+def validate_bundle(bundle, X=None, y=None, min_accuracy=None):
+    """
+    Confere se um pacote pode atender previsoes antes de ativa-lo
+
+    Args:
+        bundle: Pacote carregado por load_bundle
+        X: Amostras de verificacao (opcional)
+        y: Classes esperadas de X, para conferir a acuracia (opcional)
+        min_accuracy: Acuracia minima em (X, y) (None nao confere)
+
+    Raises:
+        ValueError: Se o pacote for inconsistente ou prever mal
+    """
+    modelo = bundle['modelo']
+    feature_names = list(bundle['feature_names'])
+
+    if not hasattr(modelo, 'predict_proba') or not hasattr(modelo, 'classes_'):
+        raise ValueError("O modelo do pacote nao esta treinado.")
+    if int(modelo.n_features_in_) != len(feature_names):
+        raise ValueError(f"O modelo espera {modelo.n_features_in_} medidas, "
+                         f"o pacote declara {len(feature_names)}.")
+    unknown = [int(c) for c in modelo.classes_ if c not in bundle['species_map']]
+    if unknown:
+        raise ValueError(f"Classes do modelo sem especie no species_map: {unknown}")
+
+    if X is None:
+        return
+    probabilities = np.asarray(modelo.predict_proba(X))
+    if probabilities.shape != (len(X), len(modelo.classes_)) or not np.all(np.isfinite(probabilities)):
+        raise ValueError("Previsoes invalidas nas amostras de verificacao.")
+    if not np.allclose(probabilities.sum(axis=1), 1.0):
+        raise ValueError("As probabilidades previstas nao somam 1.")
+
+    if y is not None and min_accuracy is not None:
+        accuracy = float(np.mean(np.asarray(modelo.classes_)[probabilities.argmax(axis=1)] == np.asarray(y)))
+        if accuracy < min_accuracy:
+            raise ValueError(f"Acuracia de verificacao {accuracy:.4f} abaixo do minimo {min_accuracy:.4f}.")
+
+
+class ModelRegistry:
+    """
+    Versoes carregadas do pacote de inferencia, com uma versao ativa
+
+    Args:
+        filename: Pacote observado (gravado pelo treinamento)
+        max_versions: Numero maximo de versoes mantidas na memoria
+        validation_X: Amostras usadas para validar cada versao nova (opcional)
+        validation_y: Classes de validation_X (opcional)
+        min_accuracy: Acuracia minima em (validation_X, validation_y)
+    """
+
+    def __init__(self, filename=BUNDLE_FILENAME, max_versions=DEFAULT_MAX_VERSIONS,
+                 validation_X=None, validation_y=None, min_accuracy=None):
+        self.filename = filename
+        self.max_versions = max(2, max_versions)
+        self.validation_X = validation_X
+        self.validation_y = validation_y
+        self.min_accuracy = min_accuracy
+
+        self.swaps = 0
+        self.rejected = 0
+        self.last_error = None
+
+        self._versions = OrderedDict()
+        self._history = []
+        # Lidos sem lock no caminho de previsao; trocados inteiros com o lock
+        self._active = None
+        self._shadow = None
+        self.shadow_fraction = 0.0
+        self._lock = threading.Lock()
+
+        self._file_state = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self._shadow_executor = None
+        self._shadow_stats = {'batches': 0, 'samples': 0, 'agreements': 0, 'errors': 0}
+
+    # --- Versoes ---------------------------------------------------------
+
+    def _prepare(self, bundle, source):
+        """
+        Valida o pacote e acrescenta o que as previsoes precisam (fora do lock)
+        """
+        validate_bundle(bundle, self.validation_X, self.validation_y, self.min_accuracy)
+        bundle = dict(bundle)
+        bundle['version'] = bundle['checksum'][:VERSION_ID_LENGTH]
+        bundle['class_names'] = class_display_names(bundle['modelo'], bundle['species_map'])
+        # Previsoes pela arvore compilada: identicas ao modelo, sem a validacao do sklearn
+        # (que avisaria a cada lote sem nomes de features)
+        bundle['scorer'] = tree_engine.CompiledModel(bundle['modelo'])
+        bundle['source'] = source
+        bundle['loaded_at'] = datetime.now().isoformat(timespec='seconds')
+        return bundle
+
+    def load(self, filename=None, activate=True):
+        """
+        Carrega, valida e registra um pacote; opcionalmente o torna ativo
+
+        Returns:
+            Identificador da versao
+        """
+        filename = filename or self.filename
+        bundle = self._prepare(load_bundle(filename), filename)
+        return self.register(bundle, activate)
+
+    def register(self, bundle, activate=True):
+        """
+        Registra um pacote ja preparado (ou apenas o reativa, se ja conhecido)
+        """
+        version = bundle['version']
+        with self._lock:
+            if version not in self._versions:
+                self._versions[version] = bundle
+            if activate:
+                self._activate(version)
+            self._evict()
+        return version
+
+    def _activate(self, version):
+        if self._active is not None and self._active['version'] == version:
+            return
+        self._active = self._versions[version]
+        self._history.append(version)
+        self.swaps += 1
+
+    def _evict(self):
+        """
+        Descarta as versoes mais antigas que nao estao em uso nem sao alvo de rollback
+        """
+        protected = {v['version'] for v in (self._active, self._shadow) if v is not None}
+        protected.update(self._history[-2:])
+        for version in list(self._versions):
+            if len(self._versions) <= self.max_versions:
+                break
+            if version not in protected:
+                del self._versions[version]
+                self._history = [v for v in self._history if v != version]
+
+    def activate(self, version):
+        """
+        Torna ativa uma versao ja carregada
+        """
+        with self._lock:
+            if version not in self._versions:
+                raise KeyError(f"Versao '{version}' nao carregada.")
+            self._activate(version)
+
+    def rollback(self):
+        """
+        Volta para a versao ativa anterior
+
+        Returns:
+            Identificador da versao reativada
+        """
+        with self._lock:
+            if len(self._history) < 2:
+                raise ValueError("Nao ha versao anterior para o rollback.")
+            self._history.pop()
+            previous = self._history[-1]
+            self._active = self._versions[previous]
+            self.swaps += 1
+            return previous
+
+    def active(self):
+        """
+        Pacote ativo (leitura sem lock; use o mesmo pacote durante todo o lote)
+        """
+        bundle = self._active
+        if bundle is None:
+            raise RuntimeError("Nenhum modelo ativo no registro.")
+        return bundle
+
+    def versions(self):
+        with self._lock:
+            return list(self._versions)
+
+    # --- Observador de artefatos ------------------------------------------
+
+    def _current_file_state(self):
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def check_for_update(self):
+        """
+        Carrega o pacote observado se o arquivo mudou desde a ultima verificacao
+
+        Um pacote invalido e rejeitado e a versao ativa continua atendendo.
+
+        Returns:
+            Identificador da nova versao ativa, ou None se nada mudou
+        """
+        state = self._current_file_state()
+        if state is None or state == self._file_state:
+            return None
+        self._file_state = state
+
+        try:
+            bundle = self._prepare(load_bundle(self.filename), self.filename)
+        except Exception as e:
+            self.rejected += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"AVISO: pacote '{self.filename}' rejeitado, versao ativa mantida ({self.last_error})")
+            return None
+
+        if self._active is not None and bundle['version'] == self._active['version']:
+            return None
+        version = self.register(bundle, activate=True)
+        print(f"Modelo atualizado: versao {version} ativa ({self.filename})")
+        return version
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    def start_watching(self, interval=DEFAULT_WATCH_INTERVAL):
+        """
+        Verifica o pacote observado periodicamente em uma thread de fundo
+        """
+        if self._watcher is not None:
+            return
+        self._file_state = self._current_file_state()
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                         name='model-registry-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """
+        Para o observador e a thread de previsoes sombra
+        """
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        if self._shadow_executor is not None:
+            self._shadow_executor.shutdown(wait=True)
+            self._shadow_executor = None
+
+    # --- Previsao e trafego sombra -----------------------------------------
+
+    def set_shadow(self, version, fraction=1.0):
+        """
+        Envia uma fracao dos lotes tambem para outra versao, sem afetar as respostas
+
+        Args:
+            version: Versao sombra (None desliga)
+            fraction: Fracao dos lotes previstos tambem pela sombra
+        """
+        with self._lock:
+            if version is None:
+                self._shadow = None
+                return
+            if version not in self._versions:
+                raise KeyError(f"Versao '{version}' nao carregada.")
+            self.shadow_fraction = min(max(float(fraction), 0.0), 1.0)
+            self._shadow_stats = {'batches': 0, 'samples': 0, 'agreements': 0, 'errors': 0}
+            if self._shadow_executor is None:
+                self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+            self._shadow = self._versions[version]
+
+    def _score_shadow(self, shadow, X, primary_classes):
+        try:
+            scorer = shadow['scorer']
+            classes = scorer.classes_[np.argmax(scorer.predict_proba(X), axis=1)]
+            agreements = int(np.sum(classes == primary_classes))
+        except Exception:
+            self._shadow_stats['errors'] += 1
+            return
+        # Uma unica thread sombra: os contadores nao precisam de lock
+        self._shadow_stats['batches'] += 1
+        self._shadow_stats['samples'] += len(primary_classes)
+        self._shadow_stats['agreements'] += agreements
+
+    def predict_proba(self, X, cache=None):
+        """
+        Probabilidades do lote pela versao ativa (e, se configurada, pela sombra)
+
+        Args:
+            X: Lote de medidas
+            cache: PredictionCache opcional (a versao entra na chave do cache)
+
+        Returns:
+            (pacote usado, array de probabilidades)
+        """
+        bundle = self._active
+        if bundle is None:
+            raise RuntimeError("Nenhum modelo ativo no registro.")
+
+        scorer = bundle['scorer']
+        if cache is not None:
+            probabilities = cache.predict_proba(scorer, X, bundle['version'])
+        else:
+            probabilities = scorer.predict_proba(X)
+
+        shadow = self._shadow
+        if shadow is not None and shadow is not bundle and random.random() < self.shadow_fraction:
+            primary_classes = scorer.classes_[np.argmax(probabilities, axis=1)]
+            self._shadow_executor.submit(self._score_shadow, shadow, X, primary_classes)
+
+        return bundle, probabilities
+
+    def stats(self):
+        """
+        Estado do registro em um dicionario serializavel em JSON
+        """
+        with self._lock:
+            versions = [
+                {
+                    'version': v['version'],
+                    'model': type(v['modelo']).__name__,
+                    'created_at': v.get('created_at'),
+                    'loaded_at': v['loaded_at'],
+                    'active': v is self._active,
+                    'shadow': v is self._shadow,
+                }
+                for v in self._versions.values()
+            ]
+            shadow = None
+            if self._shadow is not None:
+                counts = dict(self._shadow_stats)
+                counts['version'] = self._shadow['version']
+                counts['fraction'] = self.shadow_fraction
+                counts['agreement_rate'] = (counts['agreements'] / counts['samples']
+                                            if counts['samples'] else None)
+                shadow = counts
+
+            return {
+                'active': self._active['version'] if self._active is not None else None,
+                'versions': versions,
+                'history': list(self._history),
+                'swaps': self.swaps,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+                'watching': self._watcher is not None,
+                'shadow': shadow,
+            }
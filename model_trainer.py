@@ -1,23 +1,30 @@
 # -*- coding: utf-8 -*-
+import argparse
 import pickle
+import time
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.metrics import accuracy_score
 
+import verbosity
+from columnar_store import DEFAULT_VARIANT, load_prepared
+from model_bundle import BUNDLE_FILENAME, save_bundle
 
-def load_prepared_data():
+LEADERBOARD_FILENAME = 'search_leaderboard.csv'
+
+
+def load_prepared_data(variant=DEFAULT_VARIANT):
     """
-    Carrega os dados preparados do arquivo pickle
+    Carrega os dados preparados (linhas da variante reunidas da fonte em memory map)
+
+    Args:
+        variant: Variante de divisao em treino e teste
 
     Returns:
         X_train, X_test, y_train, y_test, feature_names, species_map
     """
-    print("=" * 70)
-    print("CARREGANDO DADOS PREPARADOS")
-    print("=" * 70)
+    verbosity.section("CARREGANDO DADOS PREPARADOS", newline=False)
 
-    filename = 'prepared_data.pkl'
-    with open(filename, 'rb') as f:
-        data = pickle.load(f)
+    data, filename = load_prepared(variant=variant)
 
     X_train = data['X_train']
     X_test = data['X_test']
@@ -26,50 +33,154 @@ def load_prepared_data():
     feature_names = data['feature_names']
     species_map = data['species_map']
 
-    print(f"\nArquivo '{filename}' carregado com sucesso!")
-    print("\nDados carregados:")
-    print(f"  - X_train: {X_train.shape} (treino)")
-    print(f"  - X_test: {X_test.shape} (teste)")
-    print(f"  - y_train: {y_train.shape} (treino)")
-    print(f"  - y_test: {y_test.shape} (teste)")
-    print(f"  - Features: {feature_names}")
-    print(f"  - Mapa de especies: {species_map}")
-
-    print("\n--- Distribuicao das classes no treino ---")
-    for cls in sorted(y_train.unique()):
-        count = (y_train == cls).sum()
-        print(f"  Classe {cls} ({species_map[cls]}): {count} amostras")
+    verbosity.say(f"\nArquivo '{filename}' carregado com sucesso! (variante '{variant}')")
+    verbosity.say("\nDados carregados:")
+    verbosity.say(f"  - X_train: {X_train.shape} (treino)")
+    verbosity.say(f"  - X_test: {X_test.shape} (teste)")
+    verbosity.say(f"  - y_train: {y_train.shape} (treino)")
+    verbosity.say(f"  - y_test: {y_test.shape} (teste)")
+    verbosity.say(f"  - Features: {feature_names}")
+    verbosity.say(f"  - Mapa de especies: {species_map}")
+
+    if verbosity.enabled(verbosity.DETAILED):
+        print("\n--- Distribuicao das classes no treino ---")
+        for cls in sorted(y_train.unique()):
+            count = (y_train == cls).sum()
+            print(f"  Classe {cls} ({species_map[cls]}): {count} amostras")
 
     return X_train, X_test, y_train, y_test, feature_names, species_map
 
 
-def train_decision_tree(X_train, y_train):
+def search_hyperparameters(X_train, y_train, halving=False, n_jobs=None):
+    """
+    Busca os hiperparametros do Decision Tree com validacao cruzada em paralelo
+
+    Args:
+        X_train: Features de treino
+        y_train: Labels de treino
+        halving: Descarta candidatos ruins cedo com successive halving
+        n_jobs: Processos trabalhadores (None usa todos os nucleos disponiveis)
+
+    Returns:
+        Melhor modelo, retreinado com todo o conjunto de treino
+    """
+    import hyperparameter_search
+
+    n_jobs = n_jobs or hyperparameter_search.available_cores()
+    verbosity.say("\nBuscando hiperparametros (validacao cruzada estratificada, "
+                  f"{hyperparameter_search.DEFAULT_N_SPLITS} folds)...")
+    verbosity.say(f"Processos: {n_jobs} | Successive halving: {'SIM' if halving else 'NAO'}")
+
+    inicio = time.perf_counter()
+    modelo, leaderboard = hyperparameter_search.search_decision_tree(
+        X_train, y_train, n_jobs=n_jobs, halving=halving
+    )
+    duracao = time.perf_counter() - inicio
+
+    ranking = hyperparameter_search.leaderboard_to_frame(leaderboard)
+    ranking.to_csv(LEADERBOARD_FILENAME, index=False)
+
+    verbosity.record('search.candidates_evaluated', len(leaderboard))
+    verbosity.record('search.best_score', leaderboard[0]['mean_score'])
+    verbosity.record('search.best_params', leaderboard[0]['params'])
+    verbosity.record('search.seconds', duracao)
+    verbosity.record('artifacts.leaderboard', LEADERBOARD_FILENAME)
+
+    verbosity.say(f"\n{len(leaderboard)} candidatos avaliados em {duracao:.2f}s")
+    verbosity.say("\n--- Top 5 candidatos ---")
+    for result in leaderboard[:5]:
+        verbosity.say(f"  {result['mean_score'] * 100:6.2f}% (+/- {result['std_score'] * 100:.2f}) {result['params']}")
+    verbosity.say(f"\nLeaderboard completo salvo em '{LEADERBOARD_FILENAME}'")
+
+    return modelo
+
+
+def train_decision_tree(X_train, y_train, search=False, halving=False, n_jobs=None):
     """
     Treina um modelo Decision Tree Classifier
 
     Args:
         X_train: Features de treino
         y_train: Labels de treino
+        search: Escolhe os hiperparametros por busca em validacao cruzada
+        halving: Usa successive halving na busca
+        n_jobs: Processos da busca (None usa todos os nucleos disponiveis)
 
     Returns:
         Modelo treinado
     """
-    print("\n" + "=" * 70)
-    print("ETAPA 4: TREINANDO MODELO DECISION TREE")
-    print("=" * 70)
+    verbosity.section("ETAPA 4: TREINANDO MODELO DECISION TREE")
+
+    if search:
+        modelo = search_hyperparameters(X_train, y_train, halving, n_jobs)
 
-    print("\nCriando Decision Tree Classifier...")
-    print("Parametros: random_state=42")
+        verbosity.say("\nModelo treinado com sucesso!")
+        verbosity.say(f"Parametros escolhidos: {modelo.get_params()}")
+    else:
+        verbosity.say("\nCriando Decision Tree Classifier...")
+        verbosity.say("Parametros: random_state=42")
+
+        modelo = DecisionTreeClassifier(random_state=42)
+
+        verbosity.say("\nTreinando modelo...")
+        modelo.fit(X_train, y_train)
+
+        verbosity.say("\nModelo treinado com sucesso!")
+
+    verbosity.record('model.type', type(modelo).__name__)
+    verbosity.record('model.depth', int(modelo.get_depth()))
+    verbosity.record('model.leaves', int(modelo.get_n_leaves()))
+
+    verbosity.say(f"Profundidade da arvore: {modelo.get_depth()}")
+    verbosity.say(f"Numero de folhas: {modelo.get_n_leaves()}")
+    verbosity.say(f"Numero de features: {modelo.n_features_in_}")
+
+    return modelo
 
-    modelo = DecisionTreeClassifier(random_state=42)
 
-    print("\nTreinando modelo...")
+def train_tree_ensemble(X_train, y_train, method='bagging', n_estimators=100, n_jobs=None):
+    """
+    Treina um ensemble de Decision Trees em paralelo
+
+    Args:
+        X_train: Features de treino
+        y_train: Labels de treino
+        method: 'bagging' (amostras bootstrap) ou 'random' (arvores aleatorias)
+        n_estimators: Numero de arvores
+        n_jobs: Threads de treino (None usa todos os nucleos disponiveis)
+
+    Returns:
+        Modelo treinado (TreeEnsembleClassifier)
+    """
+    from tree_ensemble import TreeEnsembleClassifier
+
+    verbosity.section("ETAPA 4: TREINANDO ENSEMBLE DE DECISION TREES")
+
+    modelo = TreeEnsembleClassifier(method=method, n_estimators=n_estimators,
+                                    n_jobs=n_jobs, random_state=42)
+
+    verbosity.say(f"\nCriando ensemble '{method}' com {n_estimators} arvores...")
+    verbosity.say("Parametros: random_state=42 (uma semente derivada por arvore)")
+
+    verbosity.say("\nTreinando modelo...")
+    inicio = time.perf_counter()
     modelo.fit(X_train, y_train)
+    duracao = time.perf_counter() - inicio
+
+    depths = [tree.get_depth() for tree in modelo.estimators_]
+    leaves = [tree.get_n_leaves() for tree in modelo.estimators_]
+
+    verbosity.record('model.type', type(modelo).__name__)
+    verbosity.record('model.method', method)
+    verbosity.record('model.n_estimators', len(modelo.estimators_))
+    verbosity.record('model.depth', max(depths))
+    verbosity.record('model.fit_seconds', duracao)
 
-    print("\nModelo treinado com sucesso!")
-    print(f"Profundidade da arvore: {modelo.get_depth()}")
-    print(f"Numero de folhas: {modelo.get_n_leaves()}")
-    print(f"Numero de features: {modelo.n_features_in_}")
+    verbosity.say(f"\nModelo treinado com sucesso em {duracao:.2f}s!")
+    verbosity.say(f"Numero de arvores: {len(modelo.estimators_)}")
+    verbosity.say(f"Profundidade media das arvores: {sum(depths) / len(depths):.1f} (maxima {max(depths)})")
+    verbosity.say(f"Numero medio de folhas: {sum(leaves) / len(leaves):.1f}")
+    verbosity.say(f"Numero de features: {modelo.n_features_in_}")
 
     return modelo
 
@@ -87,17 +198,19 @@ def evaluate_preliminary(modelo, X_test, y_test, species_map):
     Returns:
         y_pred: Previsoes do modelo
     """
-    print("\n" + "=" * 70)
-    print("AVALIACAO PRELIMINAR DO MODELO")
-    print("=" * 70)
+    verbosity.section("AVALIACAO PRELIMINAR DO MODELO")
 
-    print("\nFazendo previsoes no conjunto de teste...")
+    verbosity.say("\nFazendo previsoes no conjunto de teste...")
     y_pred = modelo.predict(X_test)
 
-    print("\nCalculando acuracia...")
+    verbosity.say("\nCalculando acuracia...")
     accuracy = accuracy_score(y_test, y_pred)
+    verbosity.record('training.test_accuracy', float(accuracy))
 
-    print(f"\nAcuracia no conjunto de teste: {accuracy * 100:.2f}%")
+    verbosity.say(f"\nAcuracia no conjunto de teste: {accuracy * 100:.2f}%")
+
+    if not verbosity.enabled(verbosity.DETAILED):
+        return y_pred
 
     print("\n--- Primeiras 10 previsoes vs valores reais ---")
     print(f"{'ID':<5} {'Previsto':<20} {'Real':<20} {'Correto?':<10}")
@@ -118,17 +231,20 @@ def evaluate_preliminary(modelo, X_test, y_test, species_map):
     return y_pred
 
 
-def save_model(modelo, y_pred):
+def save_model(modelo, y_pred, species_map=None, feature_names=None):
     """
     Salva o modelo treinado e as previsoes em arquivo pickle
 
+    Quando species_map e feature_names sao informados, tambem grava o pacote
+    de inferencia (model_bundle.pkl) usado pela interface de classificacao.
+
     Args:
         modelo: Modelo treinado
         y_pred: Previsoes do modelo
+        species_map: Dicionario de mapeamento das especies
+        feature_names: Lista com os nomes das features
     """
-    print("\n" + "=" * 70)
-    print("SALVANDO MODELO TREINADO")
-    print("=" * 70)
+    verbosity.section("SALVANDO MODELO TREINADO")
 
     model_data = {
         'modelo': modelo,
@@ -139,28 +255,62 @@ def save_model(modelo, y_pred):
     with open(filename, 'wb') as f:
         pickle.dump(model_data, f)
 
-    print(f"\nModelo salvo com sucesso em '{filename}'!")
-    print("\nConteudo do arquivo:")
-    print("  - modelo: DecisionTreeClassifier treinado")
-    print(f"  - y_pred: {y_pred.shape} previsoes")
+    verbosity.record('artifacts.model', filename)
+
+    verbosity.say(f"\nModelo salvo com sucesso em '{filename}'!")
+    verbosity.say("\nConteudo do arquivo:")
+    verbosity.say(f"  - modelo: {type(modelo).__name__} treinado")
+    verbosity.say(f"  - y_pred: {y_pred.shape} previsoes")
+
+    if species_map is not None and feature_names is not None:
+        checksum = save_bundle(modelo, species_map, feature_names, BUNDLE_FILENAME)
+        verbosity.record('artifacts.bundle', BUNDLE_FILENAME)
+        verbosity.record('artifacts.bundle_sha256', checksum)
+        verbosity.say(f"\nPacote de inferencia salvo em '{BUNDLE_FILENAME}'!")
+        verbosity.say(f"  - checksum (SHA-256): {checksum[:16]}...")
+
+
+def parse_args(argv=None):
+    """
+    Le os argumentos de linha de comando do treinamento
+    """
+    parser = argparse.ArgumentParser(description="Treinamento do Decision Tree")
+    parser.add_argument('--search', action='store_true',
+                        help="Busca hiperparametros com validacao cruzada em paralelo")
+    parser.add_argument('--halving', action='store_true',
+                        help="Usa successive halving na busca")
+    parser.add_argument('--ensemble', choices=['bagging', 'random'], default=None,
+                        help="Treina um ensemble de arvores em vez de uma unica arvore")
+    parser.add_argument('--n-estimators', type=int, default=100,
+                        help="Numero de arvores do ensemble")
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help="Processos/threads (padrao: todos os nucleos disponiveis)")
+    parser.add_argument('--variant', default=DEFAULT_VARIANT,
+                        help=f"Variante de divisao dos dados preparados (padrao: '{DEFAULT_VARIANT}')")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
+    args = parse_args()
+
     print("\n" + "=" * 70)
     print("INICIANDO TREINAMENTO DO MODELO")
     print("=" * 70)
 
     # Carregar dados preparados
-    X_train, X_test, y_train, y_test, feature_names, species_map = load_prepared_data()
+    X_train, X_test, y_train, y_test, feature_names, species_map = load_prepared_data(args.variant)
 
     # Treinar Decision Tree
-    modelo = train_decision_tree(X_train, y_train)
+    if args.ensemble:
+        modelo = train_tree_ensemble(X_train, y_train, args.ensemble, args.n_estimators, args.n_jobs)
+    else:
+        modelo = train_decision_tree(X_train, y_train, args.search, args.halving, args.n_jobs)
 
     # Avaliar modelo preliminarmente
     y_pred = evaluate_preliminary(modelo, X_test, y_test, species_map)
 
     # Salvar modelo
-    save_model(modelo, y_pred)
+    save_model(modelo, y_pred, species_map, feature_names)
 
     print("\n" + "=" * 70)
     print("TREINAMENTO CONCLUIDO COM SUCESSO!")
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Cache LRU de previsoes para medidas repetidas
+
+Guarda as probabilidades de cada vetor de medidas ja classificado, com
+capacidade limitada e descarte do item usado ha mais tempo (LRU). Em um lote,
+so as amostras que nao estao no cache sao enviadas ao modelo, e amostras
+repetidas dentro do proprio lote sao previstas uma unica vez.
+
+A chave e o vetor de medidas em float32: as arvores comparam as medidas em
+float32, entao vetores com a mesma chave tem exatamente a mesma previsao.
+Opcionalmente as medidas sao arredondadas (`decimals`) antes da previsao, o
+que aumenta o reaproveitamento ao custo de mudar a previsao de medidas muito
+proximas de um corte da arvore.
+
+O cache se esvazia sozinho quando o modelo usado muda (outro objeto ou outra
+versao, como o checksum do pacote de inferencia) e e seguro para uso por
+varias threads, como atras do servidor de previsao.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CAPACITY = 4096
+
+
+class PredictionCache:
+    """
+    Cache LRU de predict_proba por vetor de medidas
+
+    Args:
+        capacity: Numero maximo de vetores guardados
+        decimals: Casas decimais para arredondar as medidas (None = exatas)
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, decimals=None):
+        if capacity < 1:
+            raise ValueError(f"Capacidade do cache deve ser positiva: {capacity}")
+        self.capacity = capacity
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model = None
+        self._version = None
+
+    def _check_model(self, modelo, version):
+        """
+        Esvazia o cache se o modelo mudou (chamar com o lock)
+        """
+        if modelo is self._model and version == self._version:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._model = modelo
+        self._version = version
+
+    def _keys(self, X):
+        values = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+        if values.ndim != 2:
+            raise ValueError(f"Esperado um lote 2D de medidas, recebido {values.shape}.")
+        # + 0 transforma -0.0 em 0.0, que o modelo trata igual
+        values = values + np.float32(0)
+        return values.view(f'V{values.shape[1] * values.itemsize}').ravel().tolist()
+
+    def predict_proba(self, modelo, X, version=None):
+        """
+        Probabilidades de cada amostra, prevendo so as que nao estao no cache
+
+        Args:
+            modelo: Modelo treinado
+            X: Lote de medidas (array 2D ou DataFrame)
+            version: Identificador da versao do modelo (ex: checksum do pacote)
+
+        Returns:
+            Array (n_amostras, n_classes), como modelo.predict_proba
+        """
+        if not hasattr(X, 'iloc'):
+            X = np.asarray(X, dtype=np.float64)
+        if self.decimals is not None:
+            X = np.round(X, self.decimals)
+        keys = self._keys(X)
+
+        rows = [None] * len(keys)
+        missing = {}
+        with self._lock:
+            self._check_model(modelo, version)
+            for i, key in enumerate(keys):
+                row = self._entries.get(key)
+                if row is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._entries.move_to_end(key)
+                    rows[i] = row
+            n_missing = sum(len(positions) for positions in missing.values())
+            self.hits += len(keys) - n_missing
+            self.misses += n_missing
+
+        if missing:
+            # Uma previsao por vetor distinto, fora do lock (o modelo so e lido)
+            first = [positions[0] for positions in missing.values()]
+            subset = X.iloc[first] if hasattr(X, 'iloc') else X[first]
+            predicted = np.asarray(modelo.predict_proba(subset))
+
+            with self._lock:
+                still_current = modelo is self._model and version == self._version
+                for (key, positions), row in zip(missing.items(), predicted):
+                    for i in positions:
+                        rows[i] = row
+                    if still_current:
+                        # Copia: a linha nao deve manter o lote inteiro na memoria
+                        self._entries[key] = row.copy()
+                        self._entries.move_to_end(key)
+                if still_current:
+                    while len(self._entries) > self.capacity:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+
+        if not rows:
+            return np.empty((0, len(modelo.classes_)))
+        return np.vstack(rows)
+
+    def invalidate(self):
+        """
+        Esvazia o cache (por exemplo, depois de treinar o modelo de novo no mesmo objeto)
+        """
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Contadores atuais em um dicionario serializavel em JSON
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'capacity': self.capacity,
+                'size': len(self._entries),
+                'decimals': self.decimals,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
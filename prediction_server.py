@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor HTTP de previsao com micro-batching dinamico
+
+Recebe medidas em JSON via HTTP (localhost), junta as requisicoes concorrentes
+em micro-lotes e classifica cada lote com uma unica chamada a predict_proba.
+Os resultados sao devolvidos a cada requisicao que estava aguardando.
+
+Rotas:
+    POST /predict  {"measurements": [5.1, 3.5, 1.4, 0.2]}
+                   ou {"measurements": [[5.1, 3.5, 1.4, 0.2], [...]]}
+    GET  /metrics  Contadores de requisicoes, lotes e latencia
+    GET  /health   Verificacao simples de disponibilidade
+    GET  /models   Versoes carregadas do modelo (model_registry)
+    POST /models/activate  {"version": "..."}
+    POST /models/rollback  Volta para a versao ativa anterior
+    POST /models/shadow    {"version": "...", "fraction": 0.1} (version null desliga)
+
+Com --watch, um pacote novo gravado pelo treinamento e carregado, validado e
+ativado sem reiniciar o servidor; cada lote usa uma unica versao do modelo.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from columnar_store import load_prepared
+from model_bundle import BUNDLE_FILENAME
+from model_registry import DEFAULT_WATCH_INTERVAL, ModelRegistry
+from prediction_cache import PredictionCache
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+# Quantidade de latencias recentes guardadas para os percentis
+LATENCY_WINDOW = 10000
+
+HTTP_STATUS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+MAX_BODY_BYTES = 1024 * 1024
+# Maior medida aceita: o modelo compara as medidas em float32
+MAX_MEASUREMENT = float(np.finfo(np.float32).max)
+
+
+class ServerStats:
+    """
+    Contadores de requisicoes, lotes e latencia do servidor
+    """
+
+    def __init__(self, cache=None):
+        self.started_at = time.time()
+        self.cache = cache
+        self.requests_total = 0
+        self.errors_total = 0
+        self.samples_total = 0
+        self.batches_total = 0
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def record_batch(self, batch_size):
+        self.batches_total += 1
+        self.samples_total += batch_size
+
+    def record_request(self, latency_ms, error=False):
+        self.requests_total += 1
+        if error:
+            self.errors_total += 1
+        else:
+            self.latencies_ms.append(latency_ms)
+
+    def snapshot(self):
+        """
+        Retorna os contadores atuais em um dicionario serializavel em JSON
+        """
+        latencies = np.fromiter(self.latencies_ms, dtype=np.float64)
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            latency = {
+                'mean_ms': float(latencies.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(latencies.max()),
+            }
+        else:
+            latency = {}
+
+        snapshot = {
+            'uptime_s': time.time() - self.started_at,
+            'requests_total': self.requests_total,
+            'errors_total': self.errors_total,
+            'samples_total': self.samples_total,
+            'batches_total': self.batches_total,
+            'mean_batch_size': self.samples_total / self.batches_total if self.batches_total else 0.0,
+            'latency': latency,
+        }
+        if self.cache is not None:
+            snapshot['cache'] = self.cache.stats()
+        return snapshot
+
+
+class MicroBatcher:
+    """
+    Junta amostras concorrentes em lotes e classifica cada lote de uma vez
+
+    Um lote e fechado quando atinge `max_batch_size` amostras ou quando a
+    primeira amostra do lote ja esperou `max_wait_ms` milissegundos. Com um
+    PredictionCache, so as amostras do lote fora do cache vao ao modelo.
+    """
+
+    def __init__(self, registry, stats,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS, cache=None):
+        self.registry = registry
+        self.stats = stats
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.n_features = int(registry.active()['modelo'].n_features_in_)
+        self._queue = asyncio.Queue()
+        # Uma unica thread de inferencia: o loop continua aceitando
+        # requisicoes (e formando o proximo lote) enquanto o lote atual roda
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def predict(self, measurements):
+        """
+        Enfileira uma amostra e aguarda o resultado do lote em que ela entrar
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((measurements, future))
+        return await future
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Aproveita o que ja chegou sem esperar mais
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    def _score(self, X):
+        # O lote inteiro usa a versao ativa no momento em que comecou
+        bundle, probabilities = self.registry.predict_proba(X, self.cache)
+        return bundle, np.argmax(probabilities, axis=1), probabilities
+
+    @staticmethod
+    def _deliver(future, bundle, k, row):
+        if future.done():
+            return
+        class_names = bundle['class_names']
+        future.set_result({
+            'species': class_names[k],
+            'probabilities': {
+                name: float(p) for name, p in zip(class_names, row)
+            },
+            'model_version': bundle['version'],
+        })
+
+    async def _score_each(self, batch, X):
+        """
+        Classifica as amostras de um lote que falhou uma a uma, para que o erro
+        chegue so a requisicao que o causou
+        """
+        loop = asyncio.get_running_loop()
+        for i, (_, future) in enumerate(batch):
+            try:
+                bundle, predicted, probabilities = await loop.run_in_executor(
+                    self._executor, self._score, X[i:i + 1])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self._deliver(future, bundle, predicted[0], probabilities[0])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            X = np.array([measurements for measurements, _ in batch], dtype=np.float64)
+
+            try:
+                bundle, predicted, probabilities = await loop.run_in_executor(self._executor, self._score, X)
+            except Exception:
+                self.stats.record_batch(len(batch))
+                await self._score_each(batch, X)
+                continue
+
+            self.stats.record_batch(len(batch))
+            for (_, future), k, row in zip(batch, predicted, probabilities):
+                self._deliver(future, bundle, k, row)
+
+
+def parse_measurements(payload, n_features):
+    """
+    Valida o JSON recebido e retorna (amostras, se era uma amostra unica)
+    """
+    if not isinstance(payload, dict) or 'measurements' not in payload:
+        raise ValueError("O corpo deve ser um objeto JSON com a chave 'measurements'.")
+
+    rows = payload['measurements']
+    if not isinstance(rows, list):
+        raise ValueError("'measurements' deve ser uma lista.")
+    single = bool(rows) and not isinstance(rows[0], list)
+    if single:
+        rows = [rows]
+    if not rows:
+        raise ValueError("'measurements' esta vazio.")
+
+    parsed = []
+    for row in rows:
+        if not isinstance(row, list) or len(row) != n_features:
+            raise ValueError(f"Cada amostra deve ter {n_features} medidas.")
+        values = [float(value) for value in row]
+        # NaN, infinitos e valores fora do float32 fariam o lote inteiro falhar no modelo
+        if not all(abs(value) <= MAX_MEASUREMENT for value in values):
+            raise ValueError(f"Medidas devem ser numeros finitos (ate {MAX_MEASUREMENT:.4g} em modulo).")
+        parsed.append(values)
+    return parsed, single
+
+
+async def read_request(reader):
+    """
+    Le uma requisicao HTTP/1.1 e retorna (metodo, caminho, cabecalhos, corpo)
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise OverflowError
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+
+
+async def handle_predict(batcher, body):
+    payload = json.loads(body or b'null')
+    rows, single = parse_measurements(payload, batcher.n_features)
+    results = await asyncio.gather(*(batcher.predict(row) for row in rows))
+    return results[0] if single else {'results': results}
+
+
+def handle_models(registry, method, path, body):
+    """
+    Rotas de gerenciamento das versoes do modelo
+    """
+    if path == '/models':
+        if method != 'GET':
+            return 405, {'error': 'Use GET em /models.'}
+        return 200, registry.stats()
+    if method != 'POST':
+        return 405, {'error': f'Use POST em {path}.'}
+
+    payload = json.loads(body or b'{}')
+    if not isinstance(payload, dict):
+        raise ValueError("O corpo deve ser um objeto JSON.")
+    if path == '/models/activate':
+        registry.activate(payload.get('version'))
+    elif path == '/models/rollback':
+        registry.rollback()
+    elif path == '/models/shadow':
+        registry.set_shadow(payload.get('version'), payload.get('fraction', 1.0))
+    else:
+        return 404, {'error': f"Rota '{path}' nao encontrada."}
+    return 200, registry.stats()
+
+
+async def handle_connection(reader, writer, batcher, stats):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except OverflowError:
+                write_response(writer, 413, {'error': 'Corpo da requisicao muito grande.'}, False)
+                break
+            except (ValueError, asyncio.IncompleteReadError):
+                break
+            if request is None:
+                break
+
+            method, path, headers, body = request
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            start = time.perf_counter()
+
+            if path == '/predict':
+                if method != 'POST':
+                    status, payload = 405, {'error': 'Use POST em /predict.'}
+                else:
+                    try:
+                        status, payload = 200, await handle_predict(batcher, body)
+                    except (ValueError, TypeError) as e:
+                        status, payload = 400, {'error': str(e)}
+                    except Exception as e:
+                        status, payload = 500, {'error': str(e)}
+                stats.record_request((time.perf_counter() - start) * 1000.0, error=status != 200)
+            elif path == '/metrics':
+                status, payload = 200, stats.snapshot()
+            elif path == '/health':
+                status, payload = 200, {'status': 'ok'}
+            elif path == '/models' or path.startswith('/models/'):
+                try:
+                    status, payload = handle_models(batcher.registry, method, path, body)
+                except KeyError as e:
+                    status, payload = 404, {'error': str(e.args[0])}
+                except ValueError as e:
+                    status, payload = 400, {'error': str(e)}
+            else:
+                status, payload = 404, {'error': f"Rota '{path}' nao encontrada."}
+
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=8000,
+                max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                cache_size=0, cache_decimals=None, watch_interval=None, min_accuracy=None):
+    """
+    Carrega o classificador e atende requisicoes ate ser interrompido
+    """
+    # Versoes novas sao validadas no conjunto de teste antes de atender
+    validation_X = validation_y = None
+    if watch_interval is not None:
+        data, _ = load_prepared()
+        validation_X, validation_y = data['X_test'], data['y_test']
+
+    registry = ModelRegistry(BUNDLE_FILENAME, validation_X=validation_X, validation_y=validation_y,
+                             min_accuracy=min_accuracy)
+    try:
+        registry.load()
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Nao foi possivel carregar o classificador: {e}")
+    if watch_interval is not None:
+        registry.start_watching(watch_interval)
+
+    cache = PredictionCache(cache_size, cache_decimals) if cache_size else None
+    stats = ServerStats(cache)
+    batcher = MicroBatcher(registry, stats, max_batch_size, max_wait_ms, cache)
+    batcher.start()
+
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(r, w, batcher, stats), host, port
+    )
+    print(f"Servidor de previsao em http://{host}:{port} "
+          f"(lote maximo: {max_batch_size}, espera maxima: {max_wait_ms} ms, "
+          f"modelo {registry.active()['version']})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+        registry.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor HTTP de previsao do classificador Iris")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Numero maximo de amostras por lote")
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="Tempo maximo que uma amostra espera o lote encher")
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help="Guarda as previsoes das ultimas N medidas distintas (0 = sem cache)")
+    parser.add_argument('--cache-decimals', type=int, default=None,
+                        help="Arredonda as medidas a estas casas decimais antes do cache e da previsao")
+    parser.add_argument('--watch', type=float, nargs='?', const=DEFAULT_WATCH_INTERVAL, default=None,
+                        metavar='SEGUNDOS',
+                        help=f"Observa {BUNDLE_FILENAME} e troca o modelo a quente quando ele muda "
+                             f"(intervalo padrao: {DEFAULT_WATCH_INTERVAL}s)")
+    parser.add_argument('--min-accuracy', type=float, default=None,
+                        help="Rejeita versoes novas com acuracia menor que esta no conjunto de teste")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch_size, args.max_wait_ms,
+                          args.cache_size, args.cache_decimals, args.watch, args.min_accuracy))
+    except KeyboardInterrupt:
+        print("\nServidor encerrado.")
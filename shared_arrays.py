@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Arrays NumPy em memoria compartilhada entre processos
+
+O processo principal publica cada array uma unica vez em um bloco de
+memoria compartilhada; os processos trabalhadores se conectam ao bloco pelo
+nome e enxergam os mesmos dados sem copia e sem pickle por tarefa.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def share_array(values):
+    """
+    Copia um array para um novo bloco de memoria compartilhada
+
+    Args:
+        values: Array a publicar
+
+    Returns:
+        (bloco SharedMemory, descricao serializavel para attach_array)
+    """
+    values = np.ascontiguousarray(values)
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    shared = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+    shared[...] = values
+
+    spec = {'name': shm.name, 'shape': values.shape, 'dtype': values.dtype.str}
+    return shm, spec
+
+
+def attach_array(spec):
+    """
+    Conecta a um array publicado por share_array, sem copiar os dados
+
+    O bloco retornado precisa ser mantido vivo enquanto o array for usado.
+
+    Args:
+        spec: Descricao retornada por share_array
+
+    Returns:
+        (bloco SharedMemory, array apoiado no bloco)
+    """
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    values = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf)
+    return shm, values
+
+
+def release(blocks):
+    """
+    Fecha e remove blocos criados por share_array
+    """
+    for shm in blocks:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
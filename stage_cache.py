@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Cache das fases do pipeline por hash de conteudo
+
+Cada fase tem uma chave calculada a partir do hash dos arquivos de entrada,
+dos parametros da fase, do codigo-fonte dos modulos que ela executa e das
+chaves das fases anteriores. Se a chave nao mudou e os artefatos gerados
+continuam intactos, a fase pode ser pulada e seus resultados reaproveitados.
+Como a chave de uma fase inclui a da fase anterior, qualquer mudanca no
+inicio do pipeline invalida automaticamente todas as fases seguintes.
+"""
+
+import hashlib
+import json
+import os
+import platform
+
+CACHE_DIR = '.stage_cache'
+CACHE_FORMAT_VERSION = 1
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def _iter_files(path):
+    """
+    Lista os arquivos de um caminho (o proprio arquivo ou o conteudo do diretorio), em ordem
+    """
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                yield os.path.join(root, filename)
+    else:
+        yield path
+
+
+def file_hash(path):
+    """
+    Calcula o SHA-256 do conteudo de um arquivo ou diretorio
+
+    Args:
+        path: Caminho do arquivo ou diretorio
+
+    Returns:
+        Hash hexadecimal do conteudo
+    """
+    digest = hashlib.sha256()
+    for filename in _iter_files(path):
+        digest.update(os.path.relpath(filename, path).encode('utf-8'))
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(modules):
+    """
+    Calcula o hash do codigo-fonte dos modulos de uma fase
+
+    Args:
+        modules: Lista de modulos Python importados
+
+    Returns:
+        Hash hexadecimal das fontes
+    """
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(module.__name__.encode('utf-8'))
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def stage_key(name, inputs=(), params=None, modules=(), upstream=()):
+    """
+    Calcula a chave de uma fase do pipeline
+
+    Args:
+        name: Nome da fase
+        inputs: Arquivos de entrada lidos pela fase
+        params: Dicionario com os parametros da fase
+        modules: Modulos cujo codigo a fase executa
+        upstream: Chaves das fases anteriores
+
+    Returns:
+        Chave hexadecimal da fase
+    """
+    description = {
+        'format_version': CACHE_FORMAT_VERSION,
+        'stage': name,
+        'python': platform.python_version(),
+        'inputs': {path: file_hash(path) for path in inputs},
+        'params': params or {},
+        'code': code_version(modules),
+        'upstream': list(upstream),
+    }
+    encoded = json.dumps(description, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _artifact_state(path):
+    """
+    Tamanho e data de modificacao dos arquivos de um artefato (verificacao rapida)
+    """
+    return [
+        [os.path.relpath(filename, path), os.path.getsize(filename), os.stat(filename).st_mtime_ns]
+        for filename in _iter_files(path)
+    ]
+
+
+def _record_path(name, cache_dir):
+    return os.path.join(cache_dir, f'{name}.json')
+
+
+def lookup(name, key, cache_dir=CACHE_DIR):
+    """
+    Procura o resultado de uma fase no cache
+
+    Args:
+        name: Nome da fase
+        key: Chave atual da fase
+        cache_dir: Diretorio do cache
+
+    Returns:
+        Dicionario com o resultado salvo, ou None se a fase precisa ser executada
+    """
+    try:
+        with open(_record_path(name, cache_dir), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if record.get('key') != key:
+        return None
+
+    for path, state in record.get('artifacts', {}).items():
+        if not os.path.exists(path) or _artifact_state(path) != state:
+            return None
+
+    return record.get('result', {})
+
+
+def store(name, key, artifacts=(), result=None, cache_dir=CACHE_DIR):
+    """
+    Registra no cache a execucao de uma fase
+
+    Args:
+        name: Nome da fase
+        key: Chave da fase
+        artifacts: Arquivos/diretorios gerados pela fase
+        result: Dicionario serializavel em JSON com os resultados da fase
+        cache_dir: Diretorio do cache
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    record = {
+        'key': key,
+        'artifacts': {path: _artifact_state(path) for path in artifacts if os.path.exists(path)},
+        'result': result or {},
+    }
+
+    path = _record_path(name, cache_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def invalidate(name, cache_dir=CACHE_DIR):
+    """
+    Remove uma fase do cache
+    """
+    try:
+        os.remove(_record_path(name, cache_dir))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures comuns dos testes: o Iris do repositorio e modelos treinados na hora
+
+Os testes nao dependem dos artefatos gerados pelo pipeline (prepared_data,
+model_bundle.pkl, ...): cada modelo e treinado em memoria a partir do iris.csv.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.tree import DecisionTreeClassifier
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Os modulos do projeto ficam na raiz do repositorio
+sys.path.insert(0, ROOT)
+
+import verbosity  # noqa: E402
+
+verbosity.set_level(verbosity.QUIET)
+
+
+@pytest.fixture(scope='session')
+def iris():
+    """
+    (DataFrame com a especie codificada, species_map) do iris.csv
+    """
+    from data_loader import encode_species, load_iris_from_csv
+
+    df = load_iris_from_csv(os.path.join(ROOT, 'iris.csv'))
+    return encode_species(df)
+
+
+@pytest.fixture(scope='session')
+def iris_xy(iris):
+    """
+    Medidas (float32) e classes do Iris como arrays
+    """
+    from data_loader import TARGET_COLUMN
+
+    df, _ = iris
+    X = df.drop(columns=TARGET_COLUMN).to_numpy(dtype=np.float32)
+    y = df[TARGET_COLUMN].to_numpy()
+    return X, y
+
+
+@pytest.fixture(scope='session')
+def probe_X(iris_xy):
+    """
+    Medidas do Iris mais pontos aleatorios na faixa de cada feature
+    """
+    X, _ = iris_xy
+    rng = np.random.default_rng(0)
+    low, high = X.min(axis=0), X.max(axis=0)
+    random = (low + rng.random((2000, X.shape[1])) * (high - low)).astype(np.float32)
+    return np.concatenate([X, random])
+
+
+@pytest.fixture(scope='session')
+def tree_model(iris_xy):
+    X, y = iris_xy
+    return DecisionTreeClassifier(random_state=42).fit(X, y)
+
+
+@pytest.fixture(scope='session')
+def shallow_model(iris_xy):
+    X, y = iris_xy
+    return DecisionTreeClassifier(max_depth=3, random_state=42).fit(X, y)
+
+
+@pytest.fixture(scope='session')
+def ensemble_model(iris_xy):
+    from tree_ensemble import TreeEnsembleClassifier
+
+    X, y = iris_xy
+    return TreeEnsembleClassifier(n_estimators=5, n_jobs=1, random_state=42).fit(X, y)
+
+
+@pytest.fixture(scope='session', params=['tree', 'ensemble'])
+def model(request, tree_model, ensemble_model):
+    """
+    Arvore unica e ensemble (testes que valem para os dois)
+    """
+    return tree_model if request.param == 'tree' else ensemble_model
+
+
+@pytest.fixture
+def bundle_file(tmp_path, iris):
+    """
+    Grava um pacote de inferencia de um modelo em tmp_path e retorna o caminho
+    """
+    from model_bundle import save_bundle
+
+    _, species_map = iris
+    feature_names = ['sepal_length_cm', 'sepal_width_cm', 'petal_length_cm', 'petal_width_cm']
+
+    def write(modelo, filename='model_bundle.pkl'):
+        path = str(tmp_path / filename)
+        save_bundle(modelo, species_map, feature_names, path)
+        return path
+
+    return write
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from classifier_interface import class_display_names, predict_with_confidence
+from prediction_cache import PredictionCache
+
+
+def test_predict_with_confidence_matches_model(tree_model, iris, probe_X):
+    _, species_map = iris
+    names = class_display_names(tree_model, species_map)
+
+    result = predict_with_confidence(tree_model, probe_X, names, threshold=0.9)
+
+    np.testing.assert_array_equal(result['classes'], tree_model.predict(probe_X))
+    np.testing.assert_array_equal(result['probabilities'], tree_model.predict_proba(probe_X))
+    np.testing.assert_array_equal(result['abstain'], result['confidence'] < 0.9)
+
+
+def test_class_names_can_be_a_list(shallow_model):
+    X = np.array([[5.1, 3.5, 1.4, 0.2], [6.5, 3.0, 5.5, 2.0]])
+
+    result = predict_with_confidence(shallow_model, X, ['a', 'b', 'c'])
+
+    assert result['labels'].tolist() == ['a', 'c']
+    assert result['top_k_labels'].shape == (2, 2)
+
+
+def test_cache_gives_same_result(ensemble_model, iris, probe_X):
+    _, species_map = iris
+    names = class_display_names(ensemble_model, species_map)
+    cache = PredictionCache(capacity=64)
+
+    direct = predict_with_confidence(ensemble_model, probe_X, names)
+    cached = predict_with_confidence(ensemble_model, probe_X, names, cache=cache, model_version='v1')
+
+    for key in ('classes', 'labels', 'confidence', 'probabilities', 'top_k_classes'):
+        np.testing.assert_array_equal(cached[key], direct[key])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from columnar_store import iter_split_chunks, open_split, read_manifest, save_source, save_split
+from data_loader import TARGET_COLUMN
+
+TRAIN_ROWS = np.array([149, 0, 75, 3, 3, 120])
+TEST_ROWS = np.array([10, 140, 51])
+
+
+@pytest.fixture
+def store(iris, tmp_path):
+    """
+    Fonte do Iris (com indice fora de ordem) e uma divisao por posicoes gravadas em tmp_path
+    """
+    df, species_map = iris
+    df = df.set_axis(np.random.default_rng(0).permutation(len(df)) + 1000)
+    feature_names = [c for c in df.columns if c != TARGET_COLUMN]
+    dirname = str(tmp_path / 'prepared_data')
+    save_source(df, feature_names, TARGET_COLUMN, species_map, dirname)
+    save_split(TRAIN_ROWS, TEST_ROWS, dirname=dirname)
+    return df, feature_names, dirname
+
+
+@pytest.mark.parametrize('split, rows', [('train', TRAIN_ROWS), ('test', TEST_ROWS)])
+def test_open_split_gathers_the_right_rows(store, split, rows):
+    df, feature_names, dirname = store
+
+    X, y = open_split(split, dirname)
+
+    expected = df.iloc[rows]
+    assert X.dtypes.eq(np.float32).all()
+    assert X.index.tolist() == expected.index.tolist()
+    np.testing.assert_array_equal(X.to_numpy(), expected[feature_names].to_numpy())
+    np.testing.assert_array_equal(y.to_numpy(), expected[TARGET_COLUMN].to_numpy())
+
+
+def test_open_split_columns_in_requested_order(store):
+    df, _, dirname = store
+    columns = ['petal_width_cm', 'sepal_length_cm']
+
+    X, _ = open_split('train', dirname, columns=columns)
+
+    assert list(X.columns) == columns
+    np.testing.assert_array_equal(X.to_numpy(), df.iloc[TRAIN_ROWS][columns].to_numpy())
+
+
+def test_chunks_cover_the_split_in_order(store):
+    _, _, dirname = store
+    X, y = open_split('train', dirname)
+
+    chunks = list(iter_split_chunks('train', 4, dirname))
+
+    assert [len(X_chunk) for X_chunk, _ in chunks] == [4, 2]
+    np.testing.assert_array_equal(np.concatenate([X_chunk for X_chunk, _ in chunks]), X.to_numpy())
+    np.testing.assert_array_equal(np.concatenate([y_chunk for _, y_chunk in chunks]), y.to_numpy())
+
+
+def test_variants_share_the_source(store):
+    df, _, dirname = store
+    save_split([1, 2], [3], variant='outra', dirname=dirname)
+
+    _, y = open_split('test', dirname, variant='outra')
+    assert y.index.tolist() == [df.index[3]]
+    # A variante padrao continua intacta
+    assert open_split('test', dirname)[1].index.tolist() == df.index[TEST_ROWS].tolist()
+    with pytest.raises(ValueError):
+        open_split('test', dirname, variant='inexistente')
+
+
+def test_unchanged_source_is_not_rewritten(store, iris):
+    df, feature_names, dirname = store
+    _, species_map = iris
+
+    manifest, written = save_source(df, feature_names, TARGET_COLUMN, species_map, dirname)
+
+    assert not written
+    assert 'default' in manifest['variants']
+
+
+def test_changed_source_drops_old_splits(store, iris):
+    df, feature_names, dirname = store
+    _, species_map = iris
+    changed = pd.concat([df, df.iloc[:1].set_axis([0])])
+
+    _, written = save_source(changed, feature_names, TARGET_COLUMN, species_map, dirname)
+
+    assert written
+    assert read_manifest(dirname)['variants'] == {}
+
+
+def test_rows_outside_the_source_are_rejected(store):
+    _, _, dirname = store
+
+    with pytest.raises(ValueError):
+        save_split([0, 150], [1], dirname=dirname)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+
+from export_predictor import export_predictor, load_predictor, verify_predictor
+
+FEATURE_NAMES = ['sepal_length_cm', 'sepal_width_cm', 'petal_length_cm', 'petal_width_cm']
+
+
+def test_exported_module_matches_sklearn(model, iris, probe_X, tmp_path):
+    _, species_map = iris
+    filename = export_predictor(model, species_map, FEATURE_NAMES, str(tmp_path / 'iris_predictor.py'))
+    predictor = load_predictor(filename)
+
+    assert verify_predictor(predictor, model, probe_X) == 0
+
+
+def test_exported_module_labels(shallow_model, iris, tmp_path):
+    _, species_map = iris
+    predictor = load_predictor(export_predictor(shallow_model, species_map, FEATURE_NAMES,
+                                                str(tmp_path / 'iris_predictor.py')))
+
+    assert predictor.predict_label([5.1, 3.5, 1.4, 0.2]) == 'Setosa'
+    assert predictor.predict_label([6.5, 3.0, 5.5, 2.0]) == 'Virginica'
+
+
+def test_exported_module_needs_no_dependencies(shallow_model, iris, tmp_path):
+    _, species_map = iris
+    filename = export_predictor(shallow_model, species_map, FEATURE_NAMES, str(tmp_path / 'iris_predictor.py'))
+
+    # -I: sem o diretorio do projeto nem site-packages do usuario no caminho de importacao
+    code = ("import sys, runpy; runpy.run_path(sys.argv[1]); "
+            "assert not {'numpy', 'pandas', 'sklearn'} & set(sys.modules)")
+    subprocess.run([sys.executable, '-I', '-c', code, filename], check=True)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import grid_lookup
+
+
+def test_grid_matches_sklearn(model, probe_X):
+    grid = grid_lookup.compile_grid(model)
+
+    assert grid['table'] is not None
+    np.testing.assert_array_equal(grid_lookup.predict_grid(grid, probe_X), model.predict(probe_X))
+    np.testing.assert_array_equal(grid_lookup.predict_proba_grid(grid, probe_X), model.predict_proba(probe_X))
+    assert grid_lookup.verify_grid(grid, model, probe_X)
+
+
+def test_values_on_the_thresholds(tree_model):
+    grid = grid_lookup.compile_grid(tree_model)
+    # Cada corte e os float32 vizinhos dele em todas as features
+    cuts = np.concatenate([t for t in grid['thresholds'] if len(t)]).astype(np.float32)
+    values = np.concatenate([cuts, np.nextafter(cuts, np.float32(np.inf)),
+                             np.nextafter(cuts, np.float32(-np.inf))])
+    X = np.repeat(values[:, None], grid['n_features'], axis=1)
+
+    np.testing.assert_array_equal(grid_lookup.predict_grid(grid, X), tree_model.predict(X))
+
+
+def test_missing_values_follow_the_tree(tree_model, iris_xy):
+    X, _ = iris_xy
+    grid = grid_lookup.compile_grid(tree_model)
+    X = X[:20].copy()
+    X[::3, 2] = np.nan
+
+    np.testing.assert_array_equal(grid_lookup.predict_grid(grid, X), tree_model.predict(X))
+
+
+def test_large_grid_falls_back_to_tree(model, probe_X):
+    grid = grid_lookup.compile_grid(model, max_cells=1)
+
+    assert grid['table'] is None
+    assert grid_lookup.grid_nbytes(grid) == 0
+    np.testing.assert_array_equal(grid_lookup.predict_grid(grid, probe_X), model.predict(probe_X))
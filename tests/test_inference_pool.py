@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from inference_pool import InferencePool
+
+
+@pytest.fixture(scope='module')
+def pool(ensemble_model, iris):
+    _, species_map = iris
+    # Buffer menor que o lote: a previsao passa em varias janelas
+    with InferencePool(ensemble_model, species_map, n_workers=2, min_rows_per_worker=100,
+                       buffer_rows=700) as pool:
+        yield pool
+
+
+def test_pool_matches_model(pool, ensemble_model, probe_X):
+    np.testing.assert_array_equal(pool.predict_proba(probe_X), ensemble_model.predict_proba(probe_X))
+    np.testing.assert_array_equal(pool.predict(probe_X), ensemble_model.predict(probe_X))
+
+
+def test_small_batches_stay_in_process(pool, ensemble_model, probe_X):
+    np.testing.assert_array_equal(pool.predict_proba(probe_X[:150]), ensemble_model.predict_proba(probe_X[:150]))
+    assert pool.predict(probe_X[0]).shape == (1,)
+
+
+def test_worker_errors_reach_the_caller(pool, ensemble_model, probe_X):
+    X = probe_X.copy()
+    X[1000, 0] = np.inf
+
+    with pytest.raises(ValueError):
+        pool.predict_proba(X)
+    # Os buffers continuam utilizaveis depois do erro
+    np.testing.assert_array_equal(pool.predict_proba(probe_X), ensemble_model.predict_proba(probe_X))
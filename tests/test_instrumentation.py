@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import instrumentation
+
+
+def test_steps_are_nested_and_measured():
+    inst = instrumentation.Instrumentation()
+    instrumentation.activate(inst)
+    try:
+        with instrumentation.step('fase', rows=10):
+            with instrumentation.step('passo'):
+                pass
+    finally:
+        instrumentation.activate(None)
+
+    outer, inner = inst.records
+    assert inner['path'] == 'fase/passo' and inner['stage'] == 'fase'
+    assert outer['status'] == 'ok' and outer['wall_s'] >= inner['wall_s']
+    assert outer['rows_per_s'] > 0
+
+
+def test_missing_rss_is_reported_as_unavailable(monkeypatch, capsys):
+    # Plataforma sem /proc nem o modulo resource (Windows)
+    monkeypatch.setattr(instrumentation, 'resource', None)
+    monkeypatch.setattr(instrumentation, 'peak_rss_mb', lambda: None)
+    monkeypatch.setattr(instrumentation, 'reset_peak_rss', lambda: False)
+
+    inst = instrumentation.Instrumentation()
+    with inst.step('fase', rows=5):
+        pass
+    inst.print_report()
+
+    assert inst.peak_rss_scope == 'unavailable'
+    assert inst.records[0]['peak_rss_mb'] is None
+    assert 'indisponivel' in capsys.readouterr().out
+    assert 'peak_rss_bytes' not in inst.to_prometheus()
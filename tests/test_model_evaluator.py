@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from sklearn.metrics import accuracy_score, confusion_matrix
+
+from model_evaluator import compute_metrics, confusion_counts, evaluate_stream
+
+
+def test_confusion_counts_match_sklearn(tree_model, probe_X):
+    y_true = tree_model.predict(probe_X)
+    y_pred = np.roll(y_true, 7)
+
+    np.testing.assert_array_equal(confusion_counts(y_true, y_pred, [1, 2, 3]),
+                                  confusion_matrix(y_true, y_pred, labels=[1, 2, 3]))
+
+
+@pytest.mark.parametrize('y_true, y_pred', [([1, 4], [1, 1]), ([0, 1], [1, 1]), ([1, 2], [2, 9])])
+def test_confusion_counts_rejects_unknown_labels(y_true, y_pred):
+    with pytest.raises(ValueError):
+        confusion_counts(np.array(y_true, dtype=np.uint8), np.array(y_pred, dtype=np.uint8), [1, 2, 3])
+
+
+def test_stream_evaluation_matches_in_memory(shallow_model, iris, iris_xy):
+    _, species_map = iris
+    X, y = iris_xy
+    chunks = ((X[i:i + 40], y[i:i + 40]) for i in range(0, len(X), 40))
+
+    metrics = evaluate_stream(shallow_model, chunks, species_map)
+
+    assert metrics == compute_metrics(y, shallow_model.predict(X), species_map)
+    assert metrics['accuracy'] == pytest.approx(accuracy_score(y, shallow_model.predict(X)))
+
+
+def test_cv_and_stream_cannot_be_combined():
+    from model_evaluator import parse_args
+
+    with pytest.raises(SystemExit):
+        parse_args(['--cv', '--stream'])
+    assert parse_args(['--stream', 'dados.csv']).stream == 'dados.csv'
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from model_registry import ModelRegistry
+
+
+@pytest.fixture
+def registry(tree_model, shallow_model, bundle_file):
+    """
+    Registro com duas versoes carregadas; a segunda (arvore rasa) ativa
+    """
+    registry = ModelRegistry(bundle_file(tree_model, 'first.pkl'))
+    first = registry.load()
+    second = registry.load(bundle_file(shallow_model, 'second.pkl'))
+    yield registry, first, second
+    registry.stop()
+
+
+def test_load_activates_new_version(registry, shallow_model, iris_xy):
+    registry, first, second = registry
+    X, _ = iris_xy
+
+    assert first != second
+    assert registry.active()['version'] == second
+    bundle, probabilities = registry.predict_proba(X)
+    assert bundle['version'] == second
+    np.testing.assert_array_equal(probabilities, shallow_model.predict_proba(X))
+
+
+def test_rollback_restores_previous_version(registry, tree_model, iris_xy):
+    registry, first, second = registry
+    X, _ = iris_xy
+
+    assert registry.rollback() == first
+    assert registry.active()['version'] == first
+    np.testing.assert_array_equal(registry.predict_proba(X)[1], tree_model.predict_proba(X))
+    # A versao desfeita continua carregada e pode voltar a ser ativada
+    assert second in registry.versions()
+    registry.activate(second)
+    assert registry.active()['version'] == second
+
+
+def test_rollback_without_history_fails(tree_model, bundle_file):
+    registry = ModelRegistry(bundle_file(tree_model))
+    registry.load()
+
+    with pytest.raises(ValueError):
+        registry.rollback()
+
+
+def test_invalid_bundle_keeps_active_version(registry, tmp_path):
+    registry, _, second = registry
+    registry.filename = str(tmp_path / 'second.pkl')
+    with open(registry.filename, 'wb') as f:
+        f.write(b'corrompido')
+
+    assert registry.check_for_update() is None
+    assert registry.rejected == 1
+    assert registry.active()['version'] == second
+
+
+@pytest.mark.filterwarnings('error')
+def test_arrays_are_scored_without_feature_name_warnings(iris, bundle_file):
+    from sklearn.tree import DecisionTreeClassifier
+    from data_loader import TARGET_COLUMN
+
+    df, _ = iris
+    X = df.drop(columns=TARGET_COLUMN)
+    # Treinado com nomes de features, como no pipeline; o servidor preve arrays
+    modelo = DecisionTreeClassifier(random_state=42).fit(X, df[TARGET_COLUMN])
+    registry = ModelRegistry(bundle_file(modelo))
+    registry.load()
+
+    _, probabilities = registry.predict_proba(X.to_numpy(dtype=np.float64))
+
+    np.testing.assert_array_equal(probabilities, modelo.predict_proba(X))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from prediction_cache import PredictionCache
+
+
+class CountingModel:
+    """
+    Modelo que conta quantas amostras chegaram ao predict_proba
+    """
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        self.classes_ = modelo.classes_
+        self.rows = 0
+
+    def predict_proba(self, X):
+        self.rows += len(X)
+        return self.modelo.predict_proba(X)
+
+
+@pytest.fixture
+def counting(shallow_model):
+    return CountingModel(shallow_model)
+
+
+def test_results_match_model(counting, probe_X):
+    cache = PredictionCache(capacity=100)
+
+    np.testing.assert_array_equal(cache.predict_proba(counting, probe_X[:300]),
+                                  counting.modelo.predict_proba(probe_X[:300]))
+
+
+def test_repeated_rows_are_predicted_once(counting, iris_xy):
+    X, _ = iris_xy
+    cache = PredictionCache(capacity=1000)
+
+    cache.predict_proba(counting, np.concatenate([X[:10], X[:10]]))
+    cache.predict_proba(counting, X[:10])
+
+    # Repetidas no mesmo lote contam como falta, mas vao ao modelo uma unica vez
+    assert counting.rows == 10
+    assert cache.stats()['misses'] == 20
+    assert cache.stats()['hits'] == 10
+
+
+def test_least_recently_used_is_evicted(counting, iris_xy):
+    X, _ = iris_xy
+    a, b, c = X[0:1], X[50:51], X[100:101]
+    cache = PredictionCache(capacity=2)
+
+    cache.predict_proba(counting, a)
+    cache.predict_proba(counting, b)
+    # a passa a ser o mais recente; c descarta b
+    cache.predict_proba(counting, a)
+    cache.predict_proba(counting, c)
+
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    rows = counting.rows
+    cache.predict_proba(counting, a)
+    assert counting.rows == rows
+    cache.predict_proba(counting, b)
+    assert counting.rows == rows + 1
+
+
+def test_invalidate_and_version_change_empty_the_cache(counting, iris_xy):
+    X, _ = iris_xy
+    cache = PredictionCache(capacity=100)
+
+    cache.predict_proba(counting, X[:5], version='v1')
+    cache.invalidate()
+    assert len(cache) == 0
+    cache.predict_proba(counting, X[:5], version='v1')
+    cache.predict_proba(counting, X[:5], version='v2')
+
+    assert counting.rows == 15
+    assert cache.invalidations == 2
+
+
+def test_rejects_non_positive_capacity():
+    with pytest.raises(ValueError):
+        PredictionCache(capacity=0)
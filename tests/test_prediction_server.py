@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from model_registry import ModelRegistry
+from prediction_server import MicroBatcher, ServerStats, parse_measurements
+
+SETOSA = [5.1, 3.5, 1.4, 0.2]
+VIRGINICA = [6.5, 3.0, 5.5, 2.0]
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), -float('inf'), 1e39, 'Infinity'])
+def test_parse_rejects_non_finite_measurements(value):
+    with pytest.raises(ValueError):
+        parse_measurements({'measurements': [5.1, 3.5, 1.4, value]}, 4)
+
+
+def test_parse_accepts_single_and_batch():
+    assert parse_measurements({'measurements': SETOSA}, 4) == ([SETOSA], True)
+    assert parse_measurements({'measurements': [SETOSA, VIRGINICA]}, 4) == ([SETOSA, VIRGINICA], False)
+
+
+def test_bad_request_does_not_fail_its_batch(shallow_model, bundle_file):
+    registry = ModelRegistry(bundle_file(shallow_model))
+    registry.load()
+
+    async def run():
+        batcher = MicroBatcher(registry, ServerStats(), max_batch_size=8, max_wait_ms=200)
+        batcher.start()
+        try:
+            # Infinito passa direto pelo batcher (sem parse_measurements) e faz o modelo falhar
+            return await asyncio.gather(
+                batcher.predict(SETOSA),
+                batcher.predict([float('inf'), 3.0, 5.5, 2.0]),
+                batcher.predict(VIRGINICA),
+                return_exceptions=True,
+            ), batcher.stats
+        finally:
+            await batcher.stop()
+
+    (setosa, bad, virginica), stats = asyncio.run(run())
+
+    assert stats.batches_total == 1
+    assert isinstance(bad, ValueError)
+    assert setosa['species'] == 'Setosa'
+    assert virginica['species'] == 'Virginica'
+    assert setosa['model_version'] == registry.active()['version']
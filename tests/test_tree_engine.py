@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import tree_engine
+
+
+def test_predictions_match_sklearn(model, probe_X):
+    tree = tree_engine.compile_model(model)
+
+    np.testing.assert_array_equal(tree_engine.predict_batch(tree, probe_X), model.predict(probe_X))
+    np.testing.assert_array_equal(tree_engine.predict_proba_batch(tree, probe_X), model.predict_proba(probe_X))
+
+
+def test_apply_matches_sklearn(tree_model, probe_X):
+    tree = tree_engine.compile_model(tree_model)
+
+    np.testing.assert_array_equal(tree_engine.apply_batch(tree, probe_X), tree_model.apply(probe_X))
+
+
+def test_small_blocks_give_same_result(tree_model, probe_X):
+    tree = tree_engine.compile_model(tree_model)
+
+    np.testing.assert_array_equal(tree_engine.predict_batch(tree, probe_X, block_size=7),
+                                  tree_model.predict(probe_X))
+
+
+def test_single_sample_is_reshaped(tree_model, iris_xy):
+    X, _ = iris_xy
+    tree = tree_engine.compile_model(tree_model)
+
+    assert tree_engine.predict_batch(tree, X[0]).tolist() == tree_model.predict(X[:1]).tolist()
+
+
+def test_rejects_wrong_shape_and_infinity(tree_model):
+    tree = tree_engine.compile_model(tree_model)
+
+    with pytest.raises(ValueError):
+        tree_engine.predict_batch(tree, np.zeros((2, 3)))
+    with pytest.raises(ValueError):
+        tree_engine.predict_batch(tree, np.array([[np.inf, 1.0, 1.0, 1.0]]))
+
+
+def test_compiled_model_behaves_like_the_model(model, probe_X):
+    compiled = tree_engine.CompiledModel(model)
+
+    np.testing.assert_array_equal(compiled.classes_, model.classes_)
+    assert compiled.n_features_in_ == model.n_features_in_
+    np.testing.assert_array_equal(compiled.predict(probe_X), model.predict(probe_X))
+    np.testing.assert_array_equal(compiled.predict_proba(probe_X), model.predict_proba(probe_X))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+import pytest
+
+import verbosity
+
+
+@pytest.mark.parametrize('value, level', [
+    ('quiet', verbosity.QUIET), ('Summary', verbosity.SUMMARY), (' detailed ', verbosity.DETAILED),
+    ('0', verbosity.QUIET), (1, verbosity.SUMMARY), ('2', verbosity.DETAILED),
+])
+def test_parse_level_accepts_names_and_numbers(value, level):
+    assert verbosity.parse_level(value) == level
+
+
+@pytest.mark.parametrize('value', ['3', '-1', 'verbose', '1.5', ''])
+def test_parse_level_rejects_unknown_values(value):
+    with pytest.raises(ValueError):
+        verbosity.parse_level(value)
+
+
+@pytest.mark.parametrize('value, level', [('summary', 1), ('0', 0), ('7', 2), ('barulhento', 2)])
+def test_environment_variable_never_breaks_import(value, level):
+    result = subprocess.run(
+        [sys.executable, '-c', 'import verbosity; print(verbosity.get_level())'],
+        cwd=os.path.dirname(verbosity.__file__), env=dict(os.environ, IRIS_VERBOSITY=value),
+        capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == str(level)
+    assert ('AVISO' in result.stderr) == (value in ('7', 'barulhento'))
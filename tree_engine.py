@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de inferencia em lote para o Decision Tree treinado
+
+Converte a arvore do scikit-learn em arrays NumPy planos (feature, threshold,
+filho esquerdo, filho direito, valor da folha) e percorre todas as amostras de
+um lote ao mesmo tempo, nivel por nivel, sem o custo de validacao do sklearn
+a cada chamada.
+
+Varias arvores (um ensemble) podem ser compiladas juntas com compile_forest:
+os nos de todas ficam nos mesmos arrays e cada nivel e percorrido para todas
+as amostras e todas as arvores de uma vez.
+"""
+
+import pickle
+import time
+
+import numpy as np
+import sklearn
+
+# Ate o scikit-learn 1.3 a arvore guarda contagens e o predict_proba normaliza;
+# a partir do 1.4 ela ja guarda as fracoes e o predict_proba as devolve direto.
+_SKLEARN_VERSION = tuple(int(p) for p in sklearn.__version__.split('.')[:2])
+_NORMALIZE_PROBA = _SKLEARN_VERSION < (1, 4)
+
+# Numero de amostras percorridas por vez (mantem os arrays de trabalho no cache)
+DEFAULT_BLOCK_SIZE = 65536
+
+
+def compile_tree(modelo):
+    """
+    Converte um DecisionTreeClassifier treinado em arrays planos
+
+    As folhas apontam para si mesmas, de modo que todas as amostras podem
+    descer `max_depth` niveis sem testar se ja chegaram a uma folha.
+
+    Args:
+        modelo: DecisionTreeClassifier treinado
+
+    Returns:
+        Dicionario com os arrays da arvore compilada
+    """
+    tree = modelo.tree_
+    if tree.n_outputs != 1:
+        raise ValueError("Apenas arvores com uma unica saida sao suportadas.")
+
+    n_nodes = tree.node_count
+    nodes = np.arange(n_nodes, dtype=np.intp)
+    is_leaf = tree.children_left == -1
+
+    left = np.where(is_leaf, nodes, tree.children_left).astype(np.intp)
+    right = np.where(is_leaf, nodes, tree.children_right).astype(np.intp)
+    feature = np.where(is_leaf, 0, tree.feature).astype(np.intp)
+    threshold = np.where(is_leaf, np.inf, tree.threshold).astype(np.float64)
+
+    if hasattr(tree, 'missing_go_to_left'):
+        missing_left = np.asarray(tree.missing_go_to_left).astype(bool)
+    else:
+        missing_left = np.zeros(n_nodes, dtype=bool)
+    missing_left[is_leaf] = True
+
+    # Profundidade media dos caminhos, ponderada pelas amostras de treino de cada folha
+    depth = np.zeros(n_nodes, dtype=np.intp)
+    for node in range(n_nodes):
+        if not is_leaf[node]:
+            depth[tree.children_left[node]] = depth[node] + 1
+            depth[tree.children_right[node]] = depth[node] + 1
+    leaf_samples = tree.weighted_n_node_samples[is_leaf]
+    expected_depth = float(np.average(depth[is_leaf], weights=leaf_samples)) if leaf_samples.sum() else 0.0
+
+    n_classes = int(modelo.n_classes_)
+    value = np.ascontiguousarray(tree.value[:, 0, :n_classes], dtype=np.float64)
+    if _NORMALIZE_PROBA:
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value = value / normalizer
+
+    return {
+        'feature': feature,
+        'threshold': threshold,
+        'left': left,
+        'right': right,
+        'missing_left': missing_left,
+        'value': value,
+        # O predict do sklearn faz o argmax sobre os valores brutos da folha
+        'leaf_class': np.argmax(tree.value[:, 0, :n_classes], axis=1),
+        'classes': np.asarray(modelo.classes_),
+        'n_features': int(modelo.n_features_in_),
+        'max_depth': int(tree.max_depth),
+        'expected_depth': expected_depth,
+        'roots': np.zeros(1, dtype=np.intp),
+    }
+
+
+def compile_forest(estimators, classes):
+    """
+    Compila varias arvores em um unico conjunto de arrays
+
+    Os nos de cada arvore sao concatenados (com os indices dos filhos
+    deslocados) e 'roots' guarda o no raiz de cada arvore.
+
+    Args:
+        estimators: Lista de DecisionTreeClassifier treinados com as mesmas classes
+        classes: Rotulos das classes do ensemble, na ordem das colunas de valor
+
+    Returns:
+        Dicionario com os arrays do ensemble compilado
+    """
+    trees = [compile_tree(estimator) for estimator in estimators]
+    n_classes = len(classes)
+    if any(t['value'].shape[1] != n_classes for t in trees):
+        raise ValueError("Todas as arvores do ensemble precisam ter as mesmas classes.")
+
+    sizes = np.array([len(t['feature']) for t in trees], dtype=np.intp)
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+
+    return {
+        'feature': np.concatenate([t['feature'] for t in trees]),
+        'threshold': np.concatenate([t['threshold'] for t in trees]),
+        'left': np.concatenate([t['left'] + o for t, o in zip(trees, offsets)]),
+        'right': np.concatenate([t['right'] + o for t, o in zip(trees, offsets)]),
+        'missing_left': np.concatenate([t['missing_left'] for t in trees]),
+        'value': np.concatenate([t['value'] for t in trees]),
+        'leaf_class': np.concatenate([t['leaf_class'] for t in trees]),
+        'classes': np.asarray(classes),
+        'n_features': trees[0]['n_features'],
+        'max_depth': max(t['max_depth'] for t in trees),
+        'expected_depth': float(np.mean([t['expected_depth'] for t in trees])),
+        'roots': offsets,
+    }
+
+
+def compile_model(modelo):
+    """
+    Compila um DecisionTreeClassifier ou um ensemble de arvores (com estimators_)
+
+    Args:
+        modelo: Modelo treinado
+
+    Returns:
+        Dicionario com os arrays do modelo compilado
+    """
+    if hasattr(modelo, 'estimators_'):
+        return compile_forest(modelo.estimators_, modelo.classes_)
+    return compile_tree(modelo)
+
+
+def load_compiled_tree(filename='trained_model.pkl'):
+    """
+    Carrega o modelo treinado do arquivo pickle e compila a arvore
+
+    Args:
+        filename: Arquivo gerado por model_trainer.save_model
+
+    Returns:
+        Dicionario com os arrays da arvore compilada
+    """
+    with open(filename, 'rb') as f:
+        dados_modelo = pickle.load(f)
+    return compile_model(dados_modelo['modelo'])
+
+
+def _validate_batch(tree, X):
+    """
+    Converte o lote para float32, como o sklearn faz antes de percorrer a arvore
+    """
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.ndim != 2 or X.shape[1] != tree['n_features']:
+        raise ValueError(
+            f"Esperado um array (n_amostras, {tree['n_features']}), recebido {X.shape}."
+        )
+    if np.isinf(X).any():
+        raise ValueError("O lote contem valores infinitos.")
+    return np.ascontiguousarray(X)
+
+
+def _traverse(tree, X, block_size):
+    """
+    Desce todas as amostras por todas as arvores, nivel por nivel
+
+    Em arvores rasas todos os pares (amostra, arvore) descem `max_depth`
+    niveis (as folhas apontam para si mesmas). Quando a profundidade maxima e
+    mais de 3x a profundidade media dos caminhos, os pares que ja chegaram
+    a uma folha saem do lote a cada nivel, para o custo acompanhar a
+    profundidade real de cada caminho.
+
+    Returns:
+        Array (n_amostras, n_arvores) com o indice da folha de cada par
+    """
+    X = _validate_batch(tree, X)
+    n_samples, n_features = X.shape
+
+    feature = tree['feature']
+    threshold = tree['threshold']
+    missing_left = tree['missing_left']
+    max_depth = tree['max_depth']
+    roots = tree['roots']
+    n_trees = len(roots)
+    # Filhos intercalados: children[2 * no] e o esquerdo, children[2 * no + 1] o direito
+    children = np.stack([tree['left'], tree['right']], axis=1).ravel()
+    compact = max_depth > 3 * tree.get('expected_depth', max_depth)
+    is_leaf = tree['left'] == np.arange(len(feature))
+    has_nan = np.isnan(X).any()
+
+    X_flat = X.ravel()
+    leaves = np.empty(n_samples * n_trees, dtype=np.intp)
+    # O bloco conta pares (amostra, arvore)
+    rows_per_block = max(1, block_size // n_trees)
+
+    for start in range(0, n_samples, rows_per_block):
+        stop = min(start + rows_per_block, n_samples)
+        pos = np.arange(start * n_trees, stop * n_trees, dtype=np.intp)
+        row = np.repeat(np.arange(start, stop, dtype=np.intp) * n_features, n_trees)
+        node = np.tile(roots, stop - start)
+
+        for _ in range(max_depth):
+            x = X_flat[row + feature[node]]
+            go_right = x > threshold[node]
+            if has_nan:
+                go_right |= np.isnan(x) & ~missing_left[node]
+            node = children[2 * node + go_right]
+
+            if compact:
+                done = is_leaf[node]
+                n_done = np.count_nonzero(done)
+                if n_done == len(node):
+                    break
+                if n_done:
+                    leaves[pos[done]] = node[done]
+                    keep = ~done
+                    pos, row, node = pos[keep], row[keep], node[keep]
+
+        leaves[pos] = node
+
+    return leaves.reshape(n_samples, n_trees)
+
+
+def apply_batch(tree, X, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Encontra a folha de cada amostra do lote (equivalente a modelo.apply)
+
+    Args:
+        tree: Arvore compilada por compile_tree ou compile_forest
+        X: Array (n_amostras, n_features)
+        block_size: Numero de amostras percorridas por vez
+
+    Returns:
+        Array com o indice da folha de cada amostra; para um ensemble,
+        array (n_amostras, n_arvores)
+    """
+    leaves = _traverse(tree, X, block_size)
+    return leaves[:, 0] if len(tree['roots']) == 1 else leaves
+
+
+def predict_proba_batch(tree, X, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Calcula as probabilidades de cada classe (igual a modelo.predict_proba)
+
+    Para um ensemble, e a media das probabilidades das arvores, somadas na
+    ordem das arvores como no RandomForestClassifier.
+
+    Args:
+        tree: Arvore compilada por compile_tree ou compile_forest
+        X: Array (n_amostras, n_features)
+        block_size: Numero de amostras percorridas por vez
+
+    Returns:
+        Array (n_amostras, n_classes) na ordem de tree['classes']
+    """
+    leaves = _traverse(tree, X, block_size)
+    value = tree['value']
+    if leaves.shape[1] == 1:
+        return value.take(leaves[:, 0], axis=0)
+
+    proba = value.take(leaves[:, 0], axis=0)
+    for t in range(1, leaves.shape[1]):
+        proba += value.take(leaves[:, t], axis=0)
+    proba /= leaves.shape[1]
+    return proba
+
+
+def predict_batch(tree, X, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Preve a classe de cada amostra do lote (igual a modelo.predict)
+
+    Args:
+        tree: Arvore compilada por compile_tree ou compile_forest
+        X: Array (n_amostras, n_features)
+        block_size: Numero de amostras percorridas por vez
+
+    Returns:
+        Array com a classe prevista de cada amostra
+    """
+    if len(tree['roots']) > 1:
+        proba = predict_proba_batch(tree, X, block_size)
+        return tree['classes'].take(np.argmax(proba, axis=1))
+
+    leaves = apply_batch(tree, X, block_size)
+    return tree['classes'].take(tree['leaf_class'].take(leaves))
+
+
+class CompiledModel:
+    """
+    Modelo compilado com a interface de previsao do sklearn
+
+    Tem predict, predict_proba, classes_ e n_features_in_, entao substitui o
+    modelo no PredictionCache e no model_registry. Aceita arrays sem os nomes
+    das features (sem o aviso do sklearn a cada lote) e preve igual ao modelo.
+
+    Args:
+        modelo: DecisionTreeClassifier ou TreeEnsembleClassifier treinado
+    """
+
+    def __init__(self, modelo):
+        self.tree = compile_model(modelo)
+        self.classes_ = self.tree['classes']
+        self.n_features_in_ = self.tree['n_features']
+
+    def predict_proba(self, X):
+        return predict_proba_batch(self.tree, X)
+
+    def predict(self, X):
+        return predict_batch(self.tree, X)
+
+
+def verify_against_model(tree, modelo, X):
+    """
+    Confere se o motor compilado reproduz exatamente o modelo do sklearn
+
+    Args:
+        tree: Arvore compilada por compile_tree
+        modelo: DecisionTreeClassifier de origem
+        X: Amostras usadas na comparacao
+
+    Returns:
+        True se predict e predict_proba coincidem bit a bit
+    """
+    X = np.asarray(X)
+    same_pred = np.array_equal(predict_batch(tree, X), modelo.predict(X))
+    same_proba = np.array_equal(
+        predict_proba_batch(tree, X).view(np.uint64),
+        modelo.predict_proba(X).view(np.uint64)
+    )
+    return same_pred and same_proba
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("MOTOR DE INFERENCIA EM LOTE")
+    print("=" * 70)
+
+    with open('trained_model.pkl', 'rb') as f:
+        modelo = pickle.load(f)['modelo']
+    tree = compile_model(modelo)
+
+    print(f"\nArvore compilada: {len(tree['feature'])} nos, profundidade {tree['max_depth']}")
+
+    # Lote sintetico cobrindo a faixa das medidas do Iris
+    rng = np.random.default_rng(42)
+    X = rng.uniform(0.0, 8.0, size=(1_000_000, tree['n_features']))
+
+    print("\nConferindo contra modelo.predict e modelo.predict_proba...")
+    identico = verify_against_model(tree, modelo, X[:100_000])
+    print(f"Resultados identicos: {'SIM' if identico else 'NAO'}")
+
+    inicio = time.perf_counter()
+    predict_batch(tree, X)
+    duracao = time.perf_counter() - inicio
+    print(f"\npredict_batch: {len(X)} amostras em {duracao:.3f}s "
+          f"({len(X) / duracao / 1e6:.2f} milhoes de amostras/s)")
+
+    inicio = time.perf_counter()
+    modelo.predict(X)
+    duracao_sklearn = time.perf_counter() - inicio
+    print(f"modelo.predict: {len(X)} amostras em {duracao_sklearn:.3f}s")
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Ensemble de arvores de decisao treinado em paralelo
+
+Dois modos:
+    'bagging': arvores completas, cada uma em uma amostra bootstrap do treino
+    'random':  arvores com cortes aleatorios (extremely randomized trees)
+               e sorteio de features em cada no, usando todo o treino
+
+As arvores sao treinadas em threads (o scikit-learn libera o GIL durante a
+construcao da arvore) e cada uma recebe sua propria semente, derivada de
+random_state, entao o resultado nao depende da ordem de execucao. A inferencia
+usa o ensemble compilado do tree_engine, que percorre todas as arvores de uma
+vez em vez de chamar cada arvore em um laco Python.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.tree import DecisionTreeClassifier
+
+import tree_engine
+from hyperparameter_search import available_cores
+
+ENSEMBLE_METHODS = ('bagging', 'random')
+
+
+def _fit_tree(method, X, y_encoded, seed_sequence, max_features):
+    """
+    Treina uma arvore do ensemble com a semente propria dela
+    """
+    rng = np.random.default_rng(seed_sequence)
+    tree_seed = int(rng.integers(np.iinfo(np.int32).max))
+
+    if method == 'bagging':
+        # Bootstrap como pesos: todas as classes continuam presentes em y,
+        # entao todas as arvores tem as mesmas colunas de probabilidade
+        n_samples = len(y_encoded)
+        sample_weight = np.bincount(rng.integers(0, n_samples, n_samples), minlength=n_samples)
+        tree = DecisionTreeClassifier(max_features=max_features, random_state=tree_seed)
+        tree.fit(X, y_encoded, sample_weight=sample_weight.astype(np.float64))
+    else:
+        tree = DecisionTreeClassifier(splitter='random', max_features=max_features,
+                                      random_state=tree_seed)
+        tree.fit(X, y_encoded)
+
+    return tree
+
+
+class TreeEnsembleClassifier(ClassifierMixin, BaseEstimator):
+    """
+    Ensemble de Decision Trees (bagging ou arvores aleatorias) com inferencia vetorizada
+
+    Args:
+        method: 'bagging' ou 'random'
+        n_estimators: Numero de arvores
+        max_features: Features sorteadas por no (None = todas; padrao 'sqrt' em 'random')
+        n_jobs: Threads de treino (None usa todos os nucleos disponiveis)
+        random_state: Semente de onde saem as sementes de cada arvore
+    """
+
+    def __init__(self, method='bagging', n_estimators=100, max_features='auto',
+                 n_jobs=None, random_state=42):
+        self.method = method
+        self.n_estimators = n_estimators
+        self.max_features = max_features
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        if self.method not in ENSEMBLE_METHODS:
+            raise ValueError(f"method deve ser um de {ENSEMBLE_METHODS}, recebido '{self.method}'.")
+
+        if hasattr(X, 'columns'):
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        self.n_features_in_ = X.shape[1]
+
+        self.classes_, y_encoded = np.unique(np.asarray(y), return_inverse=True)
+        self.n_classes_ = len(self.classes_)
+
+        max_features = self.max_features
+        if max_features == 'auto':
+            max_features = None if self.method == 'bagging' else 'sqrt'
+
+        n_jobs = self.n_jobs or available_cores()
+        seeds = np.random.SeedSequence(self.random_state).spawn(self.n_estimators)
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            self.estimators_ = list(pool.map(
+                lambda seed: _fit_tree(self.method, X, y_encoded, seed, max_features), seeds
+            ))
+
+        self._compiled = None
+        return self
+
+    @property
+    def compiled_(self):
+        """
+        Ensemble compilado pelo tree_engine (montado na primeira previsao)
+        """
+        if getattr(self, '_compiled', None) is None:
+            self._compiled = tree_engine.compile_forest(self.estimators_, self.classes_)
+        return self._compiled
+
+    def predict_proba(self, X):
+        return tree_engine.predict_proba_batch(self.compiled_, X)
+
+    def predict(self, X):
+        return tree_engine.predict_batch(self.compiled_, X)
+
+    def __getstate__(self):
+        # Os arrays compilados sao refeitos ao carregar, sem duplicar as arvores no pickle
+        state = super().__getstate__()
+        state['_compiled'] = None
+        return state
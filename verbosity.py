@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Nivel de detalhe da saida do pipeline e resumo estruturado da execucao
+
+Tres niveis:
+    QUIET     nada alem de erros (e do resumo em JSON, se pedido)
+    SUMMARY   titulos das etapas e numeros principais, todos baratos de obter
+    DETAILED  diagnosticos completos: head, info, describe, distribuicoes de
+              classes, relatorios (padrao, igual a saida historica)
+
+Os diagnosticos caros so devem ser calculados dentro de
+`if verbosity.enabled(verbosity.DETAILED):`, para que uma execucao em nivel
+mais baixo nao pague por eles. Os numeros principais de cada etapa sao
+guardados com record() em um resumo que pode ser exportado em JSON,
+independente do nivel.
+
+O nivel inicial vem da variavel de ambiente IRIS_VERBOSITY (0, 1 ou 2, ou
+quiet, summary ou detailed); um valor invalido e ignorado com um aviso.
+"""
+
+import json
+import os
+import sys
+
+QUIET = 0
+SUMMARY = 1
+DETAILED = 2
+LEVEL_NAMES = {'quiet': QUIET, 'summary': SUMMARY, 'detailed': DETAILED}
+
+
+def parse_level(value):
+    """
+    Converte um nivel dado por nome (quiet, summary, detailed) ou numero (0 a 2)
+
+    Raises:
+        ValueError: Se o valor nao corresponde a nenhum nivel
+    """
+    text = str(value).strip().lower()
+    if text in LEVEL_NAMES:
+        return LEVEL_NAMES[text]
+    try:
+        level = int(text)
+    except ValueError:
+        level = None
+    if level not in (QUIET, SUMMARY, DETAILED):
+        names = ', '.join(LEVEL_NAMES)
+        raise ValueError(f"Nivel de detalhe invalido: {value!r} (use 0 a 2 ou {names})")
+    return level
+
+
+def _level_from_environment():
+    """
+    Nivel da variavel IRIS_VERBOSITY; valores invalidos viram DETAILED com um aviso
+    """
+    value = os.environ.get('IRIS_VERBOSITY')
+    if value is None or not value.strip():
+        return DETAILED
+    try:
+        return parse_level(value)
+    except ValueError as e:
+        print(f"AVISO: IRIS_VERBOSITY ignorada. {e}", file=sys.stderr)
+        return DETAILED
+
+
+_state = {
+    'level': _level_from_environment(),
+    'summary': {},
+}
+
+
+def set_level(level):
+    """
+    Define o nivel de detalhe (QUIET, SUMMARY ou DETAILED)
+    """
+    if level not in (QUIET, SUMMARY, DETAILED):
+        raise ValueError(f"Nivel de detalhe invalido: {level}")
+    _state['level'] = level
+
+
+def get_level():
+    return _state['level']
+
+
+def enabled(level):
+    """
+    Indica se a saida (e o calculo) de um nivel deve acontecer
+    """
+    return _state['level'] >= level
+
+
+def say(*args, level=SUMMARY, **kwargs):
+    """
+    print() condicionado ao nivel de detalhe
+    """
+    if _state['level'] >= level:
+        print(*args, **kwargs)
+
+
+def section(title, level=SUMMARY, newline=True):
+    """
+    Titulo de etapa entre linhas de '=' (no formato historico do pipeline)
+    """
+    if _state['level'] >= level:
+        print(("\n" if newline else "") + "=" * 70)
+        print(title)
+        print("=" * 70)
+
+
+def record(key, value):
+    """
+    Guarda um numero principal da execucao no resumo estruturado
+    """
+    _state['summary'][key] = value
+
+
+def summary():
+    """
+    Copia do resumo estruturado da execucao
+    """
+    return dict(_state['summary'])
+
+
+def summary_json():
+    return json.dumps(_state['summary'], ensure_ascii=False, default=str, sort_keys=True)
+
+
+def reset_summary():
+    _state['summary'].clear()